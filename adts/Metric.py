@@ -71,6 +71,10 @@ class Metric:
         else:
             self._aim = MAXIMIZE
 
+    def aim(self):
+        """Returns IN_RANGE, MAXIMIZE, or MINIMIZE -- direction of metric"""
+        return self._aim
+
     def worstCaseValue(self, metric_values):
         """
         @description
@@ -53,6 +53,39 @@ class ProblemSetup:
                                    for an in self.analyses
                                    for metric in an.metrics]
 
+        self._precomputeOffsets()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        #a ProblemSetup pickled before the offsets existed
+        if not hasattr(self, '_result_index'):
+            self._precomputeOffsets()
+
+    def _precomputeOffsets(self):
+        """Computes the offsets for storing sim results in one flat list,
+        and sim requests in one bitmask (see Ind).  Every (metric, env
+        point) combo gets one result index; every (analysis, env point)
+        combo gets one bit."""
+        self._result_index = {}           #(metric_name, env_ID) : index
+        self._metric_result_indices = {}  #metric_name : list of index
+        self._request_bit = {}            #(analysis_ID, env_ID) : bit
+        num_results, num_requests = 0, 0
+        for analysis in self.analyses:
+            for env_point in analysis.env_points:
+                self._request_bit[(analysis.ID, env_point.ID)] = \
+                    1L << num_requests
+                num_requests += 1
+            for metric in analysis.metrics:
+                self._metric_result_indices[metric.name] = []
+                for env_point in analysis.env_points:
+                    self._result_index[(metric.name, env_point.ID)] = \
+                        num_results
+                    self._metric_result_indices[metric.name].append(
+                        num_results)
+                    num_results += 1
+        self._num_sim_results = num_results
+        self._all_requests_mask = (1L << num_requests) - 1
+
     def functionAnalyses(self):
         """
         @description
@@ -85,6 +118,30 @@ class ProblemSetup:
         else:
             raise ValueError("No metric with name '%s' found" % metric_name)
 
+    def numSimResults(self):
+        """Returns the total number of (metric, env point) combos, i.e. the
+        length of the flat list that an Ind stores its sim results in"""
+        return self._num_sim_results
+
+    def simResultIndex(self, metric_name, env_point_ID):
+        """Returns the index into an Ind's flat sim results that
+        holds the value of 'metric_name' at 'env_point_ID'"""
+        return self._result_index[(metric_name, env_point_ID)]
+
+    def metricResultIndices(self, metric_name):
+        """Returns the list of indices into an Ind's flat sim results
+        that hold the values of 'metric_name', one per env point"""
+        return self._metric_result_indices[metric_name]
+
+    def simRequestBit(self, analysis_ID, env_point_ID):
+        """Returns the bit of an Ind's sim requests bitmask that
+        tracks if a request at (analysis_ID, env_point_ID) has been made"""
+        return self._request_bit[(analysis_ID, env_point_ID)]
+
+    def allSimRequestsMask(self):
+        """Returns the sim requests bitmask of a fully-evaluated Ind"""
+        return self._all_requests_mask
+
     def numMetrics(self):
         """Returns total number of metrics"""
         return len(self.flattenedMetricNames())
@@ -1,3 +1,4 @@
+import copy
 import unittest
 
 from adts import *
@@ -34,6 +35,31 @@ class ProblemSetupTest(unittest.TestCase):
         self.assertEqual(ps.metric(an2.metric.name).name, an2.metric.name)
         self.assertRaises(ValueError, ps.metric, 'nonexistent_metric_name')
 
+        #offsets into an Ind's flat storage
+        self.assertEqual(ps.numSimResults(), 2)
+        e, e2 = an.env_points[0], an2.env_points[0]
+        self.assertEqual(sorted([ps.simResultIndex(an.metric.name, e.ID),
+                                 ps.simResultIndex(an2.metric.name, e2.ID)]),
+                         [0, 1])
+        self.assertEqual(ps.metricResultIndices(an2.metric.name),
+                         [ps.simResultIndex(an2.metric.name, e2.ID)])
+        bits = [ps.simRequestBit(an.ID, e.ID), ps.simRequestBit(an2.ID, e2.ID)]
+        self.assertEqual(sorted(bits), [1, 2])
+        self.assertEqual(ps.allSimRequestsMask(), bits[0] | bits[1])
+
+        #a ProblemSetup pickled before the offsets existed gets them
+        # when it's unpickled
+        state = dict(ps.__dict__)
+        for name in ['_result_index', '_metric_result_indices',
+                     '_request_bit', '_num_sim_results',
+                     '_all_requests_mask']:
+            del state[name]
+        old_ps = copy.copy(ps)
+        old_ps.__dict__.clear()
+        old_ps.__setstate__(state)
+        self.assertEqual(old_ps.numSimResults(), 2)
+        self.assertEqual(old_ps.allSimRequestsMask(), ps.allSimRequestsMask())
+
     def tearDown(self):
         pass
 
@@ -1,5 +1,6 @@
 #!/usr/bin/env python 
 
+import multiprocessing
 import os
 import sys
 
@@ -7,11 +8,17 @@ from adts import *
 from problems import ProblemFactory
 from engine.Pooler import *
 
+#box width of the pool's epsilon-grid, as a fraction of each objective's
+# threshold scale (see EpsilonArchive.metricScale()).  0.0 means prune
+# with a nondominated sort instead.
+DEFAULT_EPSILON = 0.01
+
 if __name__== '__main__':
 
     num_args = len(sys.argv)
-    if num_args not in [4,5]:
-        print 'Usage: aggregator PROBLEM_NUM DB_DIRS_FILE OUTPUT_DB_FILE [MAX_DB_SIZE]'
+    if num_args not in [4,5,6]:
+        print 'Usage: aggregator PROBLEM_NUM DB_DIRS_FILE OUTPUT_DB_FILE [MAX_DB_SIZE] [EPSILON]'
+        print ' EPSILON -- float -- box width of the pool, as a fraction of each objective\'s threshold scale (default %g; 0 = nondominated sort)' % DEFAULT_EPSILON
         print ProblemFactory().problemDescriptions()
         sys.exit(0)
         
@@ -20,17 +27,24 @@ if __name__== '__main__':
     pooled_db_file = sys.argv[3]
 
     pool_size=100000
+    epsilon = DEFAULT_EPSILON
     
     if num_args >= 5:
         pool_size = eval(sys.argv[4])
+    if num_args >= 6:
+        epsilon = float(sys.argv[5])
     
     import logging
     logging.basicConfig()
     logging.getLogger('pooler').setLevel(logging.DEBUG)
 
     ps = ProblemFactory().build(problem_choice)
+    #stream the dbs into the pool one at a time, so that memory does not
+    # grow with the number of dbs
     ss = PoolerStrategy(loop_wait_time=0, max_pool_size=pool_size,
-                        just_one_iter=True)
+                        just_one_iter=True,
+                        num_processes=multiprocessing.cpu_count(),
+                        streaming=True, epsilon=epsilon)
 
     pooler = Pooler(ps, ss, db_dirs_file, pooled_db_file)
     pooler.run()
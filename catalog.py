@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import os
+import sys
+
+from adts import *
+from problems import ProblemFactory
+
+from engine.ResultsCatalog import ResultsCatalog, buildResultsCatalog
+
+def parseSpec(spec):
+    """Turns a spec string like 'gain>=60' or 'power<=1e-3' into
+    (metric_name, min_value, max_value)"""
+    for op in ['>=', '<=']:
+        if op in spec:
+            metric_name, value = spec.split(op)
+            value = float(value)
+            if op == '>=': return (metric_name, value, None)
+            else:          return (metric_name, None, value)
+    raise ValueError("Spec '%s' needs a '>=' or '<='" % spec)
+
+if __name__== '__main__':
+    #set up logging
+    import logging
+    logging.basicConfig()
+    logging.getLogger('synth').setLevel(logging.INFO)
+
+    #set help message
+    help = """
+Usage: catalog build PROBLEM_NUM CATALOG_FILE DB_FILE [DB_FILE ...]
+   or: catalog query CATALOG_FILE [SPEC ...]
+   or: catalog netlist CATALOG_FILE IND_ID
+
+Specs-in, sized-topology-out queries on the results of finished runs.
+-'build' adds the inds of each DB_FILE to CATALOG_FILE (creating it if needed)
+-'query' prints the nondominated feasible inds that meet every SPEC, along
+   with their netlists
+-'netlist' prints the netlist(s) of the ind(s) with ID IND_ID
+
+Details:
+ PROBLEM_NUM -- int -- see below
+ CATALOG_FILE -- string -- e.g. ~/synth_results/catalog.sqlite
+ DB_FILE -- string -- e.g. ~/synth_results/run.db (newest generation), state_genXXXX.db or pooled_db.db
+ SPEC -- string -- METRIC_NAME>=VALUE or METRIC_NAME<=VALUE, e.g. gain>=60
+ IND_ID -- int -- eg 2212
+""" + ProblemFactory().problemDescriptions()
+
+    #got the right number of args?  If not, output help
+    num_args = len(sys.argv)
+    if num_args < 3 or sys.argv[1] not in ['build', 'query', 'netlist'] or \
+           (sys.argv[1] == 'build' and num_args < 5) or \
+           (sys.argv[1] == 'netlist' and num_args != 4):
+        print help
+        sys.exit(0)
+    mode = sys.argv[1]
+
+    #do the work
+    if mode == 'build':
+        problem_choice = eval(sys.argv[2])
+        catalog_file = sys.argv[3]
+        db_files = sys.argv[4:]
+        for db_file in db_files:
+            if not os.path.exists(db_file):
+                print "Cannot find file with name %s" % db_file
+                sys.exit(0)
+        ps = ProblemFactory().build(problem_choice)
+        catalog = buildResultsCatalog(ps, db_files, catalog_file)
+        print "Catalog %s now has %d inds, of %d topologies" % \
+              (catalog_file, catalog.numInds(), len(catalog.topologies()))
+        sys.exit(0)
+
+    catalog_file = sys.argv[2]
+    if not os.path.exists(catalog_file):
+        print "Cannot find file with name %s" % catalog_file
+        sys.exit(0)
+    catalog = ResultsCatalog(catalog_file)
+
+    if mode == 'query':
+        thresholds = {}
+        for spec in sys.argv[3:]:
+            metric_name, min_value, max_value = parseSpec(spec)
+            if not thresholds.has_key(metric_name):
+                thresholds[metric_name] = (None, None)
+            prev_min, prev_max = thresholds[metric_name]
+            if min_value is None: min_value = prev_min
+            if max_value is None: max_value = prev_max
+            thresholds[metric_name] = (min_value, max_value)
+        entries = catalog.query(thresholds)
+        print "Found %d nondominated inds that meet the specs" % len(entries)
+
+    else:
+        ind_ID = eval(sys.argv[3])
+        entries = catalog.lookup(ind_ID)
+        if not entries:
+            print "ind with ID=%d not found in catalog" % ind_ID
+            sys.exit(0)
+
+    for entry in entries:
+        print "\n* ================================================"
+        print "* Ind ID=%d from %s" % (entry.ID, entry.source)
+        print "* Topology: %s" % entry.topology
+        for metric_name in catalog.metricNames():
+            print "* %s = %s" % (metric_name,
+                                 entry.worst_case_metric_values[metric_name])
+        print entry.netlist
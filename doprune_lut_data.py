@@ -15,7 +15,7 @@ if __name__== '__main__':
 
     #set help message
     help = """
-Usage: doprune_lut_data INPUT_FILEBASE PRUNED_FILEBASE THR_ERROR MIN_NUM_FINAL_SAMPLES TARGET_VARIABLE_NAME
+Usage: doprune_lut_data INPUT_FILEBASE PRUNED_FILEBASE THR_ERROR MIN_NUM_FINAL_SAMPLES TARGET_VARIABLE_NAME [NUM_PROCESSES]
 
 Prunes a set of sample data that is often used in lookup tables (luts),
 according to the following algorithm:
@@ -32,11 +32,12 @@ Details about inputs:
  PRUNESTOP_ERROR -- float -- stop pruning run as soon as error of a pruned_sample gets above this threshold.  E.g. 1e-3 to 1e-6
  MIN_NUM_SAMPLES -- int -- stop pruning run if the new dataset hits this size
  TARGET_VARIABLE_NAME -- string -- the variable that is the target of the lookup table
+ NUM_PROCESSES -- int -- # processes that compute the LUT kernel sums.  Default 1.
 """
 
     #got the right number of args?  If not, output help
     num_args = len(sys.argv)
-    if num_args not in [6]:
+    if num_args not in [6, 7]:
         print help
         sys.exit(0)
 
@@ -46,6 +47,10 @@ Details about inputs:
     thr_error = float(sys.argv[3])
     min_num_samples = int(sys.argv[4])
     target_varname = sys.argv[5]
+    if num_args == 7:
+        num_processes = int(sys.argv[6])
+    else:
+        num_processes = 1
 
     #do the work
     # -get data
@@ -53,8 +58,9 @@ Details about inputs:
         hdrValFilesToTrainingData(input_filebase, target_varname)
 
     # -run pruner, save results
-    keep_I = LutDataPruner().prune(X, y, Xy, thr_error, min_num_samples,
-                                   pruned_filebase, all_varnames)
+    pruner = LutDataPruner(num_processes=num_processes)
+    keep_I = pruner.prune(X, y, Xy, thr_error, min_num_samples,
+                          pruned_filebase, all_varnames)
     
     #done!
     print "Done.  Output is in %s.hdr and %s.val" % \
@@ -0,0 +1,124 @@
+"""
+A CheckpointWriter saves SynthStates into a RunStore from a background
+thread, so that the search loop does not have to wait on the disk (unless
+the writer falls behind).
+"""
+
+import Queue
+import threading
+
+import logging
+log = logging.getLogger('synth')
+
+class CheckpointWriter:
+    """
+    @description
+      Takes snapshots of SynthStates and appends them to a RunStore
+      from a background thread.  Every so often, it also applies a
+      retention policy to the RunStore: keep the newest 'keep_last'
+      generations, plus every generation that is a multiple of 'keep_every'.
+
+    @attributes
+      run_store -- RunStore -- where checkpoints go
+      keep_last -- int or None -- keep this many newest generations.  None
+        means keep every generation (and never compact).
+      keep_every -- int or None -- also keep every generation that is a
+        multiple of this.  None means don't.
+      _queue -- Queue.Queue of SynthState snapshots.  It is bounded: if
+        the writer falls behind, write() waits for room, so that every
+        generation still gets saved.
+      _thread -- threading.Thread -- the background writer
+      _error -- None, or the exception that stopped the background writer.
+        It gets re-raised in the search's thread, on the next call.
+      _num_since_compact -- int -- checkpoints written since last compact
+    """
+
+    def __init__(self, run_store, max_queue_size, keep_last, keep_every):
+        """
+        @arguments
+          run_store -- see class description
+          max_queue_size -- int -- max # snapshots waiting to be written
+          keep_last -- see class description
+          keep_every -- ''
+
+        @return
+          CheckpointWriter object
+        """
+        assert max_queue_size > 0, max_queue_size
+        assert keep_last is None or keep_last > 0, keep_last
+        assert keep_every is None or keep_every > 0, keep_every
+        self.run_store = run_store
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+
+        self._queue = Queue.Queue(max_queue_size)
+        self._error = None
+        self._num_since_compact = 0
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def write(self, synth_state):
+        """
+        @description
+          Queues a snapshot of 'synth_state' for writing.  Only waits
+          if max_queue_size snapshots are still waiting to be written.
+
+        @arguments
+          synth_state -- SynthState
+
+        @return
+          <<none>>
+        """
+        self._raiseErrorIfAny()
+        snapshot = synth_state.snapshot()
+        if self._queue.full():
+            log.info('Checkpoint writer is behind; wait for it')
+        self._queue.put(snapshot)
+
+    def close(self):
+        """Waits until all queued checkpoints are written, then stops the
+        background writer and closes the run store"""
+        if self._thread.isAlive():
+            self._queue.put(None)
+            self._thread.join()
+        self.run_store.close()
+        self._raiseErrorIfAny()
+
+    def generationsToKeep(self, generations):
+        """Returns the subset of 'generations' (list of int) that the
+        retention policy keeps"""
+        generations = sorted(generations)
+        if self.keep_last is None:
+            return generations
+        keep = set(generations[-self.keep_last:])
+        if self.keep_every is not None:
+            keep.update([gen for gen in generations
+                         if gen % self.keep_every == 0])
+        return sorted(keep)
+
+    def _run(self):
+        """Main loop of the background writer"""
+        while True:
+            snapshot = self._queue.get()
+            if snapshot is None:
+                break
+            try:
+                self.run_store.appendGeneration(snapshot)
+                self._num_since_compact += 1
+                if self.keep_last is not None and \
+                       self._num_since_compact >= self.keep_last:
+                    generations = self.run_store.generations()
+                    keep = self.generationsToKeep(generations)
+                    if len(keep) < len(generations):
+                        self.run_store.compact(keep)
+                    self._num_since_compact = 0
+            except Exception, e:
+                log.error('Checkpoint writer failed: %s' % e)
+                self._error = e
+                break
+
+    def _raiseErrorIfAny(self):
+        if self._error is not None:
+            raise self._error
@@ -3,14 +3,19 @@ Utilities useful for different synthesis engines and components.
 """
 
 import cPickle as pickle
+import copy
+import os
 import random
+import struct
 import types
+import weakref
 
 import numpy
 
 from adts import *
 from util import mathutil
-from Ind import Ind
+from Ind import Ind, worstCaseMetricValueOfResults
+from ParetoArchive import ParetoArchive
 
 import logging
 log = logging.getLogger('synth')
@@ -212,10 +217,15 @@ def uniqueIndsByPerformance(inds):
     @return
       unique_inds -- list of Ind
     """
-    ind_strs = [ind.worstCaseMetricValuesStr()
-                for ind in inds]
-    keep_I = mathutil.uniqueStringIndices(ind_strs)
-    unique_inds = list(numpy.take(inds, keep_I))
+    #always keeps the first ind that has a given performance; O(N) overall
+    # because each ind's performanceKey() is cached and set lookups are O(1)
+    unique_inds = []
+    seen_perfs = set()
+    for ind in inds:
+        perf_key = ind.performanceKey()
+        if perf_key not in seen_perfs:
+            seen_perfs.add(perf_key)
+            unique_inds.append(ind)
     return unique_inds
 
 
@@ -238,6 +248,9 @@ class SynthState:
         for an in self.ps.analyses:
             self.num_evaluations_per_analysis[an.ID] = 0 
 
+        #the global front; built when first needed (see paretoArchive())
+        self._pareto_archive = None
+
     def totalNumEvaluations(self):
         return sum(self.num_evaluations_per_analysis.values())
 
@@ -254,14 +267,40 @@ class SynthState:
     def allInds(self):
         return self.R_per_age_layer.flattened()
 
+    def paretoArchive(self):
+        """Returns the ParetoArchive of this state: the nondominated inds
+        among all inds that the state has held.  The first call builds it
+        from the current inds; after that, whoever evaluates new inds
+        (or brings them in) should add them, e.g. SynthEngine.evalInd()."""
+        if getattr(self, '_pareto_archive', None) is None:
+            if self.ss is None: metric_weights = None
+            else:               metric_weights = self.ss.metric_weights
+            self._pareto_archive = ParetoArchive(self.ps, metric_weights)
+            self._pareto_archive.addInds(self.allInds())
+        return self._pareto_archive
+
+    def snapshot(self):
+        """Returns a SynthState that holds the same inds as self, but
+        that is not affected by further changes to self's age layers
+        or counters.  It's cheap: the inds themselves are not copied
+        (they do not change once they are in a state)."""
+        snapshot = SynthState(self.ps, self.ss,
+                              AgeLayeredPop([list(R)
+                                             for R in self.R_per_age_layer]))
+        snapshot.generation = self.generation
+        snapshot.tot_num_inds = self.tot_num_inds
+        snapshot.num_evaluations_per_analysis = \
+            dict(self.num_evaluations_per_analysis)
+        return snapshot
+
     def save(self, output_file):
         """
         @description
-          Pickles self to output_file
+          Saves self to output_file, as a RunStore that holds just this
+          generation.  (So readers can stream its inds or read just
+          their metrics; see iterInds() and loadIndSummaries().)
 
-          -dereference ps because we can't pickle instancemethod objects
-           (and it would be space-consuming if on every ind)
-          -also dereference S in inds because that is space-consuming too
+          The inds' ps and S do not get saved; see RunStore.
         
         @arguments
           output_file -- string
@@ -269,35 +308,50 @@ class SynthState:
         @return
           <<none>> but it has created a file of name 'output_file'
         """
+        log.info('Save current state to file: %s...' % output_file)
 
-        ps = self.ps
-        self.ps = None
-
-        #save info
-        Ss_per_age_layer = []
-        for R in self.R_per_age_layer:
-            Ss_per_age_layer.append( [ind.S for ind in R] )
+        #write to a temporary file first, then rename it into place, so that
+        # readers (e.g. engines reading the Pooler's output) never see a
+        # partially-written file
+        tmp_file = output_file + '.tmp'
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        run_store = RunStore(tmp_file)
+        run_store.appendGeneration(self)
+        run_store.close()
+        os.rename(tmp_file, output_file)
+
+class IndSummary:
+    """
+    @description
+      The ID and worst-case metric values of a stored Ind, for tools
+      that need to look at many inds but only load a few of them.
 
-        for R in self.R_per_age_layer:
-            for ind in R:
-                ind.S = None
-                ind._ps = None
-           
-        obj_to_save = self
+    @attributes
+      ID -- int
+      genetic_age -- int or None
+      worst_case_metric_values -- dict of metric_name : worst_case_metval
+      _loader -- function that returns the full Ind
+    """
+    def __init__(self, ID, genetic_age, worst_case_metric_values, loader):
+        self.ID = ID
+        self.genetic_age = genetic_age
+        self.worst_case_metric_values = worst_case_metric_values
+        self._loader = loader
 
-        log.info('Save current state to file: %s...' % output_file)
-        
-        pickle.dump(obj_to_save, open(output_file,'w'))
+    def worstCaseMetricValue(self, metric_name):
+        return self.worst_case_metric_values[metric_name]
 
-        #put the info back
-        self.ps = ps
-        for Ss, R in zip(Ss_per_age_layer, self.R_per_age_layer):
-            for S, ind in zip(Ss, R):
-                ind.S = S
-                ind._ps = self.ps
+    def performanceKey(self):
+        """Same as Ind.performanceKey(), so that e.g.
+        uniqueIndsByPerformance() works on summaries too"""
+        return mathutil.niceValuesKey(self.worst_case_metric_values)
 
+    def load(self):
+        """Returns the full Ind"""
+        return self._loader()
 
-def loadSynthState(db_file, ps):
+def loadSynthState(db_file, ps, generation=None):
     """
     @description
       Loads a synthesis state from 'db_file'. It can be from any
@@ -307,20 +361,617 @@ def loadSynthState(db_file, ps):
        we need to reinsert it
 
     @arguments
-      db_file -- string -- e.g. my_outfile_path/state_gen0026.db
+      db_file -- string -- e.g. my_outfile_path/run.db (a RunStore),
+        or my_outfile_path/state_gen0026.db or pooled_db.db (one pickled
+        SynthState)
+      ps -- ProblemSetup
+      generation -- int or None -- which generation to load from a
+        RunStore.  None means the newest one.
 
     @return
       synth_state -- SynthState object
     """
     assert isinstance(db_file, types.StringType), db_file.__class__
+    if isRunStoreFile(db_file):
+        return RunStore(db_file).loadSynthState(ps, generation)
+    
     num_tries = 0
     max_num_tries = 5 #magic number
     synth_state = pickle.load(open(db_file,'r'))            
+    if generation is not None and generation != synth_state.generation:
+        raise ValueError("db_file=%s only holds generation %d, not %d" %
+                         (db_file, synth_state.generation, generation))
     synth_state.ps = ps
     for R in synth_state.R_per_age_layer:
         for ind in R:
-            ind._ps = ps
+            ind.restorePS(ps)
     return synth_state
+
+def loadSynthStateHeader(db_file, ps, generation=None):
+    """
+    @description
+      Like loadSynthState, but the returned state has no inds (ie its
+      R_per_age_layer is empty).  For a RunStore, no inds get read in.
+
+    @arguments
+      <<same as loadSynthState>>
+
+    @return
+      synth_state -- SynthState object
+    """
+    if isRunStoreFile(db_file):
+        return RunStore(db_file).loadSynthStateHeader(ps, generation)
+    synth_state = loadSynthState(db_file, ps, generation)
+    synth_state.R_per_age_layer = AgeLayeredPop()
+    return synth_state
+
+def iterInds(db_file, ps, generation=None):
+    """
+    @description
+      Yields the inds of a synthesis state in 'db_file' one at a time.
+      For a RunStore, only one ind is in memory at a time.
+
+    @arguments
+      <<same as loadSynthState>>
+
+    @return
+      generator of Ind
+    """
+    if isRunStoreFile(db_file):
+        return RunStore(db_file).iterInds(ps, generation)
+    return iter(loadSynthState(db_file, ps, generation).allInds())
+
+def loadIndSummaries(db_file, ps, generation=None):
+    """
+    @description
+      Returns an IndSummary for each ind of a synthesis state in 'db_file'.
+      For a RunStore, genotypes don't get read in until IndSummary.load().
+
+    @arguments
+      <<same as loadSynthState>>
+
+    @return
+      summaries -- list of IndSummary
+    """
+    if isRunStoreFile(db_file):
+        return RunStore(db_file).indSummaries(ps, generation)
+    return [IndSummary(ind.ID, getattr(ind, 'genetic_age', None),
+                       ind.worstCaseMetricValues(), lambda ind=ind: ind)
+            for ind in loadSynthState(db_file, ps, generation).allInds()]
+
+def findInd(db_file, ps, ID, generation=None):
+    """
+    @description
+      Returns the ind with 'ID' from a synthesis state in 'db_file',
+      or None if it's not there.  For a RunStore, no other inds get read in.
+
+    @arguments
+      db_file, ps, generation -- see loadSynthState
+      ID -- int -- ind ID
+
+    @return
+      ind -- Ind or None
+    """
+    if isRunStoreFile(db_file):
+        return RunStore(db_file).findInd(ps, ID, generation)
+    for ind in loadSynthState(db_file, ps, generation).allInds():
+        if ind.ID == ID:
+            return ind
+    return None
+
+#first bytes of every RunStore file
+RUN_STORE_MAGIC = 'MOJITO_RUNSTORE_1\n'
+
+#every RunStore record starts with: record type, key, payload length
+_RUN_STORE_HEADER = struct.Struct('<cqI')
+
+#the payload of an ind record starts with the length of its 'head'
+_IND_HEAD_LENGTH = struct.Struct('<I')
+
+#db_file : (file ID, records, end_offset) of the last RunStore._scan() of
+# it, so that the next scan only has to hop over the records appended since
+_scan_cache = {}
+
+def _fileID(f):
+    """Returns (st_dev, st_ino) of open file 'f', which tells apart a file
+    from one that got renamed into its place"""
+    stat = os.fstat(f.fileno())
+    return (stat.st_dev, stat.st_ino)
+
+def isRunStoreFile(db_file):
+    """Returns True if 'db_file' exists and is a RunStore file"""
+    if not os.path.isfile(db_file):
+        return False
+    f = open(db_file, 'rb')
+    magic = f.read(len(RUN_STORE_MAGIC))
+    f.close()
+    return magic == RUN_STORE_MAGIC
+
+class RunStore:
+    """
+    @description
+      Append-only database of a whole synthesis run.  Each Ind is
+      written just once (the first time it is in a saved generation),
+      and each generation only adds a small record of which inds are in
+      which age layer.  So saving a generation costs O(# new inds) rather
+      than O(# inds in the state), yet any generation can be rebuilt,
+      e.g. to restart from or for the Pooler.
+
+    @attributes
+      db_file -- string -- absolute name of the file
+      _f -- file object used for appending (opened lazily)
+      _offset_per_genotype -- weakref.WeakKeyDictionary of genotype :
+        offset of the record of the Ind that has that genotype.  Keyed
+        on genotype rather than ind ID because inds get copied from
+        generation to generation (and copies share their genotype),
+        whereas IDs are only unique within one process.
+
+    @notes
+      File layout is RUN_STORE_MAGIC followed by records.  Each record
+      is a header (type char, key, payload length) then a binary pickle:
+        'i' record -- key is ind ID; payload is the length of a small
+          'head' pickle of (ID, sim results), the head, then the Ind
+          (without ps or S).  Metrics-only reads just read the head.
+        'g' record -- key is generation; payload is a dict with 'ss',
+          'tot_num_inds', 'num_evaluations_per_analysis', and 'layers'
+          which has one list of (ind record offset, genetic_age) per layer
+      A generation record is written after all of its inds, so a reader
+      never sees a generation that refers to partially-written data.  A
+      partially-written record at the end of the file (e.g. from a
+      crash) is ignored by readers, and cut off by the next writer.
+    """
+    def __init__(self, db_file):
+        """
+        @arguments
+          db_file -- string -- name of the file.  It is created if it
+            does not exist yet, and appended to otherwise.
+
+        @return
+          RunStore object
+        """
+        self.db_file = os.path.abspath(db_file)
+        self._f = None
+        self._offset_per_genotype = weakref.WeakKeyDictionary()
+
+    def appendGeneration(self, synth_state):
+        """
+        @description
+          Appends the inds of 'synth_state' that are not in the store yet,
+          then a record of the generation itself.
+
+        @arguments
+          synth_state -- SynthState
+
+        @return
+          <<none>> but appends to self.db_file
+        """
+        log.info('Append generation %d to run store: %s' %
+                 (synth_state.generation, self.db_file))
+        if self._f is None:
+            self._openForAppend()
+
+        self._f.seek(0, 2)
+        layers = []
+        num_new_inds = 0
+        for R in synth_state.R_per_age_layer:
+            layer = []
+            for ind in R:
+                offset = self._offset_per_genotype.get(ind.genotype)
+                if offset is None:
+                    offset = self._f.tell()
+                    self._writeIndRecord(ind)
+                    self._offset_per_genotype[ind.genotype] = offset
+                    num_new_inds += 1
+                layer.append((offset, getattr(ind, 'genetic_age', None)))
+            layers.append(layer)
+
+        gen_info = {'ss' : synth_state.ss,
+                    'tot_num_inds' : synth_state.tot_num_inds,
+                    'num_evaluations_per_analysis' :
+                    synth_state.num_evaluations_per_analysis,
+                    'layers' : layers}
+        self._writeRecord('g', synth_state.generation, gen_info)
+        self._f.flush()
+        log.info('Done append; %d new inds' % num_new_inds)
+
+    def generations(self):
+        """Returns a sorted list of the generations that can be loaded"""
+        f = open(self.db_file, 'rb')
+        records, end_offset = self._scan(f)
+        f.close()
+        return sorted(set([key for (rec_type, key, offset) in records
+                           if rec_type == 'g']))
+
+    def loadSynthState(self, ps, generation=None):
+        """
+        @description
+          Rebuilds the SynthState of 'generation'.  Only that generation's
+          inds get read in.
+
+        @arguments
+          ps -- ProblemSetup -- gets reattached to the state and its inds
+          generation -- int or None -- None means the newest generation
+
+        @return
+          synth_state -- SynthState object
+        """
+        f = open(self.db_file, 'rb')
+        try:
+            gen_key, gen_info = self._readGenInfo(f, generation)
+
+            #an ind may be in >1 layer (with a different genetic_age),
+            # so read each ind once but copy it for the extra occurrences
+            ind_per_offset = {}
+            R_per_age_layer = AgeLayeredPop()
+            for layer in gen_info['layers']:
+                R = []
+                for (ind_offset, genetic_age) in layer:
+                    if ind_per_offset.has_key(ind_offset):
+                        ind = copy.copy(ind_per_offset[ind_offset])
+                        if genetic_age is not None:
+                            ind.genetic_age = genetic_age
+                    else:
+                        ind = self._readInd(f, ind_offset, ps, genetic_age)
+                        ind_per_offset[ind_offset] = ind
+                    R.append(ind)
+                R_per_age_layer.append(R)
+        finally:
+            f.close()
+
+        return self._synthState(ps, gen_key, gen_info, R_per_age_layer)
+
+    def loadSynthStateHeader(self, ps, generation=None):
+        """Like loadSynthState, but the returned state has no inds"""
+        f = open(self.db_file, 'rb')
+        try:
+            gen_key, gen_info = self._readGenInfo(f, generation)
+        finally:
+            f.close()
+        return self._synthState(ps, gen_key, gen_info, AgeLayeredPop())
+
+    def iterInds(self, ps, generation=None):
+        """
+        @description
+          Yields the inds of 'generation' one at a time, so that the
+          whole population never has to be in memory.
+
+        @arguments
+          ps -- ProblemSetup -- gets reattached to each ind
+          generation -- int or None -- None means the newest generation
+
+        @return
+          generator of Ind
+        """
+        f = open(self.db_file, 'rb')
+        try:
+            gen_key, gen_info = self._readGenInfo(f, generation)
+            for layer in gen_info['layers']:
+                for (ind_offset, genetic_age) in layer:
+                    yield self._readInd(f, ind_offset, ps, genetic_age)
+        finally:
+            f.close()
+
+    def indSummaries(self, ps, generation=None):
+        """
+        @description
+          Returns the IDs and worst-case metric values of the inds of
+          'generation', without unpickling their genotypes.  Each
+          IndSummary can load() its full Ind later if it's needed.
+
+        @arguments
+          ps -- ProblemSetup
+          generation -- int or None -- None means the newest generation
+
+        @return
+          summaries -- list of IndSummary
+
+        @notes
+          Each IndSummary.load() reopens db_file.  If db_file has since
+          been replaced (e.g. by the Pooler), load() raises an IOError
+          rather than reading the new file at the old offset.
+        """
+        metric_names = ps.flattenedMetricNames()
+        f = open(self.db_file, 'rb')
+        try:
+            file_ID = _fileID(f)
+            gen_key, gen_info = self._readGenInfo(f, generation)
+            summaries = []
+            for layer in gen_info['layers']:
+                for (ind_offset, genetic_age) in layer:
+                    ID, sim_results = self._readIndHead(f, ind_offset)
+                    wc_metvals = {}
+                    for metric_name in metric_names:
+                        wc_metvals[metric_name] = \
+                            worstCaseMetricValueOfResults(ps, sim_results,
+                                                          metric_name)
+                    loader = lambda o=ind_offset, a=genetic_age: \
+                             self._loadIndOfFile(file_ID, ps, o, a)
+                    summaries.append(IndSummary(ID, genetic_age, wc_metvals,
+                                                loader))
+        finally:
+            f.close()
+        return summaries
+
+    def findInd(self, ps, ID, generation=None):
+        """
+        @description
+          Returns the ind with 'ID' in 'generation' (or None if it's not
+          there).  Only that ind gets unpickled: IDs are in the record
+          headers.
+        """
+        f = open(self.db_file, 'rb')
+        try:
+            gen_key, gen_info = self._readGenInfo(f, generation)
+            for layer in gen_info['layers']:
+                for (ind_offset, genetic_age) in layer:
+                    f.seek(ind_offset)
+                    rec_type, key, length = _RUN_STORE_HEADER.unpack(
+                        f.read(_RUN_STORE_HEADER.size))
+                    if key == ID:
+                        return self._readInd(f, ind_offset, ps, genetic_age)
+        finally:
+            f.close()
+        return None
+
+    def loadInd(self, ps, ind_offset, genetic_age=None):
+        """Returns the ind whose record is at 'ind_offset'"""
+        f = open(self.db_file, 'rb')
+        try:
+            return self._readInd(f, ind_offset, ps, genetic_age)
+        finally:
+            f.close()
+
+    def _loadIndOfFile(self, file_ID, ps, ind_offset, genetic_age):
+        """Like loadInd, but raises an IOError if db_file is no longer the
+        file with 'file_ID'"""
+        f = open(self.db_file, 'rb')
+        try:
+            if _fileID(f) != file_ID:
+                raise IOError("Run store %s got replaced" % self.db_file)
+            return self._readInd(f, ind_offset, ps, genetic_age)
+        finally:
+            f.close()
+
+    def compact(self, generations_to_keep):
+        """
+        @description
+          Rewrites the store so that it only has the generations in
+          'generations_to_keep', plus the inds that those refer to.
+          The new file is renamed into place, so readers never see a
+          partial file (and readers that still have the old file open
+          keep reading the old file).
+
+        @arguments
+          generations_to_keep -- list of int
+
+        @return
+          <<none>> but rewrites self.db_file
+        """
+        self.close()
+        generations_to_keep = set(generations_to_keep)
+        f = open(self.db_file, 'rb')
+        records, end_offset = self._scan(f)
+
+        #only keep the last record of each generation
+        gen_offset_per_gen = {}
+        for (rec_type, key, offset) in records:
+            if rec_type == 'g' and key in generations_to_keep:
+                gen_offset_per_gen[key] = offset
+        gen_info_per_offset = {}
+        for gen_offset in gen_offset_per_gen.values():
+            gen_info_per_offset[gen_offset] = self._readPayload(f, gen_offset)
+        kept_ind_offsets = set()
+        for gen_info in gen_info_per_offset.values():
+            for layer in gen_info['layers']:
+                kept_ind_offsets.update([ind_offset
+                                         for (ind_offset, age) in layer])
+
+        #copy kept records in order; ind records are copied without
+        # unpickling, and generation records get their offsets remapped
+        tmp_file = self.db_file + '.tmp'
+        out_f = open(tmp_file, 'wb')
+        out_f.write(RUN_STORE_MAGIC)
+        new_offset_per_old = {}
+        for (rec_type, key, offset) in records:
+            if rec_type == 'i' and offset in kept_ind_offsets:
+                f.seek(offset)
+                header = f.read(_RUN_STORE_HEADER.size)
+                length = _RUN_STORE_HEADER.unpack(header)[2]
+                new_offset_per_old[offset] = out_f.tell()
+                out_f.write(header)
+                out_f.write(f.read(length))
+            elif gen_info_per_offset.has_key(offset):
+                gen_info = gen_info_per_offset[offset]
+                gen_info['layers'] = [[(new_offset_per_old[ind_offset], age)
+                                       for (ind_offset, age) in layer]
+                                      for layer in gen_info['layers']]
+                data = pickle.dumps(gen_info, pickle.HIGHEST_PROTOCOL)
+                out_f.write(_RUN_STORE_HEADER.pack('g', key, len(data)))
+                out_f.write(data)
+        out_f.close()
+        f.close()
+        os.rename(tmp_file, self.db_file)
+
+        #inds whose records were dropped will get re-written if needed
+        for genotype, offset in self._offset_per_genotype.items():
+            if new_offset_per_old.has_key(offset):
+                self._offset_per_genotype[genotype] = \
+                    new_offset_per_old[offset]
+            else:
+                del self._offset_per_genotype[genotype]
+        log.info('Compacted run store %s down to %d generations and %d inds'%
+                 (self.db_file, len(gen_offset_per_gen), len(kept_ind_offsets)))
+
+    def close(self):
+        """Close the file handle used for appending (if open)"""
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def _openForAppend(self):
+        """Opens self._f, writing the magic header into a new file, and
+        cutting off any partially-written record of an existing file"""
+        if os.path.exists(self.db_file):
+            self._f = open(self.db_file, 'r+b')
+            records, end_offset = self._scan(self._f)
+            self._f.truncate(end_offset)
+        else:
+            self._f = open(self.db_file, 'w+b')
+            self._f.write(RUN_STORE_MAGIC)
+
+    def _writeRecord(self, rec_type, key, obj):
+        data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        self._f.write(_RUN_STORE_HEADER.pack(rec_type, key, len(data)))
+        self._f.write(data)
+
+    def _writeIndRecord(self, ind):
+        """An ind record's payload is the length of its 'head', the
+        head (ID and sim results, for metrics-only reads), then the ind"""
+        head = pickle.dumps((ind.ID, ind._sim_results),
+                            pickle.HIGHEST_PROTOCOL)
+        data = pickle.dumps(_storableInd(ind), pickle.HIGHEST_PROTOCOL)
+        self._f.write(_RUN_STORE_HEADER.pack(
+            'i', ind.ID, _IND_HEAD_LENGTH.size + len(head) + len(data)))
+        self._f.write(_IND_HEAD_LENGTH.pack(len(head)))
+        self._f.write(head)
+        self._f.write(data)
+
+    def _readPayload(self, f, offset):
+        f.seek(offset)
+        rec_type, key, length = _RUN_STORE_HEADER.unpack(
+            f.read(_RUN_STORE_HEADER.size))
+        return pickle.loads(f.read(length))
+
+    def _readIndHead(self, f, offset):
+        """Returns (ID, sim_results) of the ind record at 'offset'"""
+        f.seek(offset + _RUN_STORE_HEADER.size)
+        (head_length,) = _IND_HEAD_LENGTH.unpack(
+            f.read(_IND_HEAD_LENGTH.size))
+        return pickle.loads(f.read(head_length))
+
+    def _readInd(self, f, offset, ps, genetic_age):
+        """Returns the ind of the ind record at 'offset', with 'ps'
+        reattached and (if not None) 'genetic_age' set"""
+        f.seek(offset)
+        rec_type, key, length = _RUN_STORE_HEADER.unpack(
+            f.read(_RUN_STORE_HEADER.size))
+        (head_length,) = _IND_HEAD_LENGTH.unpack(
+            f.read(_IND_HEAD_LENGTH.size))
+        f.seek(head_length, 1)
+        ind = pickle.loads(
+            f.read(length - _IND_HEAD_LENGTH.size - head_length))
+        ind._ps = ps
+        if genetic_age is not None:
+            ind.genetic_age = genetic_age
+        return ind
+
+    def _readGenInfo(self, f, generation):
+        """Returns (generation, generation record's payload) for
+        'generation' (None means the newest one)"""
+        records, end_offset = self._scan(f)
+        gen_offset = None
+        for (rec_type, key, offset) in records:
+            if rec_type == 'g' and (generation is None or key == generation):
+                gen_offset, gen_key = offset, key
+        if gen_offset is None:
+            raise ValueError("Generation %s is not in run store %s" %
+                             (generation, self.db_file))
+        return gen_key, self._readPayload(f, gen_offset)
+
+    def _synthState(self, ps, generation, gen_info, R_per_age_layer):
+        """Returns a SynthState from the payload of a generation record"""
+        synth_state = SynthState(ps, gen_info['ss'], R_per_age_layer)
+        synth_state.generation = generation
+        synth_state.tot_num_inds = gen_info['tot_num_inds']
+        synth_state.num_evaluations_per_analysis = \
+            gen_info['num_evaluations_per_analysis']
+        return synth_state
+
+    def _scan(self, f):
+        """
+        @description
+          Hops from record header to record header (without unpickling).
+
+        @return
+          records -- list of (record type, key, offset) of complete records
+          end_offset -- int -- where the last complete record ends
+
+        @notes
+          The store is append-only, so if the file was scanned before
+          (and has not been replaced since), only the records after the
+          previous end_offset get hopped over.
+        """
+        f.seek(0)
+        if f.read(len(RUN_STORE_MAGIC)) != RUN_STORE_MAGIC:
+            raise ValueError("%s is not a run store" % self.db_file)
+        file_ID = _fileID(f)
+        file_size = os.fstat(f.fileno()).st_size
+        header_size = _RUN_STORE_HEADER.size
+        records = []
+        offset = len(RUN_STORE_MAGIC)
+
+        cached = _scan_cache.get(self.db_file)
+        if cached is not None:
+            (cached_file_ID, cached_records, cached_end_offset) = cached
+            if cached_file_ID == file_ID and cached_end_offset <= file_size \
+                   and self._endsWith(f, cached_records, cached_end_offset):
+                records = list(cached_records)
+                offset = cached_end_offset
+
+        while offset + header_size <= file_size:
+            f.seek(offset)
+            rec_type, key, length = _RUN_STORE_HEADER.unpack(
+                f.read(header_size))
+            next_offset = offset + header_size + length
+            if next_offset > file_size:
+                break
+            records.append((rec_type, key, offset))
+            offset = next_offset
+
+        _scan_cache[self.db_file] = (file_ID, records, offset)
+        return records, offset
+
+    def _endsWith(self, f, records, end_offset):
+        """Returns True if the last of 'records' is still in 'f', and ends
+        at 'end_offset' (which guards against a new file that got the
+        inode of a deleted one)"""
+        if not records:
+            return end_offset == len(RUN_STORE_MAGIC)
+        (rec_type, key, offset) = records[-1]
+        f.seek(offset)
+        header = f.read(_RUN_STORE_HEADER.size)
+        if len(header) < _RUN_STORE_HEADER.size:
+            return False
+        (found_rec_type, found_key, length) = _RUN_STORE_HEADER.unpack(header)
+        return (found_rec_type, found_key) == (rec_type, key) and \
+               offset + _RUN_STORE_HEADER.size + length == end_offset
+
+def _storableInd(ind):
+    """Returns a copy of 'ind' without its ps (which can't be pickled),
+    S (which is big, and gets recomputed anyway), or the caches that
+    get filled lazily (which may be changing in another thread)"""
+    storable_ind = copy.copy(ind)
+    storable_ind._ps = None
+    storable_ind.S = None
+    storable_ind._cached_wc_metvals = None
+    storable_ind._cached_constraint_violation = None
+    return storable_ind
+
+def pickleInds(inds):
+    """Returns a list with one pickled string per ind (without its ps),
+    e.g. to send the inds to another process"""
+    return [pickle.dumps(_storableInd(ind), pickle.HIGHEST_PROTOCOL)
+            for ind in inds]
+
+def unpickleInds(payloads, ps):
+    """Returns the inds of the output of pickleInds(), with 'ps'
+    reattached"""
+    inds = []
+    for payload in payloads:
+        ind = pickle.loads(payload)
+        ind._ps = ps
+        inds.append(ind)
+    return inds
             
 def minMaxMetrics(ps, all_inds):
     """
@@ -0,0 +1,324 @@
+"""
+An epsilon-grid archive: a bounded set of inds that keeps good spread
+along the front, and that gets updated one ind at a time (rather than by
+re-sorting the whole set whenever inds get added).
+"""
+
+import bisect
+import heapq
+import math
+
+from adts.Metric import MAXIMIZE, MINIMIZE, IN_RANGE
+
+import logging
+log = logging.getLogger('pooler')
+
+def metricScale(metric):
+    """
+    @description
+      Returns the natural scale of a metric, according to its thresholds:
+      the width of the allowed range for an in-range metric, otherwise
+      the magnitude of its (finite) threshold.  (1.0 if that is 0.0.)
+    """
+    if metric.aim() == IN_RANGE:
+        return float(metric.max_threshold - metric.min_threshold)
+    elif metric.aim() == MINIMIZE:
+        threshold = metric.max_threshold
+    else:
+        threshold = metric.min_threshold
+    if threshold == 0.0:
+        return 1.0
+    return abs(float(threshold))
+
+def thresholdEpsilons(ps, rel_epsilon):
+    """Returns dict of metric_name : epsilon, for each objective of 'ps'
+    (ie each metric with improve_past_feasible), where epsilon is
+    'rel_epsilon' times the metric's scale (see metricScale())"""
+    return dict([(metric.name, rel_epsilon * metricScale(metric))
+                 for metric in ps.flattenedMetrics()
+                 if metric.improve_past_feasible])
+
+def metricGoodness(metric, value):
+    """Returns 'value' of 'metric', oriented so that larger is better (for
+    an in-range metric: its margin to the nearest threshold)"""
+    if metric.aim() == MAXIMIZE:
+        return value
+    elif metric.aim() == MINIMIZE:
+        return -value
+    else:
+        return min(value - metric.min_threshold,
+                   metric.max_threshold - value)
+
+def objectiveGoodnesses(objectives, ind):
+    """Returns list of float -- per metric in 'objectives', the goodness
+    (see metricGoodness()) of the ind's worst-case metric value"""
+    return [metricGoodness(metric, ind.worstCaseMetricValue(metric.name))
+            for metric in objectives]
+
+def goodnessesDominate(goodnesses_a, goodnesses_b):
+    """Returns True if goodnesses_a is >= goodnesses_b everywhere, and >
+    somewhere (see objectiveGoodnesses())"""
+    found_better = False
+    for a_i, b_i in zip(goodnesses_a, goodnesses_b):
+        if a_i < b_i:
+            return False
+        elif a_i > b_i:
+            found_better = True
+    return found_better
+
+def scaledConstraintViolation(ps, ind, metric_weights=None):
+    """Returns the ind's total constraint violation, where each
+    metric's violation is scaled by the metric's scale (see metricScale())
+    and weighted like in Ind.constraintViolation().  Unlike the latter, it
+    does not depend on the range of metric values in a population."""
+    if ind.isBad():
+        return float('Inf')
+    if metric_weights is None: metric_weights = {}
+    violation = 0.0
+    for metric in ps.flattenedMetrics():
+        value = ind.worstCaseMetricValue(metric.name)
+        violation += metric_weights.get(metric.name, 1.0) * \
+                     metric.constraintViolation(value) / metricScale(metric)
+    return violation
+
+class EpsilonArchive:
+    """
+    @description
+      Holds at most 'max_size' inds.
+
+      Feasible inds live on a grid with a box width of epsilon per
+      objective.  Each box holds at most one ind (the one closest to
+      the box's best corner), and a box is only kept if no other box
+      dominates it.  When the archive is full, the box in the most
+      crowded spot along the front gets evicted (never the two extremes).
+
+      Infeasible inds only fill up whatever room the feasible inds
+      leave; of those, the ones with the smallest constraint violation
+      are kept.
+
+    @attributes
+      ps -- ProblemSetup
+      max_size -- int -- max number of inds
+      epsilons -- dict of objective metric_name : box width (in the
+        metric's units)
+      _objectives -- list of Metric -- the metrics with objectives
+      _ind_per_box -- dict of box : Ind -- where a box is a tuple of int,
+        one per objective, larger is better
+      _sorted_boxes -- list of box -- sorted, ie by first objective
+      _crowding_per_box -- dict of box : float
+      _crowding_heap -- list of (crowding, box) -- heap; an entry is stale
+        if the box's crowding has changed since (or the box is gone)
+      _infeasible_heap -- list of (-violation, seq, Ind) -- heap, so
+        that the most-violating ind is at the top
+      _infeasible_perf_keys -- set -- of the inds in _infeasible_heap
+      _seq -- int -- breaks ties in _infeasible_heap
+
+    @notes
+      With two objectives, the kept boxes form a staircase in
+      _sorted_boxes, so checking whether a box is dominated, and finding
+      the boxes that it dominates, are O(log n) binary searches.  With
+      more objectives, those checks look at each kept box.  Finding the
+      box to evict is O(log n) via _crowding_heap.  But _sorted_boxes is
+      a plain list, so each insert and each eviction is O(n) (a list
+      memmove, which is cheap in practice).
+    """
+
+    def __init__(self, ps, max_size, epsilons):
+        """
+        @arguments
+          ps, max_size, epsilons -- see class description.  'epsilons'
+            needs an entry for every objective, e.g. thresholdEpsilons(ps,
+            0.01).
+
+        @return
+          EpsilonArchive object
+        """
+        self.ps = ps
+        self.max_size = max_size
+        self.epsilons = epsilons
+        self._objectives = [metric for metric in ps.flattenedMetrics()
+                            if metric.improve_past_feasible]
+        if not self._objectives:
+            raise ValueError("An EpsilonArchive needs at least one objective")
+        for metric in self._objectives:
+            if not epsilons.get(metric.name, 0.0) > 0.0:
+                raise ValueError("Need an epsilon > 0 for objective '%s'" %
+                                 metric.name)
+
+        self._ind_per_box = {}
+        self._sorted_boxes = []
+        self._crowding_per_box = {}
+        self._crowding_heap = []
+        self._infeasible_heap = []
+        self._infeasible_perf_keys = set()
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._ind_per_box) + len(self._infeasible_heap)
+
+    def inds(self):
+        """Returns the feasible inds (in order of their first objective)
+        then the infeasible inds (in order of increasing violation)"""
+        inds = [self._ind_per_box[box] for box in self._sorted_boxes]
+        inds.extend([ind for (neg_violation, seq, ind)
+                     in sorted(self._infeasible_heap, reverse=True)])
+        return inds
+
+    def addInds(self, inds):
+        """Adds each of 'inds'; returns the number that got in"""
+        num_added = 0
+        for ind in inds:
+            if self.add(ind):
+                num_added += 1
+        return num_added
+
+    def add(self, ind):
+        """
+        @description
+          Adds 'ind', unless the archive already has something better.
+
+        @arguments
+          ind -- Ind
+
+        @return
+          added -- bool -- is 'ind' in the archive now?
+        """
+        if not ind.isFeasible():
+            return self._addInfeasible(ind)
+
+        goodnesses = objectiveGoodnesses(self._objectives, ind)
+        box = tuple([int(math.floor(goodness / self.epsilons[metric.name]))
+                     for goodness, metric in zip(goodnesses,
+                                                 self._objectives)])
+
+        #same box: keep the ind closest to the box's best corner
+        if self._ind_per_box.has_key(box):
+            prev_ind = self._ind_per_box[box]
+            if prev_ind.performanceKey() == ind.performanceKey():
+                return False
+            prev_goodnesses = objectiveGoodnesses(self._objectives, prev_ind)
+            if self._cornerDistance(goodnesses, box) < \
+                   self._cornerDistance(prev_goodnesses, box):
+                self._ind_per_box[box] = ind
+                return True
+            return False
+
+        if self._isBoxDominated(box):
+            return False
+        for dominated_box in self._boxesDominatedBy(box):
+            self._removeBox(dominated_box)
+        self._insertBox(box, ind)
+        self._shrink()
+        return self._ind_per_box.get(box) is ind
+
+    def _cornerDistance(self, goodnesses, box):
+        """Returns the distance from 'goodnesses' to the best corner of
+        'box', in units of epsilon"""
+        distance = 0.0
+        for goodness, box_i, metric in zip(goodnesses, box, self._objectives):
+            epsilon = self.epsilons[metric.name]
+            distance += ((box_i + 1) * epsilon - goodness) / epsilon
+        return distance
+
+    def _isBoxDominated(self, box):
+        """Returns True if some kept box dominates 'box' (which is not kept)"""
+        if len(box) == 2:
+            #the first kept box that is >= box on objective 0 is the one
+            # with the best objective 1 among all such boxes
+            i = bisect.bisect_left(self._sorted_boxes, box)
+            return i < len(self._sorted_boxes) and \
+                   self._sorted_boxes[i][1] >= box[1]
+        for other_box in self._sorted_boxes:
+            if _boxDominates(other_box, box):
+                return True
+        return False
+
+    def _boxesDominatedBy(self, box):
+        """Returns the kept boxes that 'box' dominates"""
+        if len(box) == 2:
+            #they are the tail of the kept boxes that are <= box on
+            # objective 0
+            j = bisect.bisect_left(self._sorted_boxes, box)
+            i = j
+            while i > 0 and self._sorted_boxes[i-1][1] <= box[1]:
+                i -= 1
+            return self._sorted_boxes[i:j]
+        return [other_box for other_box in self._sorted_boxes
+                if _boxDominates(box, other_box)]
+
+    def _insertBox(self, box, ind):
+        self._ind_per_box[box] = ind
+        i = bisect.bisect_left(self._sorted_boxes, box)
+        self._sorted_boxes.insert(i, box)
+        self._updateCrowding(i - 1, i, i + 1)
+
+    def _removeBox(self, box):
+        del self._ind_per_box[box]
+        del self._crowding_per_box[box]
+        i = bisect.bisect_left(self._sorted_boxes, box)
+        del self._sorted_boxes[i]
+        self._updateCrowding(i - 1, i)
+
+    def _updateCrowding(self, *indices):
+        """Recomputes the crowding of the kept boxes at 'indices': the sum
+        over objectives of the distance between the box's two neighbours
+        (Inf for the boxes at the ends)"""
+        boxes = self._sorted_boxes
+        for i in indices:
+            if not (0 <= i < len(boxes)): continue
+            box = boxes[i]
+            if i == 0 or i == len(boxes) - 1:
+                crowding = float('Inf')
+            else:
+                crowding = float(sum([abs(prev_i - next_i) for prev_i, next_i
+                                      in zip(boxes[i-1], boxes[i+1])]))
+            if self._crowding_per_box.get(box) != crowding:
+                self._crowding_per_box[box] = crowding
+                heapq.heappush(self._crowding_heap, (crowding, box))
+
+    def _shrink(self):
+        """Evicts inds until there are at most max_size: infeasible inds
+        first, then the most crowded feasible inds"""
+        while len(self) > self.max_size:
+            if self._infeasible_heap:
+                (neg_violation, seq, ind) = heapq.heappop(
+                    self._infeasible_heap)
+                self._infeasible_perf_keys.remove(ind.performanceKey())
+                continue
+            while True:
+                crowding, box = heapq.heappop(self._crowding_heap)
+                if self._crowding_per_box.get(box) == crowding:
+                    break
+            self._removeBox(box)
+
+        #don't let the heap fill up with stale entries
+        if len(self._crowding_heap) > 4 * len(self._sorted_boxes) + 16:
+            self._crowding_heap = [(crowding, box) for box, crowding
+                                   in self._crowding_per_box.items()]
+            heapq.heapify(self._crowding_heap)
+
+    def _addInfeasible(self, ind):
+        perf_key = ind.performanceKey()
+        if perf_key in self._infeasible_perf_keys:
+            return False
+        if len(self._ind_per_box) >= self.max_size:
+            return False
+        self._seq += 1
+        entry = (-scaledConstraintViolation(self.ps, ind), self._seq, ind)
+        if len(self) < self.max_size:
+            heapq.heappush(self._infeasible_heap, entry)
+        elif entry > self._infeasible_heap[0]:
+            (neg_violation, seq, worst_ind) = heapq.heapreplace(
+                self._infeasible_heap, entry)
+            self._infeasible_perf_keys.remove(worst_ind.performanceKey())
+        else:
+            return False
+        self._infeasible_perf_keys.add(perf_key)
+        return True
+
+def _boxDominates(box_a, box_b):
+    """Returns True if box_a >= box_b everywhere, and box_a != box_b"""
+    for a_i, b_i in zip(box_a, box_b):
+        if a_i < b_i:
+            return False
+    return box_a != box_b
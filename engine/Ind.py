@@ -1,85 +1,220 @@
 from adts import *
 from adts.Part import replaceAutoNodesWithXXX
 
+import numpy
 
 from util import mathutil
 from util.constants import BAD_METRIC_VALUE
+from WaveformStore import WaveformRef
 
 import logging
 
 log = logging.getLogger('synth')
 
+def _loadWaveforms(waveforms):
+    """Returns the 2d waveforms array, whether 'waveforms' is the array
+    itself or a WaveformRef to it.  Returns None if the ref's store is not
+    available anymore (e.g. its engine cleared its output dir)."""
+    if isinstance(waveforms, WaveformRef):
+        try:
+            return waveforms.load()
+        except IOError, e:
+            log.debug('Waveforms unavailable: %s' % e)
+            return None
+    return waveforms
+
+def _loadedWaveformsPerExt(waveforms_per_ext):
+    """Returns dict of extension_str : 2d_waveforms_array, for the
+    waveforms of 'waveforms_per_ext' that are available"""
+    loaded = {}
+    for ext, waveforms in waveforms_per_ext.items():
+        X = _loadWaveforms(waveforms)
+        if X is not None:
+            loaded[ext] = X
+    return loaded
+
+def worstCaseMetricValueOfResults(ps, sim_results, metric_name):
+    """Returns the worst-case value of 'metric_name' across env points,
+    given the flat sim results of an Ind (see Ind._sim_results).
+    Handles BAD_METRIC_VALUE too."""
+    metric_values = [sim_results[index]
+                     for index in ps.metricResultIndices(metric_name)]
+    if BAD_METRIC_VALUE in metric_values:
+        return BAD_METRIC_VALUE
+    else:
+        return ps.metric(metric_name).worstCaseValue(metric_values)
+
 class Genotype:
     #for now, tack on whatever is needed into this
     pass
 
-class Ind:
+class Ind(object):
     """
     @description
       An 'individual' in the search: a point in a search space, plus results
+
+      Inds are created by the hundreds of thousands in a run, and most
+      are thrown away right after evaluation.  So they are kept compact:
+      attributes live in __slots__, sim results live in one flat list,
+      and sim requests are tracked in one bitmask.  The offsets into
+      these come from the ProblemSetup.
       
     @attributes
       genotype -- -- defines the point in the search space that the Ind embodies
-      sim_requests_made -- dict of [analysis ID][env point ID] : bool --
-        for keeping track of if a simulation request has been made
-      sim_results -- dict of [metric_name][env point ID] : None/metric_value
-        -- for keeping track of completed simulations, and what the value was
-      sim_waveforms -- dict of [analysis ID][env point ID] : waveforms_per_ext
-        where waveforms_per_ext is either a dict of extension_str :
-        2d_waveforms_array, or None.
+      _sim_results -- list of None/metric_value, indexed by
+        ps.simResultIndex(metric_name, env point ID) -- for keeping track
+        of completed simulations, and what the value was
+      _sim_requests_mask -- int -- bit ps.simRequestBit(analysis ID,
+        env point ID) is set once a simulation request has been made there
+      _sim_waveforms -- None, or dict of (analysis ID, env point ID) :
+        waveforms_per_ext, where waveforms_per_ext is a dict of
+        extension_str : 2d_waveforms_array or WaveformRef.  Stays None if
+        no waveforms.  Engines move the arrays into a WaveformStore
+        (see moveWaveformsToStore()) so that only references are kept.
       _ps -- ProblemSetup object -- keep a reference to this in order
-        to conveniently compute worst-case metric values, etc
-        :TODO: tlm -- pickled individuals is larger than necessary because
-        we pickle ps with every individual.  If we wanted, to save space,we could
-        de-reference it before pickling, and re-reference after unpickling.  But
-        be careful, such functionality is very error-prone.
+        to conveniently compute worst-case metric values, etc.  It
+        is de-referenced when saving (see SynthState.save()).
 
       cached attributes; currently only stored if fullyEvaluated() == True:
       _cached_fully_evaluated -- will fullyEvaluated() return True?
-      _cached_wc_metvals -- dict of metric_name : worst_case_metval --
+      _cached_wc_metvals -- None, or dict of metric_name : worst_case_metval --
         to speed return of worstCaseMetricValue
       _cached_is_feasible -- bool
-      _cached_constraint_violation -- dict of (dataID : constraintViolation())
+      _cached_constraint_violation -- None, or dict of
+        (dataID : constraintViolation())
+      _cached_perf_key -- tuple -- to speed return of performanceKey()
+
+      attributes that are only set by nondominated sorting (see EngineUtils):
+      n, S, rank
            
     @notes
       -the sim_requests are keyed by analysis, whereas the results
        are keyed by metric.  This is for reasons of convenient access.
-    """ 
-    def __init__(self, genotype, ps):
+      -sim_requests_made, sim_results and sim_waveforms are available
+       as read-only nested-dict views, for reporting.
+    """
+    __slots__ = ('genotype', '_sim_results', '_sim_requests_mask',
+                 '_sim_waveforms', '_ps',
+                 '_cached_fully_evaluated', '_cached_wc_metvals',
+                 '_cached_is_feasible', '_cached_constraint_violation',
+                 '_cached_perf_key',
+                 'n', 'S', 'rank')
+    
+    def __init__(self, genotype=None, ps=None):
         """
         @arguments
             genotype -- see clas description
             ps -- ProblemSetup object -- used to initialize
-              self.sim_requests_made and self.sim_results
+              self._sim_requests_mask and self._sim_results
         
         @return
           ind -- Ind object
+
+        @notes
+          Only unpickling an Ind from before the slots-based storage calls
+          this without arguments; __setstate__ then fills it in.
         """
+        if genotype is None and ps is None:
+            return
         if not isinstance(ps, ProblemSetup): raise ValueError
         
         self.genotype = genotype
-        self.sim_requests_made = {} 
-        self.sim_results = {}
-        self.sim_waveforms = {}
-        for an in ps.analyses:
-            self.sim_requests_made[an.ID] = {}
-            self.sim_waveforms[an.ID] = {}
-            for env_point in an.env_points:
-                self.sim_requests_made[an.ID][env_point.ID] = False
-                self.sim_waveforms[an.ID][env_point.ID] = None
-
-            for metric in an.metrics:
-                self.sim_results[metric.name] = {}
-                for env_point in an.env_points:
-                    self.sim_results[metric.name][env_point.ID] = None
+        self._sim_results = [None] * ps.numSimResults()
+        self._sim_requests_mask = 0
+        self._sim_waveforms = None
 
         self._ps = ps
 
-        #cached attributes
+        #cached attributes (dicts get created only when needed)
         self._cached_fully_evaluated = False
-        self._cached_wc_metvals = {}
+        self._cached_wc_metvals = None
         self._cached_is_feasible = None
-        self._cached_constraint_violation = {} 
+        self._cached_constraint_violation = None
+        self._cached_perf_key = None
+
+    def __getstate__(self):
+        """Pickle the slot values as one compact tuple"""
+        return tuple([getattr(self, name, None)
+                      for name in self._allSlotNames()])
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            self._setLegacyState(state)
+            return
+        for name, value in zip(self._allSlotNames(), state):
+            setattr(self, name, value)
+
+    def _setLegacyState(self, state):
+        """
+        @description
+          Sets self from the attribute dict of an Ind that was pickled
+          before the slots-based storage (e.g. in a state_genXXXX.db or a
+          pooled db of an older run).
+
+          Its nested sim_requests_made / sim_results / sim_waveforms dicts
+          can only get flattened once the ps is known.  Such inds were
+          saved without their ps, so until restorePS() gets called the
+          nested dicts wait in _sim_results.
+        """
+        for name in self._allSlotNames():
+            setattr(self, name, None)
+        for name, value in state.items():
+            if name in self._allSlotNames():
+                setattr(self, name, value)
+        self._cached_fully_evaluated = bool(
+            state.get('_cached_fully_evaluated', False))
+        self._cached_wc_metvals = state.get('_cached_wc_metvals') or None
+        self._cached_constraint_violation = \
+            state.get('_cached_constraint_violation') or None
+        self._cached_perf_key = None
+        self._sim_requests_mask = 0
+        self._sim_waveforms = None
+        self._sim_results = {'sim_requests_made':
+                             state.get('sim_requests_made', {}),
+                             'sim_results': state.get('sim_results', {}),
+                             'sim_waveforms': state.get('sim_waveforms', {})}
+        if self._ps is not None:
+            self.restorePS(self._ps)
+
+    def restorePS(self, ps):
+        """
+        @description
+          Re-references 'ps' after unpickling (see SynthState.save()).
+          For an Ind pickled before the slots-based storage, this also
+          flattens its legacy nested dicts (see _setLegacyState()).
+        """
+        self._ps = ps
+        if not isinstance(self._sim_results, dict):
+            return
+        legacy = self._sim_results
+        self._sim_results = [None] * ps.numSimResults()
+        for metric_name, value_per_env in legacy['sim_results'].items():
+            for env_ID, value in value_per_env.items():
+                self._sim_results[ps.simResultIndex(metric_name, env_ID)] = \
+                    value
+        for an_ID, made_per_env in legacy['sim_requests_made'].items():
+            for env_ID, made in made_per_env.items():
+                if made:
+                    self._sim_requests_mask |= ps.simRequestBit(an_ID, env_ID)
+        for an_ID, waveforms_per_env in legacy['sim_waveforms'].items():
+            for env_ID, waveforms_per_ext in waveforms_per_env.items():
+                if waveforms_per_ext is not None:
+                    if self._sim_waveforms is None:
+                        self._sim_waveforms = {}
+                    self._sim_waveforms[(an_ID, env_ID)] = waveforms_per_ext
+
+    _slot_names_per_class = {} #class : list of slot names
+
+    def _allSlotNames(cls):
+        """Returns the slot names of this class and all its parent classes,
+        in a fixed order"""
+        if not Ind._slot_names_per_class.has_key(cls):
+            names = []
+            for klass in reversed(cls.__mro__):
+                names.extend(klass.__dict__.get('__slots__', ()))
+            Ind._slot_names_per_class[cls] = names
+        return Ind._slot_names_per_class[cls]
+    _allSlotNames = classmethod(_allSlotNames)
 
     #make Ind look like it has the attribute of 'ID'
     # -warning: will need to change this when we start changing structures too!
@@ -87,6 +222,36 @@ class Ind:
         return self.genotype.unscaled_opt_point.ID
     ID = property(_ID)
 
+    #read-only nested-dict views of the flat storage (for reporting)
+    def _simRequestsMadeView(self):
+        d = {}
+        for an in self._ps.analyses:
+            d[an.ID] = {}
+            for env_point in an.env_points:
+                d[an.ID][env_point.ID] = self.simRequestMade(an, env_point)
+        return d
+    sim_requests_made = property(_simRequestsMadeView)
+
+    def _simResultsView(self):
+        d = {}
+        for an in self._ps.analyses:
+            for metric in an.metrics:
+                d[metric.name] = {}
+                for env_point in an.env_points:
+                    index = self._ps.simResultIndex(metric.name, env_point.ID)
+                    d[metric.name][env_point.ID] = self._sim_results[index]
+        return d
+    sim_results = property(_simResultsView)
+
+    def _simWaveformsView(self):
+        d = {}
+        for an in self._ps.analyses:
+            d[an.ID] = {}
+            for env_point in an.env_points:
+                d[an.ID][env_point.ID] = self.simWaveforms(an, env_point)
+        return d
+    sim_waveforms = property(_simWaveformsView)
+
     def __str__(self):
         s = "Ind={"
         if self.fullyEvaluated():
@@ -113,16 +278,17 @@ class Ind:
           env_point -- EnvPoint object -- 
         
         @return
-          <<none>> but modifies self.sim_requests_made
+          <<none>> but modifies self._sim_requests_mask
     
         @notes
           Do not currently support rnd_points.
           Do not currently use EvalRequest objects.
         """
-        if self.sim_requests_made[analysis.ID][env_point.ID]:
+        bit = self._ps.simRequestBit(analysis.ID, env_point.ID)
+        if self._sim_requests_mask & bit:
             raise ValueError("have previously requested this eval;"
                              " can't do it again")
-        self.sim_requests_made[analysis.ID][env_point.ID] = True
+        self._sim_requests_mask |= bit
 
     def simRequestMade(self, analysis, env_point):
         """
@@ -141,7 +307,92 @@ class Ind:
           Do not currently support rnd_points.
           Do not currently use EvalRequest objects.
         """
-        return self.sim_requests_made[analysis.ID][env_point.ID]
+        bit = self._ps.simRequestBit(analysis.ID, env_point.ID)
+        return bool(self._sim_requests_mask & bit)
+
+    def simWaveforms(self, analysis, env_point):
+        """
+        @description
+          Returns the waveforms stored at (analysis, env_point), or None
+          if there are none.
+
+        @arguments
+          analysis -- Analysis object -- 
+          env_point -- EnvPoint object -- 
+
+        @return
+          waveforms_per_ext -- dict of extension_str : 2d_array_of_waveforms,
+            or None
+
+        @notes
+          Waveforms that were moved to a WaveformStore get loaded lazily,
+          as read-only memory-mapped arrays.  Waveforms whose store is not
+          available anymore are left out.
+        """
+        if self._sim_waveforms is None:
+            return None
+        waveforms_per_ext = self._sim_waveforms.get((analysis.ID,
+                                                     env_point.ID))
+        if waveforms_per_ext is None:
+            return None
+        return _loadedWaveformsPerExt(waveforms_per_ext) or None
+
+    def moveWaveformsToStore(self, waveform_store):
+        """
+        @description
+          Appends any waveforms of this ind that are not in
+          'waveform_store' yet to it, and from then on only keeps
+          references to them.  That includes waveforms in another run's
+          store, e.g. of a migrant, which get copied over.  Waveforms whose
+          store is not available anymore get dropped.
+
+        @arguments
+          waveform_store -- WaveformStore object
+
+        @return
+          <<none>> but modifies self._sim_waveforms
+        """
+        if self._sim_waveforms is None:
+            return
+        for (an_ID, env_ID), waveforms_per_ext in self._sim_waveforms.items():
+            local = dict([(ext, waveforms)
+                          for ext, waveforms in waveforms_per_ext.items()
+                          if isinstance(waveforms, WaveformRef) and
+                          waveform_store.holds(waveforms)])
+            if len(local) == len(waveforms_per_ext):
+                continue
+            other = _loadedWaveformsPerExt(
+                dict([(ext, waveforms)
+                      for ext, waveforms in waveforms_per_ext.items()
+                      if not local.has_key(ext)]))
+            if other:
+                local.update(waveform_store.append(self.ID, an_ID, env_ID,
+                                                   other))
+            self._setWaveformsPerExt((an_ID, env_ID), local)
+
+    def loadWaveformsIntoMemory(self):
+        """
+        @description
+          Replaces any waveform references by in-memory copies of the
+          arrays.  Use this before the WaveformStore's file goes away.
+        """
+        if self._sim_waveforms is None:
+            return
+        for key, waveforms_per_ext in self._sim_waveforms.items():
+            self._setWaveformsPerExt(key, dict(
+                [(ext, numpy.array(waveforms))
+                 for ext, waveforms in
+                 _loadedWaveformsPerExt(waveforms_per_ext).items()]))
+
+    def _setWaveformsPerExt(self, key, waveforms_per_ext):
+        """Sets the waveforms at key (analysis ID, env point ID); empty
+        'waveforms_per_ext' means none"""
+        if waveforms_per_ext:
+            self._sim_waveforms[key] = waveforms_per_ext
+        else:
+            del self._sim_waveforms[key]
+            if not self._sim_waveforms:
+                self._sim_waveforms = None
 
     def setSimResults(self, sim_results, analysis, env_point,
                       waveforms_per_ext=None):
@@ -165,22 +416,27 @@ class Ind:
         #validate
         if not self.simRequestMade(analysis, env_point):
             raise ValueError('Have to report the sim request before set results')
-        for metric_name in sim_results.keys():
-            if self.sim_results[metric_name][env_point.ID] is not None:
+        indices = [self._ps.simResultIndex(metric_name, env_point.ID)
+                   for metric_name in sim_results.keys()]
+        for metric_name, index in zip(sim_results.keys(), indices):
+            if self._sim_results[index] is not None:
                 raise ValueError('Already have sim_results at metric %s'
                                  ' and env pt ID %d'% (metric_name,env_point.ID))
-        if self.sim_waveforms[analysis.ID][env_point.ID] is not None:
+        if self.simWaveforms(analysis, env_point) is not None:
             raise ValueError('Already have sim_waveforms at analysis ID %d'
                              ' and env pt ID %d' % (analysis.ID, env_point.ID))
 
         #set results
         # -metric values
-        for metric_name, value in sim_results.items():
-            self.sim_results[metric_name][env_point.ID] = value
+        for index, value in zip(indices, sim_results.values()):
+            self._sim_results[index] = value
 
         # -waveforms
         if waveforms_per_ext is not None:
-            self.sim_waveforms[analysis.ID][env_point.ID] = waveforms_per_ext
+            if self._sim_waveforms is None:
+                self._sim_waveforms = {}
+            self._sim_waveforms[(analysis.ID, env_point.ID)] = \
+                waveforms_per_ext
 
     def forceFullyBad(self):
         """
@@ -189,13 +445,8 @@ class Ind:
           Therefore, by calling this, a subsequent call to fullyEvaluated()
           will return True.
         """
-        for anID in self.sim_requests_made.keys():
-            for env_point_ID in self.sim_requests_made[anID].keys():
-                self.sim_requests_made[anID][env_point_ID] = True
-
-        for metric_name in self.sim_results.keys():
-            for env_point_ID in self.sim_results.keys():
-                self.sim_results[metric_name][env_point_ID] = BAD_METRIC_VALUE
+        self._sim_requests_mask = self._ps.allSimRequestsMask()
+        self._sim_results = [BAD_METRIC_VALUE] * len(self._sim_results)
 
     def isBad(self):
         """
@@ -209,16 +460,14 @@ class Ind:
         @return
           is_bad -- bool
         """
-        for results_at_metric in self.sim_results.values():
-            if BAD_METRIC_VALUE in results_at_metric.values():
-                return True
-        return False
+        return BAD_METRIC_VALUE in self._sim_results
 
         
     def fullyEvaluated(self):
         """
         @description
-          Returns true if this ind has had sim_requests_made at all possible places.
+          Returns true if this ind has had sim requests made at all
+          possible places.
 
         @notes
           Note that the caching here is different than other caching.  The
@@ -226,19 +475,14 @@ class Ind:
           not when False.  That's fine, because we get to True quickly,
           and never revert.
         """
-        #backwards compatibility
-        if not hasattr(self, '_cached_fully_evaluated'):
-            self._cached_fully_evaluated = False
-
         #exploit cache?
         if self._cached_fully_evaluated:
             return True
         
         #main work
-        for requests_at_analysis in self.sim_requests_made.values():
-            if False in requests_at_analysis.values():
-                #(no need to update cached value, it's still False)
-                return False
+        if self._sim_requests_mask != self._ps.allSimRequestsMask():
+            #(no need to update cached value, it's still False)
+            return False
 
         #if we get here, then we can also change the cached value to True
         self._cached_fully_evaluated = True
@@ -257,19 +501,18 @@ class Ind:
            (note that BAD inds return True for fullyEvaluated())
         """
         #exploit cache?
-        if self._cached_wc_metvals.has_key(metric_name):
+        if self._cached_wc_metvals is not None and \
+               self._cached_wc_metvals.has_key(metric_name):
             return self._cached_wc_metvals[metric_name]
 
         #main case: do the computation
-        metric_values = self.sim_results[metric_name].values()
-        if BAD_METRIC_VALUE in metric_values:
-            wc_metval = BAD_METRIC_VALUE
-        else:
-            metric = self._ps.metric(metric_name)
-            wc_metval = metric.worstCaseValue(metric_values)
+        wc_metval = worstCaseMetricValueOfResults(self._ps, self._sim_results,
+                                                  metric_name)
 
         #cache
         if self.fullyEvaluated():
+            if self._cached_wc_metvals is None:
+                self._cached_wc_metvals = {}
             self._cached_wc_metvals[metric_name] = wc_metval
 
         #done!
@@ -279,11 +522,36 @@ class Ind:
         """Returns a string that prints out the metric values in a 'nice' way"""
         return mathutil.niceValuesStr(self.worstCaseMetricValues())
 
+    def performanceKey(self):
+        """
+        @description
+          Returns a hashable, quantized key of this ind's worst-case metric
+          values.  Two inds have the same key if and only if they have the
+          same worstCaseMetricValuesStr() (same '%g' rounding), but the key
+          can go into a set or dict so that uniqueness checks are O(1).
+
+        @notes
+          For safety and simplicity, only cache if fully evaluated.
+        """
+        #exploit cache?
+        if self._cached_perf_key is not None:
+            return self._cached_perf_key
+
+        #main work
+        perf_key = mathutil.niceValuesKey(self.worstCaseMetricValues())
+
+        #cache
+        if self.fullyEvaluated():
+            self._cached_perf_key = perf_key
+
+        #done
+        return perf_key
+
     def worstCaseMetricValues(self):
         """Returns dict of metric_name : worst_case_metric_value"""
         d = {}
-        for metric_name in self.sim_results.keys():
-            d[metric_name] = self.worstCaseMetricValue(metric_name)
+        for metric in self._ps.flattenedMetrics():
+            d[metric.name] = self.worstCaseMetricValue(metric.name)
         return d
 
     def constraintViolation(self, minmax_metrics, metric_weights=None,
@@ -317,13 +585,11 @@ class Ind:
           Caching here doesn't care if the ind is fully evaluated or not,
           because it changes anyway depending on dataID.
         """
-        #backwards compatibility
-        if not hasattr(self, '_cached_constraint_violation'):
-            self._cached_constraint_violation = {}
-        
         #exploit cache?
-        if dataID is not None and \
-               self._cached_constraint_violation.has_key(dataID):
+        if self._cached_constraint_violation is None:
+            self._cached_constraint_violation = {}
+        elif dataID is not None and \
+                 self._cached_constraint_violation.has_key(dataID):
             return self._cached_constraint_violation[dataID]
 
         #corner case
@@ -378,10 +644,6 @@ class Ind:
 
           Only caches if the ind has been fully evaluated (for safety)
         """
-        #backwards compatibility
-        if not hasattr(self, '_cached_is_feasible'):
-            self._cached_is_feasible = None
-        
         #exploit cache?
         if self._cached_is_feasible is not None:
             assert self.fullyEvaluated(), "should only cache if fully eval'd"
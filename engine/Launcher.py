@@ -0,0 +1,389 @@
+"""
+A 'Launcher' runs a whole parallel synthesis campaign on one machine:
+many SynthEngines plus the Pooler that migrates inds between them.
+"""
+
+import ctypes
+import ctypes.util
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+from EngineUtils import isRunStoreFile
+
+import logging
+log = logging.getLogger('launcher')
+
+#the directory that synth.py and pooler.py live in
+MOJITO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#cpu_set_t holds 1024 cpus (see 'man sched_setaffinity')
+_CPU_SETSIZE = 1024
+_NCPUBITS = 8 * ctypes.sizeof(ctypes.c_ulong)
+_CpuSet = ctypes.c_ulong * (_CPU_SETSIZE / _NCPUBITS)
+
+def _loadLibc():
+    """Returns libc (as a ctypes.CDLL) if it has sched_*affinity, or None"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.sched_getaffinity, libc.sched_setaffinity
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+def availableCpus():
+    """Returns sorted list of int -- the cpus that this process may run
+    on (all of them, if that can't be found out)"""
+    libc = _loadLibc()
+    if libc is not None:
+        cpu_set = _CpuSet()
+        if libc.sched_getaffinity(0, ctypes.sizeof(cpu_set),
+                                  ctypes.byref(cpu_set)) == 0:
+            cpus = [cpu for cpu in range(_CPU_SETSIZE)
+                    if cpu_set[cpu / _NCPUBITS] & (1L << (cpu % _NCPUBITS))]
+            if cpus:
+                return cpus
+    return range(multiprocessing.cpu_count())
+
+def setCpuAffinity(cpus):
+    """Restricts the calling process to 'cpus' (list of int).  Returns
+    True if that worked."""
+    libc = _loadLibc()
+    if libc is None:
+        return False
+    cpu_set = _CpuSet()
+    for cpu in cpus:
+        cpu_set[cpu / _NCPUBITS] |= (1L << (cpu % _NCPUBITS))
+    return libc.sched_setaffinity(0, ctypes.sizeof(cpu_set),
+                                  ctypes.byref(cpu_set)) == 0
+
+def newestStateFile(db_dir):
+    """Returns the file in 'db_dir' to restart a SynthEngine from: its
+    'run.db' if there is one, otherwise its newest 'state_genXXX.db'.
+    (Returns None if neither is found.)"""
+    if isRunStoreFile(os.path.join(db_dir, 'run.db')):
+        return os.path.join(db_dir, 'run.db')
+    if not os.path.isdir(db_dir):
+        return None
+    filenames = sorted([filename for filename in os.listdir(db_dir)
+                        if 'state_gen' in filename])
+    if not filenames:
+        return None
+    return os.path.join(db_dir, filenames[-1])
+
+class LauncherStrategy:
+    """
+    @description
+      Holds 'magic numbers' related to strategy of running Launcher
+
+    @attributes
+      num_engines -- int -- number of SynthEngines to run
+      pop_size -- int -- population size of each SynthEngine (ie
+        num_inds_per_age_layer)
+      pool_size -- int -- max num inds in the pooled DB
+      pin_cpus -- bool -- if True, pin each engine to its own cpu (round
+        robin over the available cpus).  The Pooler does not get pinned.
+      niceness -- int -- how much to renice the engines and the Pooler
+      health_check_interval -- float -- seconds between health checks
+      stall_time -- float -- if an engine has not saved a new state in
+        this many seconds, it is considered hung, and gets restarted.
+        None means 'never'.
+      max_restarts -- int -- max num times to restart each process
+        (after that, it is left dead)
+    """
+
+    def __init__(self, num_engines, pop_size, pool_size, pin_cpus=True,
+                 niceness=15, health_check_interval=30.0, stall_time=None,
+                 max_restarts=3):
+        self.num_engines = num_engines
+        self.pop_size = pop_size
+        self.pool_size = pool_size
+        self.pin_cpus = pin_cpus
+        self.niceness = niceness
+        self.health_check_interval = health_check_interval
+        self.stall_time = stall_time
+        self.max_restarts = max_restarts
+
+    def __str__(self):
+        s = "LauncherStrategy={"
+        s += ' num_engines=%d' % self.num_engines
+        s += '; pop_size=%d' % self.pop_size
+        s += '; pool_size=%d' % self.pool_size
+        s += '; pin_cpus=%s' % self.pin_cpus
+        s += '; niceness=%d' % self.niceness
+        s += '; health_check_interval=%g seconds' % self.health_check_interval
+        s += '; stall_time=%s seconds' % self.stall_time
+        s += '; max_restarts=%d' % self.max_restarts
+        s += " /LauncherStrategy}"
+        return s
+
+class _Child:
+    """
+    @description
+      Book-keeping for one launched process.
+
+    @attributes
+      name -- string -- e.g. 'engine_03' or 'pooler'
+      db_dir -- string or None -- output dir, for engines
+      cpus -- list of int or None -- cpus to pin to
+      process -- subprocess.Popen or None -- None if not running
+      num_restarts -- int
+      last_progress_time -- float -- when the process was started, or
+        when its db_dir last got a new state
+      last_signature -- tuple or None -- (filename, mtime, size) of its
+        newest state file, as of the last health check
+      done -- bool -- True if it exited cleanly, or gave up on restarting
+    """
+
+    def __init__(self, name, db_dir, cpus):
+        self.name = name
+        self.db_dir = db_dir
+        self.cpus = cpus
+        self.process = None
+        self.num_restarts = 0
+        self.last_progress_time = None
+        self.last_signature = None
+        self.done = False
+
+class Launcher:
+    """
+    @description
+      Runs 'num_engines' SynthEngines and one Pooler on this machine,
+      all wired to the same pooled db, and keeps them healthy.
+
+      Layout of output_dir:
+        engine_00/, engine_01/, ... -- the output dir of each engine
+        pool.dirs -- the db_dirs_file of the Pooler: lists the engine dirs
+        pooled.db -- the pooled db (the Pooler also serves migrants from
+          memory; see Migration.py)
+        logs/ -- stdout and stderr of each process
+
+      If output_dir already holds a campaign, then each engine restarts
+      from its newest state, and the Pooler from pooled.db.
+
+      Health checks: an engine that dies gets restarted from its newest
+      state (up to max_restarts times); an engine that exits cleanly
+      is done.  An engine that stalls (see stall_time) gets killed and
+      restarted.  The Pooler gets restarted whenever it exits (up to
+      max_restarts times too).  The campaign ends when all engines are
+      done.
+
+    @attributes
+      problem_choice -- int -- problem number, see ProblemFactory
+      ss -- LauncherStrategy
+      output_dir -- string -- ends with '/'
+      db_dirs_file -- string
+      pooled_db_file -- string
+      log_dir -- string
+      engines -- list of _Child
+      pooler -- _Child
+    """
+
+    def __init__(self, problem_choice, ss, output_dir):
+        """
+        @arguments
+          problem_choice, ss, output_dir -- see class description
+
+        @return
+          Launcher object
+        """
+        self.problem_choice = problem_choice
+        self.ss = ss
+        self.output_dir = os.path.abspath(output_dir) + '/'
+        self.db_dirs_file = self.output_dir + 'pool.dirs'
+        self.pooled_db_file = self.output_dir + 'pooled.db'
+        self.log_dir = self.output_dir + 'logs/'
+
+        if ss.pin_cpus:
+            cpus = availableCpus()
+        self.engines = []
+        for engine_i in range(ss.num_engines):
+            name = 'engine_%02d' % engine_i
+            if ss.pin_cpus:
+                engine_cpus = [cpus[engine_i % len(cpus)]]
+            else:
+                engine_cpus = None
+            self.engines.append(_Child(name, self.output_dir + name + '/',
+                                       engine_cpus))
+        self.pooler = _Child('pooler', None, None)
+
+    def run(self):
+        """
+        @description
+          Sets up output_dir, starts every process, then health-checks
+          them until all engines are done (or until interrupted).  On the
+          way out, stops whatever is still running.
+        """
+        log.info("Begin.")
+        log.info(str(self.ss))
+        log.info('output_dir=%s' % self.output_dir)
+
+        self.setUp()
+        try:
+            self.startAll()
+            while not self.allEnginesDone():
+                time.sleep(self.ss.health_check_interval)
+                self.checkHealth()
+        finally:
+            self.stopAll()
+        log.info('Done')
+
+    def setUp(self):
+        """Creates output_dir and its log dir, and writes db_dirs_file"""
+        for d in [self.output_dir, self.log_dir]:
+            if not os.path.exists(d):
+                os.mkdir(d)
+        f = open(self.db_dirs_file, 'w')
+        for engine in self.engines:
+            f.write(engine.db_dir + '\n')
+        f.close()
+
+    def startAll(self):
+        self._start(self.pooler)
+        for engine in self.engines:
+            self._start(engine)
+
+    def allEnginesDone(self):
+        return not [engine for engine in self.engines if not engine.done]
+
+    def checkHealth(self):
+        """
+        @description
+          Looks at each process: restarts the ones that died or stalled,
+          and marks engines that exited cleanly as done.
+
+        @return
+          num_restarted -- int
+        """
+        num_restarted = 0
+        now = time.time()
+        for child in self.engines + [self.pooler]:
+            if child.done or child.process is None:
+                continue
+
+            exit_code = child.process.poll()
+            if exit_code is None:
+                if self._isStalled(child, now):
+                    log.warning('%s made no progress for %g seconds; '
+                                'killing it' % (child.name, self.ss.stall_time))
+                    self._kill(child)
+                    exit_code = child.process.returncode
+                else:
+                    continue
+
+            elif exit_code == 0 and child is not self.pooler:
+                log.info('%s is done' % child.name)
+                child.done = True
+                child.process = None
+                continue
+
+            log.warning('%s exited with code %s' % (child.name, exit_code))
+            if child.num_restarts >= self.ss.max_restarts:
+                log.error('%s was restarted %d times already; giving up on it'
+                          % (child.name, child.num_restarts))
+                child.done = True
+                child.process = None
+                continue
+            child.num_restarts += 1
+            self._start(child)
+            num_restarted += 1
+
+        if num_restarted > 0:
+            log.info('Restarted %d processes' % num_restarted)
+        return num_restarted
+
+    def stopAll(self):
+        """Terminates every process that is still running"""
+        for child in self.engines + [self.pooler]:
+            if child.process is not None and child.process.poll() is None:
+                log.info('Stopping %s' % child.name)
+                self._kill(child)
+            child.process = None
+
+    def engineCommand(self, engine, restart_file):
+        """Returns list of string -- the command line to run 'engine' with"""
+        return [sys.executable, os.path.join(MOJITO_DIR, 'synth.py'),
+                str(self.problem_choice), str(self.ss.pop_size),
+                engine.db_dir, self.pooled_db_file, str(restart_file)]
+
+    def poolerCommand(self):
+        """Returns list of string -- the command line to run the Pooler with"""
+        return [sys.executable, os.path.join(MOJITO_DIR, 'pooler.py'),
+                str(self.problem_choice), self.db_dirs_file,
+                self.pooled_db_file, str(self.ss.pool_size)]
+
+    def _start(self, child):
+        if child is self.pooler:
+            command = self.poolerCommand()
+        else:
+            restart_file = newestStateFile(child.db_dir)
+            if restart_file is not None:
+                log.info('%s restarts from %s' % (child.name, restart_file))
+            command = self.engineCommand(child, restart_file)
+
+        log_file = open(self.log_dir + child.name + '.log', 'a')
+        niceness, cpus = self.ss.niceness, child.cpus
+        def preexec():
+            #runs in the child, just before it execs 'command'
+            os.setpgrp() #so that a Ctrl-C to the launcher is ours to handle
+            if niceness:
+                os.nice(niceness)
+            if cpus is not None:
+                setCpuAffinity(cpus)
+        try:
+            child.process = subprocess.Popen(command, stdout=log_file,
+                                             stderr=subprocess.STDOUT,
+                                             cwd=MOJITO_DIR,
+                                             preexec_fn=preexec,
+                                             close_fds=True)
+        finally:
+            log_file.close()
+        child.last_progress_time = time.time()
+        child.last_signature = self._stateSignature(child)
+        log.info('Started %s (pid %d%s)' %
+                 (child.name, child.process.pid,
+                  {True:'', False:', cpus %s' % cpus}[cpus is None]))
+
+    def _kill(self, child):
+        """Terminates 'child', and kills it if it doesn't stop within
+        a few seconds"""
+        process = child.process
+        try:
+            process.terminate()
+            end_time = time.time() + 5.0
+            while process.poll() is None and time.time() < end_time:
+                time.sleep(0.1)
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        except OSError:
+            pass #it was gone already
+
+    def _isStalled(self, child, now):
+        """Returns True if engine 'child' has not saved a new state for
+        longer than stall_time.  (Updates its progress book-keeping.)"""
+        if child is self.pooler or self.ss.stall_time is None:
+            return False
+        signature = self._stateSignature(child)
+        if signature != child.last_signature:
+            child.last_signature = signature
+            child.last_progress_time = now
+            return False
+        return now - child.last_progress_time > self.ss.stall_time
+
+    def _stateSignature(self, child):
+        """Returns (filename, mtime, size) of the newest state of engine
+        'child', or None"""
+        if child.db_dir is None:
+            return None
+        state_file = newestStateFile(child.db_dir)
+        if state_file is None:
+            return None
+        try:
+            stat = os.stat(state_file)
+        except OSError:
+            return None
+        return (state_file, stat.st_mtime, stat.st_size)
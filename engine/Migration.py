@@ -0,0 +1,304 @@
+"""
+Migration between SynthEngines via the Pooler, over a local socket.
+
+The Pooler runs a MigrationServer that holds its pool in memory, with
+each ind already pickled.  An engine's MigrationClient asks for N
+migrants and receives just those; it pushes its own nondominated front
+the same way.  So the cost of migration per generation does not depend
+on the pool size, and nobody has to read a file that the Pooler may be
+in the middle of writing.
+
+Requests are pickles, so only the user that runs the Pooler may talk to
+its server: the socket is in a private (0700) dir, and each connection
+has to know a random authkey.  The server puts the socket's name and the
+authkey in an 'info file' (0600) next to pooled_db_file, where the
+engines find them.
+"""
+
+import binascii
+import os
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import weakref
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from EngineUtils import pickleInds, unpickleInds
+
+import logging
+log = logging.getLogger('pooler')
+
+#exceptions that mean 'could not talk to the other side'
+_CONNECTION_ERRORS = (socket.error, EOFError, IOError, AuthenticationError)
+
+def migrationInfoFile(pooled_db_file):
+    """
+    @description
+      Returns the name of the file that tells where a Pooler with
+      'pooled_db_file' serves migrants (and with which authkey).
+      Engines that are given the same pooled_db_file thus find the
+      same server.
+
+    @notes
+      The socket itself lives in a private dir in the temp dir rather
+      than next to pooled_db_file, because socket names have a max
+      length, and because network filesystems often do not support
+      sockets.
+    """
+    return os.path.abspath(pooled_db_file) + '.migration'
+
+def readMigrationInfo(info_file):
+    """Returns (address, authkey) from 'info_file'.  Raises IOError if
+    it can't be read."""
+    f = open(info_file, 'r')
+    try:
+        lines = f.read().split()
+    finally:
+        f.close()
+    if len(lines) != 2:
+        raise IOError('Incomplete migration info file %s' % info_file)
+    try:
+        return lines[0], binascii.unhexlify(lines[1])
+    except TypeError:
+        raise IOError('Bad authkey in migration info file %s' % info_file)
+
+def _writeMigrationInfo(info_file, address, authkey):
+    """Writes 'address' and 'authkey' to 'info_file', which only the
+    current user can read.  The file gets renamed into place, so readers
+    never see a partial one."""
+    tmp_file = info_file + '.tmp'
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+    f = os.fdopen(fd, 'w')
+    try:
+        f.write('%s\n%s\n' % (address, binascii.hexlify(authkey)))
+    finally:
+        f.close()
+    os.rename(tmp_file, info_file)
+
+class MigrationServer:
+    """
+    @description
+      Serves the inds of a pool to MigrationClients, and collects the
+      inds that they push.  Requests get handled in background threads.
+
+    @attributes
+      info_file -- string -- where to tell clients the socket's name and
+        the authkey; see migrationInfoFile()
+      ps -- ProblemSetup -- to reattach to pushed inds
+      max_num_pushed -- int -- max number of pushed inds to hold until
+        popPushedInds() gets called (the oldest ones get dropped)
+      address -- string or None -- name of the socket, once started
+      _authkey -- string or None -- random; clients need it to connect
+      _socket_dir -- string or None -- private dir that holds the socket
+      _payloads -- list of string -- one pickled ind per pooled ind
+      _payload_per_genotype -- dict of Genotype : string -- so that an
+        ind which stays in the pool only gets pickled once
+      _pushed_payloads -- list of string -- pickled pushed inds
+      _pushed_ss -- SynthSolutionStrategy or None -- the ss of the most
+        recent push
+      _lock -- threading.Lock -- guards the above
+      _listener -- multiprocessing.connection.Listener or None
+    """
+
+    def __init__(self, info_file, ps, max_num_pushed=1000):
+        """
+        @arguments
+          info_file, ps, max_num_pushed -- see class description
+
+        @return
+          MigrationServer object
+        """
+        self.info_file = info_file
+        self.ps = ps
+        self.max_num_pushed = max_num_pushed
+        self.address = None
+        self._authkey = None
+        self._socket_dir = None
+
+        self._payloads = []
+        self._payload_per_genotype = weakref.WeakKeyDictionary()
+        self._pushed_payloads = []
+        self._pushed_ss = None
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def start(self):
+        """Starts serving.  Raises ValueError if another server is
+        already serving for self.info_file."""
+        if os.path.exists(self.info_file):
+            try:
+                address, authkey = readMigrationInfo(self.info_file)
+                Client(address, 'AF_UNIX', authkey).close()
+            except _CONNECTION_ERRORS:
+                #stale, from a server that died
+                os.remove(self.info_file)
+            else:
+                raise ValueError("A migration server is already running "
+                                 "for %s" % self.info_file)
+
+        #mkdtemp makes a dir that only the current user can enter; and
+        # bind under umask 077 so that the socket itself is private too
+        # from the start
+        self._socket_dir = tempfile.mkdtemp(prefix='mojito_migrants_')
+        self.address = os.path.join(self._socket_dir, 'sock')
+        self._authkey = os.urandom(32)
+        old_umask = os.umask(077)
+        try:
+            self._listener = Listener(self.address, 'AF_UNIX',
+                                      authkey=self._authkey)
+        finally:
+            os.umask(old_umask)
+        _writeMigrationInfo(self.info_file, self.address, self._authkey)
+
+        thread = threading.Thread(target=self._acceptLoop,
+                                  name='MigrationServer')
+        thread.setDaemon(True)
+        thread.start()
+        log.info('Serving migrants at %s' % self.address)
+
+    def setPool(self, inds):
+        """Sets the inds to serve"""
+        payloads = []
+        for ind in inds:
+            payload = self._payload_per_genotype.get(ind.genotype)
+            if payload is None:
+                [payload] = pickleInds([ind])
+                self._payload_per_genotype[ind.genotype] = payload
+            payloads.append(payload)
+        self._lock.acquire()
+        self._payloads = payloads
+        self._lock.release()
+
+    def popPushedInds(self):
+        """
+        @description
+          Returns (and forgets) the inds that clients have pushed since
+          the last call.
+
+        @return
+          inds -- list of Ind
+          ss -- SynthSolutionStrategy or None -- of the most recent push
+        """
+        self._lock.acquire()
+        payloads, self._pushed_payloads = self._pushed_payloads, []
+        ss = self._pushed_ss
+        self._lock.release()
+        return unpickleInds(payloads, self.ps), ss
+
+    def close(self):
+        if self._listener is not None:
+            listener, self._listener = self._listener, None
+            #wake up the accept loop, so that it sees it should stop.  (A
+            # plain connect, which does not wait for the authkey handshake:
+            # the loop may have stopped already.)
+            sock = socket.socket(socket.AF_UNIX)
+            try:
+                try:
+                    sock.connect(self.address)
+                except socket.error:
+                    pass
+            finally:
+                sock.close()
+            listener.close()
+            #only remove the info file if it's still ours
+            try:
+                if readMigrationInfo(self.info_file)[0] == self.address:
+                    os.remove(self.info_file)
+            except (IOError, OSError):
+                pass
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+
+    def _acceptLoop(self):
+        listener = self._listener
+        while self._listener is not None:
+            try:
+                conn = listener.accept()
+            except _CONNECTION_ERRORS:
+                #the listener got closed, the client hung up right away,
+                # or it did not know the authkey
+                continue
+            thread = threading.Thread(target=self._handle, args=(conn,))
+            thread.setDaemon(True)
+            thread.start()
+
+    def _handle(self, conn):
+        """Handles the requests of one connection:
+          ('get', num_migrants) -> list of pickled inds
+          ('push', list of pickled inds, ss) -> True
+        """
+        try:
+            try:
+                while conn.poll(60.0):
+                    request = conn.recv()
+                    if request[0] == 'get':
+                        self._lock.acquire()
+                        payloads = self._payloads
+                        self._lock.release()
+                        num = min(request[1], len(payloads))
+                        conn.send(random.sample(payloads, num))
+                    elif request[0] == 'push':
+                        self._lock.acquire()
+                        self._pushed_payloads.extend(request[1])
+                        self._pushed_payloads[:-self.max_num_pushed] = []
+                        self._pushed_ss = request[2]
+                        self._lock.release()
+                        conn.send(True)
+                    else:
+                        log.warning('Unknown migration request %s' %
+                                    str(request[0]))
+                        break
+            except (socket.error, EOFError, IOError):
+                pass
+        finally:
+            conn.close()
+
+class MigrationClient:
+    """
+    @description
+      Gets migrants from, and pushes inds to, a MigrationServer.
+
+    @attributes
+      info_file -- string -- the server's info file; see migrationInfoFile()
+      timeout -- float -- max seconds to wait for a reply
+    """
+
+    def __init__(self, info_file, timeout=10.0):
+        self.info_file = info_file
+        self.timeout = timeout
+
+    def serverExists(self):
+        return os.path.exists(self.info_file)
+
+    def getMigrants(self, ps, num_migrants):
+        """Returns a random sample of up to 'num_migrants' inds from the
+        server's pool (with 'ps' reattached).  Raises IOError if the
+        server can't be reached."""
+        payloads = self._request(('get', num_migrants))
+        return unpickleInds(payloads, ps)
+
+    def pushInds(self, inds, ss):
+        """Sends 'inds' (and the ss that they were found with) to the
+        server.  Raises IOError if the server can't be reached."""
+        self._request(('push', pickleInds(inds), ss))
+
+    def _request(self, request):
+        #read the info file each time, since the server may have restarted
+        address, authkey = readMigrationInfo(self.info_file)
+        try:
+            conn = Client(address, 'AF_UNIX', authkey)
+            try:
+                conn.send(request)
+                if not conn.poll(self.timeout):
+                    raise IOError('No reply from migration server at %s' %
+                                  address)
+                return conn.recv()
+            finally:
+                conn.close()
+        except (socket.error, EOFError, AuthenticationError), e:
+            raise IOError('Could not reach migration server at %s: %s' %
+                          (address, e))
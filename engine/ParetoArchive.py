@@ -0,0 +1,212 @@
+"""
+An incremental nondominated archive: the current global front of all
+inds that were inserted, kept up to date one ind at a time.
+"""
+
+from EpsilonArchive import goodnessesDominate, objectiveGoodnesses, \
+     scaledConstraintViolation
+
+class ParetoArchive:
+    """
+    @description
+      Holds the nondominated inds among all inds that have been added.
+
+      -Once any feasible ind has been added, it holds the feasible inds
+       that no other feasible ind dominates (on the objectives, like
+       Ind.dominates()), with one ind per performance.
+      -Until then, it holds the inds with the smallest constraint
+       violation (see scaledConstraintViolation(), weighted by
+       metric_weights), with one ind per performance.  That's like
+       Ind.constrainedDominates(), except that the violations are
+       scaled by the metrics' thresholds rather than by the range of
+       metric values in a population.
+
+      Bad inds, and inds that are not fully evaluated, never get in.
+
+    @attributes
+      ps -- ProblemSetup
+      metric_weights -- dict of metric_name : weight, or None -- see
+        Ind.constraintViolation()
+      _objectives -- list of Metric -- the metrics with objectives
+      _inds -- list of Ind -- the archived inds
+      _goodnesses -- list of list of float -- per archived ind, its
+        objective values oriented so that larger is better
+      _perf_keys -- set -- performance keys of the archived inds
+      _has_feasible -- bool -- are the archived inds feasible?
+      _best_violation -- float -- violation of the archived inds, if they
+        are infeasible
+      _ideal -- list of float -- per objective, the best goodness in the
+        archive
+      _nadir -- list of float -- per objective, the worst goodness in the
+        archive
+
+    @notes
+      This is a 'linear list with bounds': a new ind that is worse than
+      the nadir point on every objective (and strictly worse on one)
+      gets rejected without looking at the list, and a new ind that beats
+      the ideal point on some objective can't be dominated, so that check
+      is skipped.  Only inds that land between the bounds need a pass
+      over the list.
+    """
+
+    def __init__(self, ps, metric_weights=None):
+        self.ps = ps
+        self.metric_weights = metric_weights
+        self._objectives = [metric for metric in ps.flattenedMetrics()
+                            if metric.improve_past_feasible]
+        self._inds = []
+        self._goodnesses = []
+        self._perf_keys = set()
+        self._has_feasible = False
+        self._best_violation = None
+        self._ideal = None
+        self._nadir = None
+
+    def __len__(self):
+        return len(self._inds)
+
+    def front(self):
+        """Returns list of Ind -- the current nondominated inds"""
+        return list(self._inds)
+
+    def addInds(self, inds):
+        """Adds each of 'inds'; returns the number that got in"""
+        num_added = 0
+        for ind in inds:
+            if self.add(ind):
+                num_added += 1
+        return num_added
+
+    def isDominated(self, ind):
+        """
+        @description
+          Returns True if 'ind' would not get into the archive, because
+          an archived ind dominates it (or has the same performance).
+
+        @arguments
+          ind -- Ind -- fully evaluated
+
+        @return
+          is_dominated -- bool
+        """
+        if ind.isBad():
+            return True
+        if not ind.isFeasible():
+            if self._has_feasible:
+                return True
+            if not self._inds:
+                return False
+            violation = scaledConstraintViolation(self.ps, ind,
+                                                  self.metric_weights)
+            return violation > self._best_violation or \
+                   (violation == self._best_violation and
+                    ind.performanceKey() in self._perf_keys)
+        if not self._has_feasible:
+            return False
+        if ind.performanceKey() in self._perf_keys:
+            return True
+        return self._isDominated(objectiveGoodnesses(self._objectives, ind))
+
+    def add(self, ind):
+        """
+        @description
+          Adds 'ind' if nothing in the archive dominates it, and removes
+          the archived inds that it dominates.
+
+        @arguments
+          ind -- Ind
+
+        @return
+          added -- bool -- is 'ind' in the archive now?
+        """
+        if ind.isBad() or not ind.fullyEvaluated():
+            return False
+
+        #infeasible: only matters until there is a feasible ind
+        if not ind.isFeasible():
+            if self._has_feasible:
+                return False
+            violation = scaledConstraintViolation(self.ps, ind,
+                                                  self.metric_weights)
+            goodnesses = objectiveGoodnesses(self._objectives, ind)
+            if not self._inds or violation < self._best_violation:
+                self._setInds([ind], [goodnesses])
+                self._best_violation = violation
+                return True
+            if violation == self._best_violation and \
+                   ind.performanceKey() not in self._perf_keys:
+                self._append(ind, goodnesses)
+                return True
+            return False
+
+        #first feasible ind replaces any infeasible one
+        if not self._has_feasible:
+            self._has_feasible = True
+            self._setInds([], [])
+
+        perf_key = ind.performanceKey()
+        if perf_key in self._perf_keys:
+            return False
+        goodnesses = objectiveGoodnesses(self._objectives, ind)
+        if self._isDominated(goodnesses):
+            return False
+
+        #remove the archived inds that the new ind dominates.  It can only
+        # dominate something if it beats the nadir point somewhere.
+        if self._inds and \
+               [g for g, nadir_g in zip(goodnesses, self._nadir) if g > nadir_g]:
+            keep = [i for i, other_goodnesses in enumerate(self._goodnesses)
+                    if not goodnessesDominate(goodnesses, other_goodnesses)]
+            if len(keep) < len(self._inds):
+                self._setInds([self._inds[i] for i in keep],
+                              [self._goodnesses[i] for i in keep])
+
+        self._append(ind, goodnesses)
+        return True
+
+    def _isDominated(self, goodnesses):
+        """Returns True if an archived ind dominates 'goodnesses'"""
+        if not self._inds:
+            return False
+
+        #worse-or-equal than the nadir everywhere, and worse somewhere:
+        # every archived ind dominates it
+        worse_somewhere = False
+        for g, nadir_g in zip(goodnesses, self._nadir):
+            if g > nadir_g:
+                break
+            if g < nadir_g:
+                worse_somewhere = True
+        else:
+            if worse_somewhere:
+                return True
+
+        #better than the ideal somewhere: nothing can dominate it
+        for g, ideal_g in zip(goodnesses, self._ideal):
+            if g > ideal_g:
+                return False
+
+        for other_goodnesses in self._goodnesses:
+            if goodnessesDominate(other_goodnesses, goodnesses):
+                return True
+        return False
+
+    def _setInds(self, inds, goodnesses_per_ind):
+        """Sets the archived inds, and recomputes the bounds"""
+        self._inds = []
+        self._goodnesses = []
+        self._perf_keys = set()
+        self._ideal, self._nadir = None, None
+        for ind, goodnesses in zip(inds, goodnesses_per_ind):
+            self._append(ind, goodnesses)
+
+    def _append(self, ind, goodnesses):
+        """Adds 'ind' to the archived inds, and updates the bounds"""
+        self._inds.append(ind)
+        self._goodnesses.append(goodnesses)
+        self._perf_keys.add(ind.performanceKey())
+        if self._ideal is None:
+            self._ideal, self._nadir = list(goodnesses), list(goodnesses)
+        else:
+            self._ideal = map(max, self._ideal, goodnesses)
+            self._nadir = map(min, self._nadir, goodnesses)
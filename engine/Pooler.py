@@ -4,15 +4,22 @@ and pools them all into one bigger DB.
 """
 
 import cPickle as pickle
+import multiprocessing
 import os
 import string
 import time
 
 from adts import *
 from EngineUtils import AgeLayeredPop, \
-     uniqueIndsByPerformance, SynthState, loadSynthState, \
+     uniqueIndsByPerformance, SynthState, loadSynthState, isRunStoreFile, \
+     loadSynthStateHeader, loadIndSummaries, pickleInds, unpickleInds, \
      fastNondominatedSort, minMaxMetrics
 
+from EpsilonArchive import EpsilonArchive, thresholdEpsilons
+from Migration import MigrationServer, migrationInfoFile
+from WaveformStore import openWaveformStore, closeWaveformStore
+from util.filewatch import FileWatcher
+
 import logging
 log = logging.getLogger('pooler')
 
@@ -27,18 +34,55 @@ class PoolerStrategy:
         to set it to be about 'popsize' of one run
       just_one_iter -- bool -- just do one iteration of pooling
         (ie do 'aggregation').
+      event_driven -- bool -- if True, then rather than waiting
+        loop_wait_time between loops, start the next loop as soon as a
+        db file changes (loop_wait_time then just caps the wait)
+      debounce_time -- float -- when event_driven, wait until db files
+        have not changed for this many seconds before pooling
+      poll_interval -- float -- when event_driven but inotify is not
+        available, how often to check db files for changes (in seconds)
+      serve_migrants -- bool -- if True (and not just_one_iter), serve
+        the pool to SynthEngines over a local socket (see Migration.py),
+        and pool the inds that they push too
+      num_processes -- int -- how many processes to load and prune
+        changed dbs with, in parallel.  1 means 'in this process'.
+      streaming -- bool -- if True, merge each db's inds into the pool
+        as soon as that db is loaded, rather than collecting the inds of
+        all dbs first.  Then peak memory is about the pool plus
+        num_processes dbs, no matter how many dbs there are.
+      epsilon -- float -- if > 0, then the pool is an EpsilonArchive
+        rather than the best inds of a nondominated sort.  Each objective's
+        box width is epsilon times the scale of its threshold (see
+        thresholdEpsilons()), e.g. 0.01 means 1% of the threshold.
     """
 
-    def __init__(self, loop_wait_time, max_pool_size, just_one_iter):
+    def __init__(self, loop_wait_time, max_pool_size, just_one_iter,
+                 event_driven=False, debounce_time=2.0, poll_interval=2.0,
+                 serve_migrants=False, num_processes=1, streaming=False,
+                 epsilon=0.0):
         self.loop_wait_time = loop_wait_time
         self.max_pool_size = max_pool_size
         self.just_one_iter = just_one_iter
+        self.event_driven = event_driven
+        self.debounce_time = debounce_time
+        self.poll_interval = poll_interval
+        self.serve_migrants = serve_migrants
+        self.num_processes = num_processes
+        self.streaming = streaming
+        self.epsilon = epsilon
 
     def __str__(self):
         s = "PoolerStrategy={"
         s += ' loop_wait_time=%d seconds' % self.loop_wait_time
         s += '; max_pool_size=%d inds' % self.max_pool_size
         s += '; just_one_iter=%s' % self.just_one_iter
+        s += '; event_driven=%s' % self.event_driven
+        s += '; debounce_time=%g seconds' % self.debounce_time
+        s += '; poll_interval=%g seconds' % self.poll_interval
+        s += '; serve_migrants=%s' % self.serve_migrants
+        s += '; num_processes=%d' % self.num_processes
+        s += '; streaming=%s' % self.streaming
+        s += '; epsilon=%g' % self.epsilon
         s += " /PoolerStrategy}"  
         return s 
 
@@ -72,6 +116,32 @@ class Pooler:
         remove db_dirs)
       pooled_db_file -- string -- name of the file that stores the pooled
         data of all the dbs
+      waveform_store -- WaveformStore -- in pooled_db_file + '.waveforms';
+        the pooled inds' waveforms get copied into it when they are
+        ingested, since an engine may clear its own store on restart
+      pooled_inds -- list of Ind -- the pooled archive, kept in memory so
+        that each iteration only has to ingest new data.  (None until the
+        first iteration; then it gets seeded from an existing pooled_db_file,
+        unless just aggregating.)
+      synth_ss -- SynthSolutionStrategy -- of the first decent db found
+      _db_dirs -- list of string -- as last read from db_dirs_file
+      _db_dirs_mtime -- float -- mtime of db_dirs_file when last read
+      _newest_file_per_db_dir -- dict of db_dir : (db_dir mtime, db_file) --
+        to avoid listing a db_dir again if nothing was added to it
+      _signature_per_db_dir -- dict of db_dir : (db_file, mtime, size) --
+        of the db file that was last ingested from each db_dir
+      _watcher -- FileWatcher or None -- when event-driven, watches the
+        db_dirs (and the dir of db_dirs_file) for new db files, from before
+        the first iteration on
+      migration_server -- MigrationServer or None -- serves migrants
+        while running, if ss.serve_migrants
+      _archive -- EpsilonArchive or None -- holds the pool if ss.epsilon > 0
+        (then pooled_inds is a copy of its inds)
+      _process_pool -- multiprocessing.Pool or None -- the worker
+        processes that load dbs, if ss.num_processes > 1.  They get
+        forked once, before any of the Pooler's threads start (a fork
+        while another thread holds a lock can deadlock the child), and
+        are reused by every iteration.
     """
 
     def __init__(self, ps, ss, db_dirs_file, pooled_db_file):
@@ -92,6 +162,19 @@ class Pooler:
         assert os.path.exists(self.db_dirs_file), self.db_dirs_file
 
         self.pooled_db_file = os.path.abspath(pooled_db_file)
+        self.waveform_store = openWaveformStore(self.pooled_db_file +
+                                                '.waveforms')
+
+        self.pooled_inds = None
+        self.synth_ss = None
+        self._db_dirs = []
+        self._db_dirs_mtime = None
+        self._newest_file_per_db_dir = {}
+        self._signature_per_db_dir = {}
+        self._watcher = None
+        self.migration_server = None
+        self._archive = None
+        self._process_pool = None
             
 
     def run(self):
@@ -100,10 +183,10 @@ class Pooler:
 
           Runs the Pooler, which basically puts it into a continuous loop of:
           1. read db_dirs_file to get latest set of dbs to go for
-          2. read each db in
-          3. pool all the db results into one big db
-          4. save the pooled file
-          5. wait a while
+          2. read each db in that changed since the last iteration
+          3. pool the new db results into the (in-memory) pool
+          4. save the pooled file, if the pool changed
+          5. wait a while (or, if event-driven, until a db file changes)
           6. goto 1
         
         @arguments
@@ -118,30 +201,102 @@ class Pooler:
         log.info('db_dirs_file=%s' % self.db_dirs_file)
         log.info('pooled_db_file=%s' % self.pooled_db_file)
         
-        while True:
-            self.run__OneIteration()
-            if self.ss.just_one_iter:
-                log.info('Done aggregation.')
-                break
+        #fork the workers before the migration server starts its threads
+        self._startProcessPool()
+
+        if self.ss.serve_migrants and not self.ss.just_one_iter:
+            self.migration_server = MigrationServer(
+                migrationInfoFile(self.pooled_db_file), self.ps)
+            self.migration_server.start()
+
+        #watch before the first iteration, so that no db file that gets
+        # written during an iteration is missed
+        if self.ss.event_driven and not self.ss.just_one_iter:
+            self._startWatching()
+
+        try:
+            while True:
+                num_dbs_found = self.run__OneIteration()
+                if self.ss.just_one_iter:
+                    log.info('Done aggregation.')
+                    break
+                self._wait(num_dbs_found)
+        finally:
+            if self.migration_server is not None:
+                self.migration_server.close()
+                self.migration_server = None
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+            self._stopProcessPool()
+            closeWaveformStore(self.waveform_store.store_file)
+
+    def _wait(self, num_dbs_found):
+        """Waits until it's time for the next iteration"""
+        if self._watcher is not None:
+            self._watchDbDirs()
+            log.info('Done pooler iteration; wait for db files to change '
+                     '(or at most %s seconds)' % self.ss.loop_wait_time)
+            self._watcher.waitForChange(self.ss.loop_wait_time)
+        elif num_dbs_found == 0:
+            #no info to work with, so try later
+            time.sleep(max(self.ss.loop_wait_time, 60))
+        else:
+            log.info('Done pooler iteration; pause for %s seconds' %
+                     self.ss.loop_wait_time)
+            time.sleep(self.ss.loop_wait_time)
+
+    def _startWatching(self):
+        """Creates the watcher, which from now on notices db file changes
+        for _wait()"""
+        self._watcher = FileWatcher(self._isRelevantFilename,
+                                    self.ss.poll_interval,
+                                    self.ss.debounce_time)
+        self._watchDbDirs()
+
+    def _watchDbDirs(self):
+        """Makes the watcher watch the current db_dirs, and the dir of
+        db_dirs_file (to see when it's edited)"""
+        self._watcher.setDirs(self._dbDirs() +
+                              [os.path.dirname(self.db_dirs_file)])
+
+    def _isRelevantFilename(self, filename):
+        """Returns True if a change to a file with this (base) name
+        could give the Pooler new work.  (Eg ignores the steady stream of
+        writes to waveforms db files.)"""
+        return filename == 'run.db' or 'state_gen' in filename or \
+               filename == os.path.basename(self.db_dirs_file)
             
     def run__OneIteration(self):
-        """Run one iteration of Pooler"""
+        """
+        @description
+          Run one iteration of Pooler.  Returns the number of dbs found.
+
+          Only db files that changed since the last iteration get read in,
+          and of those only the inds whose performances are not in the
+          pool yet get loaded in full.  Then the pool gets updated by
+          pruning (pool + new inds).  So the cost of an iteration follows
+          the amount of new data, not the total amount of data.
+        """
 
         log.info('======================================================')
         log.info('Begin new Pooler iteration')
 
+        #maybe seed the pool from the previous pooled db
+        if self.pooled_inds is None:
+            self.pooled_inds = self._seedInds()
+            if self.migration_server is not None:
+                self.migration_server.setPool(self.pooled_inds)
+
         #1. read db_dirs_file to get latest set of dbs to go for
-        f = open(self.db_dirs_file, 'r')
-        lines_list = f.readlines()
-        f.close()
-        db_dirs = string.join(lines_list).split()
+        db_dirs = self._dbDirs()
         log.info('Will try to read from these db_dirs: %s' % db_dirs)
 
-        #2. read each db in (it's ok if a db doesn't exist)
-        #3. pool all the db results into one big db
-        all_inds = []
+        #2. find the dbs that changed (it's ok if a db doesn't exist)
+        pooled_perfs = set([ind.performanceKey() for ind in self.pooled_inds])
+        new_inds = []
         num_dbs_found = 0
-        synth_ss = None #set this using the first decent db we find
+        changed_dbs = [] #list of (db_dir, db_file, signature)
         for db_dir in db_dirs:
             #try to retrieve a db file; catch possible problems.
             if len(db_dir)>0 and db_dir[-1] != '/':
@@ -150,50 +305,180 @@ class Pooler:
             if not os.path.exists(db_dir):
                 log.info('  Could not find db_dir, so ignoring it')
                 continue
-            db_file = self._newestStateGenFile(db_dir)
+            db_file = self._newestDbFile(db_dir)
             if db_file is None:
                 log.info('  No relevant dbs in db_dir yet')
                 continue
+            num_dbs_found += 1
             try:
-                synth_state = loadSynthState(db_file, self.ps)
-            except:
-                log.info('  Could not loadSynthState from db_file=%s' % db_file)
+                stat = os.stat(db_file)
+            except OSError:
+                log.info('  Could not stat db_file=%s' % db_file)
+                continue
+            signature = (db_file, stat.st_mtime, stat.st_size)
+            if self._signature_per_db_dir.get(db_dir) == signature:
+                log.info('  No change since last ingested')
                 continue
+            changed_dbs.append((db_dir, db_file, signature))
 
-            #retrieved a db file, so add to all_inds
-            num_dbs_found += 1
-            inds = synth_state.allInds()
-            log.info('  Found %d inds in %s' % (len(inds), db_file))
-            max_num_inds_from_db = max(1, self.ss.max_pool_size / 3)
-            if synth_ss is None:
-                synth_ss = synth_state.ss
-            inds_from_db = self._bestInds(inds, max_num_inds_from_db,
-                                          synth_ss.metric_weights)
-            all_inds.extend(inds_from_db)
-            log.info('  Added %d of those inds to pooled_inds (pruned some)' %
-                     len(inds_from_db))
+        #3. load and prune the changed dbs (in parallel, if wanted)
+        # -if streaming, merge each one into the pool right away
+        max_num_inds_from_db = max(1, self.ss.max_pool_size / 3)
+        results = self._iterIngestedDbs([db_file for (db_dir, db_file,
+                                                      signature)
+                                         in changed_dbs],
+                                        pooled_perfs, max_num_inds_from_db)
+        pool_changed = False
+        for (db_dir, db_file, signature), result in zip(changed_dbs, results):
+            if result is None:
+                log.info('  Could not load inds from db_file=%s' % db_file)
+                continue
+
+            #retrieved a db file, so add its new inds
+            synth_ss, inds_from_db, num_new = result
+            self._localizeWaveforms(inds_from_db)
+            if self.synth_ss is None:
+                self.synth_ss = synth_ss
+            self._signature_per_db_dir[db_dir] = signature
+            log.info('  Found %d inds in %s that are new to the pool; '
+                     'kept the best %d of those' %
+                     (num_new, db_file, len(inds_from_db)))
+            if self.ss.streaming:
+                if inds_from_db:
+                    self._mergeIntoPool(inds_from_db)
+                    pool_changed = True
+            else:
+                new_inds.extend(inds_from_db)
+
+        #also add the inds that engines pushed to the migration server
+        if self.migration_server is not None:
+            pushed_inds, pushed_ss = self.migration_server.popPushedInds()
+            if self.synth_ss is None:
+                self.synth_ss = pushed_ss
+            inds = [ind for ind in uniqueIndsByPerformance(pushed_inds)
+                    if ind.performanceKey() not in pooled_perfs]
+            self._localizeWaveforms(inds)
+            log.info('Engines pushed %d inds that are new to the pool' %
+                     len(inds))
+            if inds:
+                num_dbs_found += 1
+                max_num_pushed_inds = max(1, self.ss.max_pool_size / 3)
+                new_inds.extend(self._bestInds(inds, max_num_pushed_inds,
+                                               self.synth_ss.metric_weights))
 
         # -no info to work with, so try later
-        log.info('Num dbs found = %d' % num_dbs_found)
+        log.info('Num dbs found = %d; num new inds = %d' %
+                 (num_dbs_found, len(new_inds)))
         if num_dbs_found == 0:
-            time.sleep(max(self.ss.loop_wait_time, 60))
-            return
+            return num_dbs_found
 
-        #4. save the pooled file
+        #4. update the pool, and save it if it changed
         # -DO prune it down to the best inds
-        log.info('Prune down pooled_inds via fast nondominated sort...')
-        target_num_best = self.ss.max_pool_size
-        pooled_inds = self._bestInds(all_inds, target_num_best,
-                                     synth_ss.metric_weights)
+        if new_inds:
+            self._mergeIntoPool(new_inds)
+            pool_changed = True
+        if pool_changed:
+            self._savePool()
+            if self.migration_server is not None:
+                self.migration_server.setPool(self.pooled_inds)
+        else:
+            log.info('Nothing new, so pool stays the same')
+        return num_dbs_found
+
+    def _localizeWaveforms(self, inds):
+        """Copies the waveforms of 'inds' into self.waveform_store"""
+        for ind in inds:
+            ind.moveWaveformsToStore(self.waveform_store)
+
+    def _mergeIntoPool(self, new_inds):
+        """Sets self.pooled_inds to the best of (pool + new_inds)"""
+        if self.ss.epsilon > 0.0:
+            if self._archive is None:
+                self._archive = EpsilonArchive(
+                    self.ps, self.ss.max_pool_size,
+                    thresholdEpsilons(self.ps, self.ss.epsilon))
+                self._archive.addInds(self.pooled_inds)
+            num_added = self._archive.addInds(new_inds)
+            self.pooled_inds = self._archive.inds()
+            log.info('Added %d of %d new inds to the pool archive' %
+                     (num_added, len(new_inds)))
+            return
+
+        log.info('Prune down pool + new inds via fast nondominated sort...')
+        self.pooled_inds = self._bestInds(self.pooled_inds + new_inds,
+                                          self.ss.max_pool_size,
+                                          self.synth_ss.metric_weights)
         log.info('Done prune')
-        synth_state = SynthState(self.ps, synth_ss,
-                                 AgeLayeredPop([pooled_inds]))
+
+    def _iterIngestedDbs(self, db_files, pooled_perfs, max_num_inds_from_db):
+        """
+        @description
+          Loads the inds of each db in 'db_files' that are not in the pool
+          yet, and prunes them down to the best 'max_num_inds_from_db'.
+          With ss.num_processes > 1, the dbs get spread across a pool of
+          processes, and only the pruned inds come back to this process.
+
+          Generates the results in the order of db_files, and only loads
+          (about) num_processes dbs ahead of the caller, so that the caller
+          can merge results without them all being in memory at once.
+
+        @return
+          generates (synth_ss, inds, num_new) or None -- one per db_file;
+            None means the db could not be loaded
+        """
+        if self.synth_ss is None: metric_weights = None
+        else:                     metric_weights = self.synth_ss.metric_weights
+        num_processes = min(self.ss.num_processes, len(db_files))
+        if num_processes <= 1:
+            for db_file in db_files:
+                yield _ingestDb(self.ps, db_file, pooled_perfs,
+                                max_num_inds_from_db, metric_weights)
+            return
+
+        self._startProcessPool() #if run() has not already
+        log.info('Load %d dbs across %d processes' %
+                 (len(db_files), num_processes))
+        for start in range(0, len(db_files), num_processes):
+            chunk = db_files[start:start + num_processes]
+            worker_results = self._process_pool.map(
+                _ingestDbInWorker,
+                [(db_file, pooled_perfs, max_num_inds_from_db,
+                  metric_weights) for db_file in chunk],
+                chunksize=1)
+            for result in worker_results:
+                if result is not None:
+                    synth_ss, payloads, num_new = result
+                    result = (synth_ss, unpickleInds(payloads, self.ps),
+                              num_new)
+                yield result
+
+    def _startProcessPool(self):
+        """Forks the worker processes, if ss.num_processes > 1 and they
+        are not running yet"""
+        if self.ss.num_processes <= 1 or self._process_pool is not None:
+            return
+        #the workers are forked, so the initializer hands them the ps
+        # (which can't be pickled), also any worker that gets respawned
+        log.info('Start %d worker processes' % self.ss.num_processes)
+        self._process_pool = multiprocessing.Pool(self.ss.num_processes,
+                                                  _initWorker, (self.ps,))
+
+    def _stopProcessPool(self):
+        if self._process_pool is not None:
+            self._process_pool.terminate()
+            self._process_pool.join()
+            self._process_pool = None
+
+    def _savePool(self):
+        """Saves self.pooled_inds to self.pooled_db_file"""
+        synth_state = SynthState(self.ps, self.synth_ss,
+                                 AgeLayeredPop([self.pooled_inds]))
 
         # -we may have trouble saving to the file if another process
         #  is accessing it, so just keep retrying until good
         while True:
             log.info('Try saving %d pruned-pooled inds to file %s' %
-                     (len(pooled_inds), self.pooled_db_file))
+                     (len(self.pooled_inds), self.pooled_db_file))
             try:
                 synth_state.save(self.pooled_db_file)
                 log.info('Successfully saved')
@@ -202,47 +487,55 @@ class Pooler:
                 time.sleep(3)
                 pass
 
-        #5. wait a while
-        log.info('Done pooler iteration; pause for %s seconds' %
-                 self.ss.loop_wait_time)
-        time.sleep(self.ss.loop_wait_time)
+    def _seedInds(self):
+        """Returns the inds of an existing pooled_db_file, so that a
+        restarted Pooler carries on from where it was.  (Except when
+        just aggregating: then the pool always starts empty.)"""
+        if self.ss.just_one_iter or not os.path.exists(self.pooled_db_file):
+            return []
+        try:
+            synth_state = loadSynthState(self.pooled_db_file, self.ps)
+        except:
+            log.info('Could not load existing pooled_db_file, so start empty')
+            return []
+        self.synth_ss = synth_state.ss
+        log.info('Seeded pool with %d inds from existing pooled_db_file' %
+                 len(synth_state.allInds()))
+        return synth_state.allInds()
 
-        #6. then repeat!
+    def _dbDirs(self):
+        """Returns the db_dirs listed in db_dirs_file (only re-reading
+        that file if it has changed)"""
+        mtime = os.path.getmtime(self.db_dirs_file)
+        if mtime != self._db_dirs_mtime:
+            f = open(self.db_dirs_file, 'r')
+            lines_list = f.readlines()
+            f.close()
+            self._db_dirs = string.join(lines_list).split()
+            self._db_dirs_mtime = mtime
+        return self._db_dirs
 
     def _bestInds(self, inds, target_num_best, metric_weights):
-        """
-        @description
-
-        Returns 'target_num_best' inds.
-        
-        How:
-        -unique-ifies inds
-        -does nondominated sort to get 'F'
-        -takes the inds from the best layers of F first
-        """
-        num_before = len(inds)
-        inds = uniqueIndsByPerformance(inds)
-        log.info('From %d inds, %d inds are unique' % (num_before, len(inds)))
-        
-        minmax = minMaxMetrics(self.ps, inds)
-        F = fastNondominatedSort(inds, minmax, max_num_inds=target_num_best,
-                                 metric_weights=metric_weights)
-        best_inds = []
-        for layer_i, layer_inds in enumerate(F):
-            best_inds.extend(layer_inds)
-            if len(best_inds) >= target_num_best:
-                best_inds[target_num_best:] = []
-                break
-        #could prune the last level more intelligently, ie based on crowding
-        # but don't bother here
-        return best_inds
+        """Returns 'target_num_best' inds; see bestInds()"""
+        return bestInds(self.ps, inds, target_num_best, metric_weights)
 
-    def _newestStateGenFile(self, db_dir):
+    def _newestDbFile(self, db_dir):
         """
         @description
-          Returns the name of the newest 'state_genXXX'db' file in 'db_dir'.
-          (Returns None if no state_gen files are found.)
+          Returns the name of the file in 'db_dir' that has the newest
+          state: the 'run.db' RunStore if there is one (loadSynthState()
+          gives its newest generation), otherwise the newest
+          'state_genXXX.db' file.  (Returns None if neither is found.)
         """
+        if isRunStoreFile(db_dir + 'run.db'):
+            return db_dir + 'run.db'
+
+        #only list the db_dir again if files got added to it
+        dir_mtime = os.path.getmtime(db_dir)
+        cached = self._newest_file_per_db_dir.get(db_dir)
+        if cached is not None and cached[0] == dir_mtime:
+            return cached[1]
+        
         max_ctime = float('-Inf')
         newest_filename = None
         for filename in os.listdir(db_dir):
@@ -251,4 +544,83 @@ class Pooler:
             if ctime > max_ctime:
                 max_ctime = ctime
                 newest_filename = db_dir + filename
+        self._newest_file_per_db_dir[db_dir] = (dir_mtime, newest_filename)
         return newest_filename
+
+def bestInds(ps, inds, target_num_best, metric_weights):
+    """
+    @description
+
+    Returns 'target_num_best' inds.
+
+    How:
+    -unique-ifies inds
+    -does nondominated sort to get 'F'
+    -takes the inds from the best layers of F first
+    """
+    num_before = len(inds)
+    inds = uniqueIndsByPerformance(inds)
+    log.info('From %d inds, %d inds are unique' % (num_before, len(inds)))
+
+    minmax = minMaxMetrics(ps, inds)
+    F = fastNondominatedSort(inds, minmax, max_num_inds=target_num_best,
+                             metric_weights=metric_weights)
+    best_inds = []
+    for layer_i, layer_inds in enumerate(F):
+        best_inds.extend(layer_inds)
+        if len(best_inds) >= target_num_best:
+            best_inds[target_num_best:] = []
+            break
+    #could prune the last level more intelligently, ie based on crowding
+    # but don't bother here
+    return best_inds
+
+def _ingestDb(ps, db_file, pooled_perfs, max_num_inds, metric_weights):
+    """
+    @description
+      Loads the inds of 'db_file' whose performances are not in
+      'pooled_perfs', and prunes them down to the best 'max_num_inds'.
+
+    @arguments
+      ps -- ProblemSetup
+      db_file -- string -- any file that loadIndSummaries() can load
+      pooled_perfs -- set of performance keys -- of the inds in the pool
+      max_num_inds -- int
+      metric_weights -- dict or None -- None means 'use the metric
+        weights of db_file's ss'
+
+    @return
+      result -- (synth_ss, best_inds, num_new_inds), or None if db_file
+        could not be loaded
+    """
+    try:
+        synth_ss = loadSynthStateHeader(db_file, ps).ss
+        summaries = loadIndSummaries(db_file, ps)
+        summaries = [summary
+                     for summary in uniqueIndsByPerformance(summaries)
+                     if summary.performanceKey() not in pooled_perfs]
+        inds = [summary.load() for summary in summaries]
+    except:
+        return None
+    if metric_weights is None:
+        metric_weights = synth_ss.metric_weights
+    return (synth_ss, bestInds(ps, inds, max_num_inds, metric_weights),
+            len(inds))
+
+_worker_ps = None #the ps of _ingestDbInWorker(); set by _initWorker()
+
+def _initWorker(ps):
+    """Sets up a worker process of Pooler._iterIngestedDbs()"""
+    global _worker_ps
+    _worker_ps = ps
+
+def _ingestDbInWorker(args):
+    """Like _ingestDb(), but in a worker process: takes the ps from
+    _worker_ps, and returns the best inds pickled"""
+    (db_file, pooled_perfs, max_num_inds, metric_weights) = args
+    result = _ingestDb(_worker_ps, db_file, pooled_perfs, max_num_inds,
+                       metric_weights)
+    if result is None:
+        return None
+    synth_ss, best_inds, num_new = result
+    return (synth_ss, pickleInds(best_inds), num_new)
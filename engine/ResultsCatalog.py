@@ -0,0 +1,343 @@
+"""
+A ResultsCatalog turns finished runs into a database for
+'specs-in, sized-topology-out' queries: given metric thresholds, it
+returns the nondominated sized topologies that meet them (and their
+netlists), without having to unpickle and nondom-sort any states.
+"""
+
+import os
+import sqlite3
+
+from adts import *
+from adts.Metric import MAXIMIZE, MINIMIZE
+from util.constants import BAD_METRIC_VALUE
+from EngineUtils import loadSynthState
+
+import logging
+log = logging.getLogger('synth')
+
+class CatalogEntry:
+    """
+    @description
+      One sized topology (ie one ind) as stored in a ResultsCatalog.
+
+    @attributes
+      source -- string -- the db file that the ind came from
+      ID -- int -- the ind's ID (unique within one source)
+      topology -- string -- the ind's values of the choice vars, e.g.
+        'chosen_part_index=1,use_pmos=0'
+      is_feasible -- bool -- did the ind meet all of the ps' constraints?
+      netlist -- string -- the ind's (sized) netlist
+      worst_case_metric_values -- dict of metric_name : worst-case value
+        (BAD_METRIC_VALUE if the ind could not be measured)
+    """
+    def __init__(self, source, ID, topology, is_feasible, netlist,
+                 worst_case_metric_values):
+        self.source = source
+        self.ID = ID
+        self.topology = topology
+        self.is_feasible = is_feasible
+        self.netlist = netlist
+        self.worst_case_metric_values = worst_case_metric_values
+
+    def __str__(self):
+        s = "CatalogEntry={"
+        s += ' source=%s' % self.source
+        s += '; ID=%d' % self.ID
+        s += '; topology=%s' % self.topology
+        s += '; is_feasible=%s' % self.is_feasible
+        s += '; worst_case_metric_values=%s' % self.worst_case_metric_values
+        s += " /CatalogEntry}"
+        return s
+
+class ResultsCatalog:
+    """
+    @description
+      An SQLite database of inds from state and pooled DBs.  Each ind is
+      one row, with one column per worst-case metric value.  There are
+      indices on ind ID, on topology, and on each metric column, so
+      that threshold queries do not need to look at every ind.
+
+    @attributes
+      catalog_file -- string -- name of the SQLite file
+      metrics -- list of (name, aim, improve_past_feasible, min_threshold,
+        max_threshold) -- the metrics of the ProblemSetup that the catalog
+        was built for.  Metric i is stored in column 'm<i>'.
+      _conn -- sqlite3.Connection
+
+    @notes
+      Ind IDs are only unique within one run, so an ind is identified by
+      (source, ID).  Adding the same source again replaces its inds.
+    """
+
+    def __init__(self, catalog_file, ps=None):
+        """
+        @arguments
+          catalog_file -- string -- name of the SQLite file.  It gets
+            created if it does not exist yet.
+          ps -- ProblemSetup or None -- needed to create a new catalog,
+            and to add inds to it.  Queries do not need it.
+
+        @return
+          ResultsCatalog object
+        """
+        self.catalog_file = os.path.abspath(catalog_file)
+        self._conn = sqlite3.connect(self.catalog_file)
+        self._conn.text_factory = str
+
+        has_tables = self._conn.execute(
+            "SELECT count(*) FROM sqlite_master WHERE name='metrics'"
+            ).fetchone()[0] > 0
+        if has_tables:
+            self.metrics = [tuple(row) for row in self._conn.execute(
+                "SELECT name, aim, improve_past_feasible, min_threshold, "
+                "max_threshold FROM metrics ORDER BY column_index")]
+            if ps is not None and \
+                   [m[0] for m in self.metrics] != ps.flattenedMetricNames():
+                raise ValueError("Catalog %s was built for other metrics" %
+                                 self.catalog_file)
+        elif ps is None:
+            raise ValueError("Need a ps to create catalog %s" %
+                             self.catalog_file)
+        else:
+            self.metrics = [(m.name, m.aim(), int(m.improve_past_feasible),
+                             m.min_threshold, m.max_threshold)
+                            for m in ps.flattenedMetrics()]
+            self._createTables()
+
+    def metricNames(self):
+        return [metric[0] for metric in self.metrics]
+
+    def numInds(self):
+        return self._conn.execute("SELECT count(*) FROM inds").fetchone()[0]
+
+    def addSynthState(self, synth_state, source):
+        """
+        @description
+          Adds all inds of 'synth_state' (replacing any previous inds
+          from 'source').
+
+        @arguments
+          synth_state -- SynthState -- its ps is used for netlisting
+          source -- string -- name of the db file that the state came from
+
+        @return
+          <<none>> but updates the catalog
+        """
+        ps = synth_state.ps
+        metric_names = self.metricNames()
+        pm = ps.embedded_part.part.point_meta
+        choice_var_names = sorted([name for name, varmeta in pm.items()
+                                   if isinstance(varmeta, DiscreteVarMeta)
+                                   and varmeta.isChoiceVar()])
+        rows = []
+        for ind in synth_state.allInds():
+            scaled_point = pm.scale(ind.genotype.unscaled_opt_point)
+            topology = ','.join(['%s=%d' % (name, scaled_point[name])
+                                 for name in choice_var_names])
+            metric_values = []
+            for metric_name in metric_names:
+                value = ind.worstCaseMetricValue(metric_name)
+                if value == BAD_METRIC_VALUE:
+                    value = None
+                metric_values.append(value)
+            rows.append([source, ind.ID, topology, int(ind.isFeasible()),
+                         ind.netlist()] + metric_values)
+
+        columns = ', '.join(['m%d' % i for i in range(len(metric_names))])
+        value_marks = ', '.join(['?'] * (5 + len(metric_names)))
+        self._conn.execute("DELETE FROM inds WHERE source=?", (source,))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO inds (source, ID, topology, is_feasible, "
+            "netlist, %s) VALUES (%s)" % (columns, value_marks), rows)
+        self._conn.commit()
+        log.info('Added %d inds from %s to catalog %s' %
+                 (len(rows), source, self.catalog_file))
+
+    def query(self, thresholds, only_feasible=True, only_nondominated=True):
+        """
+        @description
+          Returns the inds that meet 'thresholds'.
+
+        @arguments
+          thresholds -- dict of metric_name : (min_value, max_value) --
+            where a value of None means 'no bound'
+          only_feasible -- bool -- only return inds that met all of the
+            ps' constraints too?
+          only_nondominated -- bool -- of the inds that meet the thresholds,
+            only return the nondominated ones (according to the metrics'
+            objectives)?
+
+        @return
+          entries -- list of CatalogEntry
+        """
+        metric_names = self.metricNames()
+        conditions, args = [], []
+        for metric_name, (min_value, max_value) in thresholds.items():
+            if metric_name not in metric_names:
+                raise ValueError("Unknown metric '%s'; known metrics are %s" %
+                                 (metric_name, metric_names))
+            column = 'm%d' % metric_names.index(metric_name)
+            if min_value is not None:
+                conditions.append('%s >= ?' % column)
+                args.append(min_value)
+            if max_value is not None:
+                conditions.append('%s <= ?' % column)
+                args.append(max_value)
+        if only_feasible:
+            conditions.append('is_feasible = 1')
+        where_s = ''
+        if conditions:
+            where_s = 'WHERE ' + ' AND '.join(conditions)
+
+        rows = self._conn.execute(self._selectStr() + where_s, args).fetchall()
+        if only_nondominated:
+            rows = self._nondominatedRows(rows)
+        return [self._rowToEntry(row) for row in rows]
+
+    def lookup(self, ID, source=None):
+        """Returns the entries with this ind ID (from 'source', if
+        it's not None)"""
+        if source is None:
+            rows = self._conn.execute(self._selectStr() + 'WHERE ID = ?',
+                                      (ID,)).fetchall()
+        else:
+            rows = self._conn.execute(self._selectStr() +
+                                      'WHERE ID = ? AND source = ?',
+                                      (ID, source)).fetchall()
+        return [self._rowToEntry(row) for row in rows]
+
+    def topologies(self):
+        """Returns dict of topology : number of inds having that topology"""
+        return dict(self._conn.execute(
+            "SELECT topology, count(*) FROM inds GROUP BY topology"))
+
+    def close(self):
+        self._conn.close()
+
+    def _createTables(self):
+        self._conn.execute(
+            "CREATE TABLE metrics (column_index INTEGER PRIMARY KEY, "
+            "name TEXT UNIQUE, aim INTEGER, improve_past_feasible INTEGER, "
+            "min_threshold REAL, max_threshold REAL)")
+        self._conn.executemany(
+            "INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)",
+            [(i,) + metric for i, metric in enumerate(self.metrics)])
+
+        metric_columns = ''.join([', m%d REAL' % i
+                                  for i in range(len(self.metrics))])
+        self._conn.execute(
+            "CREATE TABLE inds (source TEXT, ID INTEGER, topology TEXT, "
+            "is_feasible INTEGER, netlist TEXT%s, "
+            "PRIMARY KEY (source, ID))" % metric_columns)
+        self._conn.execute("CREATE INDEX inds_ID ON inds (ID)")
+        self._conn.execute("CREATE INDEX inds_topology ON inds (topology)")
+        for i in range(len(self.metrics)):
+            self._conn.execute("CREATE INDEX inds_m%d ON inds (m%d)" % (i, i))
+        self._conn.commit()
+
+    def _selectStr(self):
+        columns = ''.join([', m%d' % i for i in range(len(self.metrics))])
+        return "SELECT source, ID, topology, is_feasible, netlist%s " \
+               "FROM inds " % columns
+
+    def _rowToEntry(self, row):
+        wc_metvals = {}
+        for metric, value in zip(self.metrics, row[5:]):
+            if value is None:
+                value = BAD_METRIC_VALUE
+            wc_metvals[metric[0]] = value
+        return CatalogEntry(row[0], row[1], row[2], bool(row[3]), row[4],
+                            wc_metvals)
+
+    def _nondominatedRows(self, rows):
+        """Returns the rows that no other row dominates, according to
+        the objectives (ie metrics with improve_past_feasible)"""
+        #turn each row into a vector of 'goodness' values to maximize
+        goodnesses = []
+        for row in rows:
+            goodness = []
+            for (name, aim, improve, min_thr, max_thr), value in \
+                    zip(self.metrics, row[5:]):
+                if not improve: continue
+                if value is None:   goodness.append(float('-inf'))
+                elif aim == MAXIMIZE: goodness.append(value)
+                elif aim == MINIMIZE: goodness.append(-value)
+                else:               goodness.append(min(value - min_thr,
+                                                        max_thr - value))
+            goodnesses.append(tuple(goodness))
+
+        return [rows[i] for i in _nondominatedIndices(goodnesses)]
+
+def _dominates(goodness_a, goodness_b):
+    """Returns True if goodness_a is >= goodness_b everywhere, and > somewhere
+    """
+    found_better = False
+    for value_a, value_b in zip(goodness_a, goodness_b):
+        if value_a < value_b:
+            return False
+        elif value_a > value_b:
+            found_better = True
+    return found_better
+
+def _nondominatedIndices(goodnesses):
+    """Returns the sorted indices of the vectors in 'goodnesses' that no
+    other vector dominates.
+
+    Sorting the vectors from best to worst (lexicographically) means that
+    a vector can only be dominated by one that comes before it, and if it
+    is, then also by one of the nondominated vectors before it.  With two
+    objectives that's a staircase: a vector is dominated if any (different)
+    vector before it is at least as good on the second objective.  With
+    more, each vector only gets compared to the nondominated ones so far.
+    Equal vectors do not dominate each other, so they get kept or dropped
+    together.
+    """
+    order = sorted(range(len(goodnesses)), key=lambda i: goodnesses[i],
+                   reverse=True)
+    nondom_I = []
+    kept = []                  #nondominated vectors, of the earlier groups
+    best_second = float('-inf') #best 2nd value, of the earlier groups
+    start = 0
+    while start < len(order):
+        #group the equal vectors
+        goodness = goodnesses[order[start]]
+        end = start + 1
+        while end < len(order) and goodnesses[order[end]] == goodness:
+            end += 1
+
+        if len(goodness) == 2:
+            dominated = (start > 0) and (best_second >= goodness[1])
+            best_second = max(best_second, goodness[1])
+        else:
+            dominated = False
+            for other_goodness in kept:
+                if _dominates(other_goodness, goodness):
+                    dominated = True
+                    break
+            if not dominated:
+                kept.append(goodness)
+
+        if not dominated:
+            nondom_I.extend(order[start:end])
+        start = end
+    return sorted(nondom_I)
+
+def buildResultsCatalog(ps, db_files, catalog_file):
+    """
+    @description
+      Creates (or updates) 'catalog_file' from the states in 'db_files'.
+
+    @arguments
+      ps -- ProblemSetup
+      db_files -- list of string -- any files that loadSynthState() can load
+      catalog_file -- string
+
+    @return
+      catalog -- ResultsCatalog
+    """
+    catalog = ResultsCatalog(catalog_file, ps)
+    for db_file in db_files:
+        state = loadSynthState(db_file, ps)
+        catalog.addSynthState(state, os.path.abspath(db_file))
+    return catalog
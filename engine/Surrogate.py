@@ -0,0 +1,262 @@
+"""
+A surrogate of ind evaluation: it learns from the inds that an engine
+has evaluated, and predicts whether a new ind will come out bad, and its
+metric values -- so that the engine can skip evaluating the candidates
+that would very likely be wasted.
+"""
+
+import random
+
+import numpy
+
+from adts import DiscreteVarMeta
+from regressor.Lut import LutModel
+from EpsilonArchive import goodnessesDominate, metricGoodness, metricScale, \
+     objectiveGoodnesses
+
+import logging
+log = logging.getLogger('synth')
+
+class Surrogate:
+    """
+    @description
+      Predicts, for an unevaluated ind, the probability that it will be
+      bad and (if there are enough good inds nearby) its worst-case
+      metric values.
+
+      Inds get split by topology, ie by the values of their choice vars
+      (like in ResultsCatalog).  Within a topology, the other (unscaled)
+      vars are the inputs of LutModels: one for is-bad (0.0 or 1.0),
+      trained on all evaluated inds, and one per metric, trained on the
+      good ones.  Like any LutModel, each scales its inputs to [0,1]
+      according to the range of its training data, and its bandwidth is
+      in that space.  A model only predicts at a point with at least
+      min_num_neighbours training inds within the bandwidth; elsewhere,
+      the surrogate does not know.
+
+    @attributes
+      ps -- ProblemSetup
+      exploration_rate, max_prob_bad, screen_dominated, dominance_margin,
+        bandwidth, min_num_neighbours -- see the surrogate_* attributes
+        of SynthSolutionStrategy
+      num_screened -- int -- # candidates that screen() got asked about
+      num_rejected -- int -- # of those that should not get evaluated
+      num_explored -- int -- # of those that screen() would have rejected,
+        but let through for exploration
+      _varnames -- list of string -- the non-choice vars
+      _choice_varnames -- list of string -- the choice vars
+      _metrics -- list of Metric -- all metrics
+      _objectives -- list of Metric -- the metrics with objectives
+      _data_per_topology -- dict of topology : _TopologyData
+    """
+
+    def __init__(self, ps, ss):
+        """
+        @arguments
+          ps -- ProblemSetup
+          ss -- SynthSolutionStrategy -- holds the surrogate_* settings
+
+        @return
+          Surrogate object
+        """
+        self.ps = ps
+        self.exploration_rate = ss.surrogate_exploration_rate
+        self.max_prob_bad = ss.surrogate_max_prob_bad
+        self.screen_dominated = ss.surrogate_screen_dominated
+        self.dominance_margin = ss.surrogate_dominance_margin
+        self.bandwidth = ss.surrogate_bandwidth
+        self.min_num_neighbours = ss.surrogate_min_num_neighbours
+        self.num_screened = 0
+        self.num_rejected = 0
+        self.num_explored = 0
+
+        pm = ps.embedded_part.part.point_meta
+        self._choice_varnames = sorted([
+            name for name, varmeta in pm.items()
+            if isinstance(varmeta, DiscreteVarMeta) and varmeta.isChoiceVar()])
+        self._varnames = sorted([name for name in pm.keys()
+                                 if name not in self._choice_varnames])
+
+        self._metrics = ps.flattenedMetrics()
+        self._objectives = [metric for metric in self._metrics
+                            if metric.improve_past_feasible]
+        self._data_per_topology = {}
+
+    def __str__(self):
+        s = "Surrogate={"
+        s += ' #topologies=%d' % len(self._data_per_topology)
+        s += '; #training_inds=%d' % sum([len(data.is_bad) for data in
+                                          self._data_per_topology.values()])
+        s += '; #screened=%d' % self.num_screened
+        s += '; #rejected=%d' % self.num_rejected
+        s += '; #explored=%d' % self.num_explored
+        s += " /Surrogate}"
+        return s
+
+    def addInd(self, ind):
+        """Trains on 'ind', if it's fully evaluated"""
+        if not ind.fullyEvaluated():
+            return
+        topology, x = self._features(ind)
+        data = self._data_per_topology.get(topology)
+        if data is None:
+            data = _TopologyData()
+            self._data_per_topology[topology] = data
+        data.X.append(x)
+        data.is_bad.append(float(ind.isBad()))
+        if not ind.isBad():
+            data.good_X.append(x)
+            data.metric_values.append([ind.worstCaseMetricValue(metric.name)
+                                       for metric in self._metrics])
+
+    def predict(self, ind):
+        """
+        @description
+          Predicts the evaluation results of 'ind'.
+
+        @arguments
+          ind -- Ind -- need not be evaluated
+
+        @return
+          prediction -- (prob_bad, metric_values) or None if the surrogate
+            does not know.  prob_bad is a float in [0,1]; metric_values is
+            a dict of metric_name : worst-case value, or None if there are
+            too few good inds nearby.
+        """
+        topology, x = self._features(ind)
+        data = self._data_per_topology.get(topology)
+        if data is None:
+            return None
+        data.update(self.bandwidth)
+        if data.bad_model is None:
+            return None
+        X = numpy.reshape(x, (len(x), 1))
+        if data.bad_model.numNeighbours(X)[0] < self.min_num_neighbours:
+            return None
+        prob_bad = data.bad_model.simulate(X)[0]
+
+        metric_values = None
+        if data.metric_models is not None and \
+               data.metric_models[0].numNeighbours(X)[0] >= \
+               self.min_num_neighbours:
+            metric_values = dict([(metric.name, model.simulate(X)[0])
+                                  for metric, model in zip(self._metrics,
+                                                           data.metric_models)])
+        return prob_bad, metric_values
+
+    def screen(self, ind, parents):
+        """
+        @description
+          Decides whether 'ind' is worth evaluating: not if it is
+          predicted to be bad with probability >= max_prob_bad, nor (if
+          screen_dominated) if its predicted objectives, even with a margin
+          of dominance_margin, are dominated by every one of its parents.
+          A fraction exploration_rate of those get evaluated anyway.
+
+        @arguments
+          ind -- Ind -- not evaluated yet
+          parents -- list of Ind -- the (evaluated) inds that 'ind' came from
+
+        @return
+          worth_evaluating -- bool
+        """
+        self.num_screened += 1
+        reason = self._rejectReason(ind, parents)
+        if reason is None:
+            return True
+        if random.random() < self.exploration_rate:
+            self.num_explored += 1
+            log.info('Surrogate predicts that the ind is %s, but evaluate '
+                     'it anyway to explore' % reason)
+            return True
+        self.num_rejected += 1
+        log.info('Surrogate predicts that the ind is %s, so do not evaluate '
+                 'it' % reason)
+        return False
+
+    def _rejectReason(self, ind, parents):
+        """Returns string -- why 'ind' is not worth evaluating -- or None"""
+        prediction = self.predict(ind)
+        if prediction is None:
+            return None
+        prob_bad, metric_values = prediction
+        if prob_bad >= self.max_prob_bad:
+            return 'bad (p=%.2f)' % prob_bad
+
+        if not self.screen_dominated or metric_values is None or \
+               not self._objectives or not parents:
+            return None
+        for parent in parents:
+            if parent.isBad() or not parent.fullyEvaluated() or \
+                   not parent.isFeasible():
+                return None
+
+        #be optimistic about the ind
+        goodnesses = [metricGoodness(metric, metric_values[metric.name]) +
+                      self.dominance_margin * metricScale(metric)
+                      for metric in self._objectives]
+        for parent in parents:
+            if not goodnessesDominate(
+                objectiveGoodnesses(self._objectives, parent), goodnesses):
+                return None
+        return 'dominated by its parents'
+
+    def _features(self, ind):
+        """Returns (topology, x) of 'ind', where topology is a tuple of its
+        choice var values and x is a 1d array of its other vars"""
+        point = ind.genotype.unscaled_opt_point
+        topology = tuple([point[name] for name in self._choice_varnames])
+        x = numpy.array([point[name] for name in self._varnames], dtype=float)
+        return topology, x
+
+class _TopologyData:
+    """
+    @description
+      The training data of one topology, and the models built from it.
+
+    @attributes
+      X -- list of 1d array -- inputs of each evaluated ind
+      is_bad -- list of float -- 1.0 for each bad ind, else 0.0
+      good_X -- list of 1d array -- inputs of each good ind
+      metric_values -- list of list of float -- per good ind, its value
+        of each metric
+      bad_model -- LutModel or None -- of is_bad
+      metric_models -- list of LutModel, or None -- per metric
+      _num_at_build -- int -- len(X) when the models got built
+    """
+
+    def __init__(self):
+        self.X = []
+        self.is_bad = []
+        self.good_X = []
+        self.metric_values = []
+        self.bad_model = None
+        self.metric_models = None
+        self._num_at_build = 0
+
+    def update(self, bandwidth):
+        """Rebuilds the models if the data has grown by 10% (or 10 inds)
+        since they got built"""
+        num_new = len(self.X) - self._num_at_build
+        if num_new == 0 or \
+               (self.bad_model is not None and
+                num_new < max(10, self._num_at_build / 10)):
+            return
+        self._num_at_build = len(self.X)
+        self.bad_model = _buildModel(self.X, self.is_bad, bandwidth)
+        self.metric_models = None
+        if self.good_X:
+            values_per_metric = numpy.transpose(self.metric_values)
+            models = [_buildModel(self.good_X, values, bandwidth)
+                      for values in values_per_metric]
+            if None not in models:
+                self.metric_models = models
+
+def _buildModel(X, y, bandwidth):
+    """Returns a LutModel of the training inputs 'X' (list of 1d array) to
+    outputs 'y', or None if no input varies"""
+    X = numpy.transpose(numpy.array(X))
+    if X.shape[0] == 0 or not numpy.any(numpy.min(X, 1) < numpy.max(X, 1)):
+        return None
+    return LutModel(X, numpy.array(y, dtype=float), bandwidth,
+                    use_spatial_index=True)
@@ -20,9 +20,13 @@ from adts.Part import replaceAutoNodesWithXXX
 from util import mathutil
 from util.constants import Incomputable, BAD_METRIC_VALUE
 from Ind import Genotype, Ind
+from WaveformStore import openWaveformStore, closeWaveformStore
+from CheckpointWriter import CheckpointWriter
+from Surrogate import Surrogate
+from Migration import MigrationClient, migrationInfoFile
 from EngineUtils import AgeLayeredPop, \
      uniqueIndsByPerformance, populationSummaryStr, \
-     SynthState, loadSynthState, \
+     SynthState, loadSynthState, loadIndSummaries, RunStore, \
      fastNondominatedSort, minMaxMetrics, numIndsInNestedPop
 
 import logging
@@ -49,8 +53,12 @@ class NsgaInd(Ind):
         it means that the ind is less crowded (and therefore more unique)
       
     """
-    def __init__(self, genotype, ps):
+    __slots__ = ('genetic_age', 'distance')
+    
+    def __init__(self, genotype=None, ps=None):
         Ind.__init__(self, genotype, ps)
+        if genotype is None and ps is None:
+            return #unpickling; see Ind.__init__
 
         #Note that genetic age needs to be set later
         self.genetic_age = None
@@ -139,6 +147,30 @@ class SynthSolutionStrategy:
         #  that the metric gets emphasized more in the sum of violations
         #  Note that synth.py gives DOCs_metric_name a weight of 10.0
         self.metric_weights = {}
+
+        #checkpoints get written in the background.  Retention: keep the
+        # newest checkpoint_keep_last generations, plus every generation
+        # that is a multiple of checkpoint_keep_every (None = keep all)
+        self.checkpoint_queue_size = 2      #[2, 1 .. 10]
+        self.checkpoint_keep_last = 5       #[5, None or 1 .. 100]
+        self.checkpoint_keep_every = 20     #[20, None or 1 .. 1000]
+
+        #a surrogate (see Surrogate.py), trained on the evaluated inds,
+        # can skip evaluating candidate children that it predicts to be
+        # bad, or to be dominated by both parents (even when given
+        # surrogate_dominance_margin times each metric's scale).  Of the
+        # candidates that it would skip, it still lets through a fraction
+        # of surrogate_exploration_rate.  It only predicts from at least
+        # surrogate_min_num_neighbours evaluated inds of the same topology
+        # within surrogate_bandwidth (where each var is scaled to [0,1]
+        # by the range of those inds).
+        self.use_surrogate = False                 #[False]
+        self.surrogate_exploration_rate = 0.1      #[0.1, 0.0 .. 1.0]
+        self.surrogate_max_prob_bad = 0.9          #[0.9, 0.5 .. 1.0]
+        self.surrogate_screen_dominated = True     #[True]
+        self.surrogate_dominance_margin = 0.05     #[0.05, 0.0 .. 0.5]
+        self.surrogate_bandwidth = 0.1             #[0.1, 0.01 .. 1.0]
+        self.surrogate_min_num_neighbours = 5      #[5, 1 .. 100]
         
     def lowestAllowedAgeLayerOfMigrant(self, genetic_age,
                                        num_active_layers):
@@ -177,6 +209,21 @@ class SynthSolutionStrategy:
         s += '; num_vary_biases=%s' % self.num_vary_biases
         s += '; migration_rate=%.3f' % self.migration_rate
         s += '; metric_weights=%s' % self.metric_weights
+        s += '; checkpoint_queue_size=%d' % self.checkpoint_queue_size
+        s += '; checkpoint_keep_last=%s' % self.checkpoint_keep_last
+        s += '; checkpoint_keep_every=%s' % self.checkpoint_keep_every
+        s += '; use_surrogate=%s' % self.use_surrogate
+        if self.use_surrogate:
+            s += '; surrogate_exploration_rate=%.3f' % \
+                 self.surrogate_exploration_rate
+            s += '; surrogate_max_prob_bad=%.3f' % self.surrogate_max_prob_bad
+            s += '; surrogate_screen_dominated=%s' % \
+                 self.surrogate_screen_dominated
+            s += '; surrogate_dominance_margin=%.3f' % \
+                 self.surrogate_dominance_margin
+            s += '; surrogate_bandwidth=%.3f' % self.surrogate_bandwidth
+            s += '; surrogate_min_num_neighbours=%d' % \
+                 self.surrogate_min_num_neighbours
         s += " /SynthSolutionStrategy}"  
         return s 
 
@@ -196,8 +243,20 @@ class SynthEngine:
         incorporate migrants from (None if not wanted).  Note that
         this may not exist at first, but may get generated over time.  It
         may also be updated on the fly by the Pooler.
+      migration_client -- MigrationClient or None -- if the Pooler of
+        pooled_db_file serves migrants, then migrants come from (and this
+        engine's nondominated inds go to) it, rather than pooled_db_file
       restart_file -- string -- name of state file, where to
         continue a previous run from (None if not wanted)      
+      waveform_store -- WaveformStore -- holds the simulation waveforms
+        of this run, in output_dir/waveforms.db.  Inds only keep
+        references into it.
+      run_store -- RunStore -- holds the saved generations of this run,
+        in output_dir/run.db
+      checkpoint_writer -- CheckpointWriter -- saves generations into
+        run_store from a background thread
+      surrogate -- Surrogate or None -- if ss.use_surrogate, it screens
+        candidate children before they get evaluated
     """
 
     def __init__(self, ps, ss, output_dir, pooled_db_file, restart_file):
@@ -213,16 +272,44 @@ class SynthEngine:
                           restart_file)
                 sys.exit(0)
             
+        #the waveforms of restart inds may live in the output directory
+        # that we are about to clear, so keep them in memory for now
+        if restart_file is not None:
+            for ind in self.state.allInds():
+                ind.loadWaveformsIntoMemory()
+            
         #clear up output directory
         self.output_dir = os.path.abspath(output_dir)
         if self.output_dir[-1] != '/':
             self.output_dir += '/'
+        closeWaveformStore(self.output_dir + 'waveforms.db')
         if os.path.exists(self.output_dir):
             log.warning("Output path '%s' already exists; will rewrite" %
                         self.output_dir)
             shutil.rmtree(self.output_dir)
         os.mkdir(self.output_dir)
 
+        #waveforms go into a per-run store, not onto the inds
+        self.waveform_store = openWaveformStore(self.output_dir +
+                                                'waveforms.db')
+        for ind in self.state.allInds():
+            ind.moveWaveformsToStore(self.waveform_store)
+
+        #generations get appended to a per-run store, in the background
+        self.run_store = RunStore(self.output_dir + 'run.db')
+        self.checkpoint_writer = CheckpointWriter(
+            self.run_store, ss.checkpoint_queue_size,
+            ss.checkpoint_keep_last, ss.checkpoint_keep_every)
+
+        #the surrogate learns from every ind evaluated in this run,
+        # including the restart inds
+        if ss.use_surrogate:
+            self.surrogate = Surrogate(self.state.ps, ss)
+            for ind in self.state.allInds():
+                self.surrogate.addInd(ind)
+        else:
+            self.surrogate = None
+
         #if we had a restart file, we can ensure that its info wasn't lost
         # due to clearing up the output directory
         if restart_file is not None and not os.path.exists(restart_file):
@@ -235,8 +322,12 @@ class SynthEngine:
                "migration rate must be in [0.0, 0.5]"
         if pooled_db_file is None:
             self.pooled_db_file = None
+            self.migration_client = None
         else:
             self.pooled_db_file = os.path.abspath(pooled_db_file)
+            self.migration_client = MigrationClient(
+                migrationInfoFile(self.pooled_db_file))
+        self._pushed_IDs = set()
 
     #for easier reference, make 'ps' and 'ss' look like attributes of self
     def _ps(self):
@@ -260,33 +351,55 @@ class SynthEngine:
         
         @notes
           Some of the files that it generates to output_dir/ are:
-            state_gen0001.db -- init results; ie num generations complete = 1
-            state_gen0002.db -- results when num generations complete = 2
-            state_gen0003.db -- ...
+            run.db -- a RunStore which gets every generation appended:
+              generation 1 is init results (ie num generations complete = 1),
+              generation 2 is results when num generations complete = 2, ...
+              (older generations get pruned according to ss.checkpoint_keep_*)
+            waveforms.db -- a WaveformStore with the simulation waveforms
         """
         log.info("Begin.")
         log.info(self.ps.prettyStr())
         log.info(str(self.ss) + "\n")
 
-        while True:
-            self.run__oneGeneration()
-            self.saveState()
-            if self.doStop():
-                break
-
+        try:
+            while True:
+                self.run__oneGeneration()
+                self.saveState()
+                self.pushFront()
+                if self.doStop():
+                    break
+        finally:
+            #even if the search failed, write out the queued checkpoints,
+            # so that a restart can carry on from the newest one
+            self.checkpoint_writer.close()
         log.info('Done')
 
     def saveState(self):
-        """Auto-generate a state_genXXXX.db filename and save
-        self.state to that file"""
-        gen_str = str(self.state.generation)
-        while len(gen_str) < 4:
-            gen_str = '0' + gen_str
-            
-        output_file = self.output_dir + 'state_gen%s.db' % gen_str
-        self.state.save(output_file)
+        """Queue a snapshot of self.state, to get appended to
+        self.run_store in the background.  Only the inds that were not
+        saved in an earlier generation get written."""
+        self.checkpoint_writer.write(self.state)
         
 
+    def pushFront(self):
+        """Push the nondominated inds that have not been pushed yet to
+        the Pooler's migration server (if there is one)"""
+        if self.migration_client is None: return
+        if self.ss.migration_rate == 0.0: return
+        if not self.migration_client.serverExists(): return
+
+        inds = [ind for ind in self.state.paretoArchive().front()
+                if ind.ID not in self._pushed_IDs]
+        if not inds: return
+        try:
+            self.migration_client.pushInds(inds, self.ss)
+        except IOError, e:
+            log.warning('Could not push inds to migration server: %s' % e)
+            return
+        self._pushed_IDs.update([ind.ID for ind in inds])
+        log.info('Pushed %d nondominated inds to migration server' %
+                 len(inds))
+
     def run__oneGeneration(self):
         """
         @description
@@ -343,6 +456,7 @@ class SynthEngine:
         #-and then we will not have enough individuals in layer 0 for the
         # next round of selection etc.
         migrants = self.retrieveMigrants()
+        self.state.paretoArchive().addInds(migrants)
         for migrant in migrants:
             age_layer_i = self.ss.lowestAllowedAgeLayerOfMigrant( \
                 migrant.genetic_age, R_per_age_layer.numAgeLayers())
@@ -464,14 +578,14 @@ class SynthEngine:
 
         #add from layer i-1
         if age_layer_i > 0:
-            tabu_perfs = [cand_parent.worstCaseMetricValuesStr()
-                          for cand_parent in cand_parents]
+            tabu_perfs = set([cand_parent.performanceKey()
+                              for cand_parent in cand_parents])
             R1 = R_per_age_layer[age_layer_i-1]
             for ind in R1:
-                ind_str = ind.worstCaseMetricValuesStr()
-                if ind_str not in tabu_perfs:
+                ind_perf = ind.performanceKey()
+                if ind_perf not in tabu_perfs:
                     cand_parents.append(ind)
-                    tabu_perfs.append(ind_str)
+                    tabu_perfs.add(ind_perf)
             log.debug('From age layer %d, %d/%d inds are candidate parents' %
                       (age_layer_i-1, len(cand_parents) - num_from_layer_i,
                        len(R1)))
@@ -546,7 +660,8 @@ class SynthEngine:
     def retrieveMigrants(self):
         """
         @description
-          Retrieve some migrants chosen from the 'pooled_db' file,
+          Retrieve some migrants from the Pooler's migration server if
+          it is running, otherwise chosen from the 'pooled_db' file,
           if they exist.  
         
         @arguments
@@ -554,43 +669,71 @@ class SynthEngine:
         
         @return
           migrants -- list of Ind -- some migrants
+
+        @notes
+          The migrants' waveforms get copied into this run's waveform
+          store, because the store of the run they came from may get
+          cleared at any time.
         """
+        migrants = self._loadMigrants()
+        for migrant in migrants:
+            migrant.moveWaveformsToStore(self.waveform_store)
+        return migrants
+
+    def _loadMigrants(self):
+        """Returns some migrants; see retrieveMigrants()"""
         #corner cases: not interested in migration
         if self.pooled_db_file is None: return []
         if self.ss.migration_rate == 0.0: return []
 
+        #choose num_migrants based on num_inds_per_age_layer and migration_rate
+        N = self.ss.num_inds_per_age_layer
+        min_num_migrants = 1
+        max_num_migrants = N / 2
+        num_migrants = int(self.ss.migration_rate * N)
+        num_migrants = max(min_num_migrants,min(max_num_migrants,num_migrants))
+
+        #preferred case: ask the migration server for just the migrants
+        if self.migration_client.serverExists():
+            try:
+                migrants = self.migration_client.getMigrants(self.ps,
+                                                             num_migrants)
+                log.info('Retrieved %d migrants from migration server' %
+                         len(migrants))
+                return migrants
+            except IOError, e:
+                log.warning('Could not get migrants from migration server '
+                            '(%s), so try pooled_db file' % e)
+
         #corner case: no pooled db file exists
         # (though it may exist at other times in the run of this engine)
         if not os.path.exists(self.pooled_db_file): return []
 
         #main case...
 
-        #try to load candidate migrants
+        #try to load candidate migrants; just their metric values for now
         #-this may fail if we are in conflict with another process
         # trying to access the pooled DB file.  No problem, just
         # do it another time
         try:
-            pooled_state = loadSynthState(self.pooled_db_file, self.ps)
-            cand_migrants = pooled_state.allInds()
+            cand_migrants = loadIndSummaries(self.pooled_db_file, self.ps)
         except:
             log.warning('Could not open pooled_db file for migration')
             return []
 
-        #choose num_migrants based on num_inds_per_age_layer and migration_rate
-        N = self.ss.num_inds_per_age_layer
-        min_num_migrants = 1
-        max_num_migrants = N / 2
-        num_migrants = int(self.ss.migration_rate * N)
-        num_migrants = max(min_num_migrants,min(max_num_migrants,num_migrants))
-
         #unique-ify cand_migrants
         cand_migrants = uniqueIndsByPerformance(cand_migrants)
 
-        #choose migrants
+        #choose migrants, and only load those in full
         if len(cand_migrants) <= num_migrants:
             migrants = cand_migrants
         else:
             migrants = random.sample(cand_migrants, num_migrants)
+        try:
+            migrants = [summary.load() for summary in migrants]
+        except:
+            log.warning('Could not load migrants from pooled_db file')
+            return []
 
         log.info('From %d candidate migrants, retrieving %d for pop' %
                  (len(cand_migrants), len(migrants)))
@@ -641,8 +784,8 @@ class SynthEngine:
             elif ind_a.distance > ind_b.distance:  parents.append(ind_a)
             else:                                  parents.append(ind_b)
 
-        #
-        tabu_perfs = [ind.worstCaseMetricValuesStr() for ind in P]
+        #children may not duplicate the performance of any parent
+        tabu_perfs = set([ind.performanceKey() for ind in P])
 
         #with parents, generate children via variation
         Q = []
@@ -663,13 +806,13 @@ class SynthEngine:
                          self.varyParentsToGetGoodChildren(par1, par2,
                                                            tabu_perfs, s_Q)
                 if success:
-                    child1_perf = child1.worstCaseMetricValuesStr()
-                    child2_perf = child2.worstCaseMetricValuesStr()
+                    child1_perf = child1.performanceKey()
+                    child2_perf = child2.performanceKey()
                     assert child1_perf != child2_perf
                     assert child1_perf not in tabu_perfs
                     assert child2_perf not in tabu_perfs
-                    tabu_perfs.append(child1_perf)
-                    tabu_perfs.append(child2_perf)
+                    tabu_perfs.add(child1_perf)
+                    tabu_perfs.add(child2_perf)
                     break
                 else:
                     log.debug("Since unsuccessful in vary(), reloop: %s" % s_Q)
@@ -782,6 +925,11 @@ class SynthEngine:
         for nondom_layer_i, nondom_layer_inds in enumerate(F):
             s += ' %2d' % len(nondom_layer_inds)
             if nondom_layer_i+1 < len(F): s += ','
+
+        s += '; #inds_in_global_front=%d' % len(state.paretoArchive())
+
+        if self.surrogate is not None:
+            s += '; %s' % self.surrogate
         
         
         log.info(s)
@@ -830,7 +978,7 @@ class SynthEngine:
         @notes
           Currently has no provisions to avoid infinite loop!
         """
-        inds, tabu_netlists, tabu_perfs = [], [], []
+        inds, tabu_netlists, tabu_perfs = [], [], set()
         num_tries = 0
         inf = float('Inf')
         for i in range(target_num_good):
@@ -842,10 +990,11 @@ class SynthEngine:
                 self.state.tot_num_inds += 1
                 
                 self.evalInd(ind)
+                self._trainSurrogate(ind)
                 
                 if ind.isBad():
                     log.info("Don't keep random ind because it is Bad")
-                elif ind.worstCaseMetricValuesStr() in tabu_perfs:
+                elif ind.performanceKey() in tabu_perfs:
                     log.info("Don't keep random ind because perfs. aren't"
                              " unique")
                 else:
@@ -853,7 +1002,7 @@ class SynthEngine:
                     log.debug('  %s' % ind)
                     inds.append(ind)
                     tabu_netlists.append(ind.netlist())
-                    tabu_perfs.append(ind.worstCaseMetricValuesStr())
+                    tabu_perfs.add(ind.performanceKey())
                     break
         return inds
 
@@ -923,11 +1072,25 @@ class SynthEngine:
                     return
                     
         log.info("This ind evaluates to 'good'.")
+        self.state.paretoArchive().add(ind)
         #log.debug(' unscaled_point:  %s', ind.genotype.unscaled_opt_point)
         pm = self.ps.embedded_part.part.point_meta
         scaled_point = pm.scale(ind.genotype.unscaled_opt_point)
         log.debug('  scaled_point:  %s', scaled_point)
 
+    def _worthEvaluating(self, cand_child, par1, par2):
+        """Returns False if the surrogate screens out 'cand_child' (which
+        came from par1 and par2), ie if evaluating it is likely wasted.
+        Always True if there is no surrogate."""
+        if self.surrogate is None:
+            return True
+        return self.surrogate.screen(cand_child, [par1, par2])
+
+    def _trainSurrogate(self, ind):
+        """Trains the surrogate (if any) on the just-evaluated 'ind'"""
+        if self.surrogate is not None:
+            self.surrogate.addInd(ind)
+
     def evalIndAtAnalysisEnvPoint(self, ind, analysis, env_point):
         """
         @description
@@ -999,6 +1162,7 @@ class SynthEngine:
             assert sorted(sim_results.keys()) == sorted(target_metrics)
             ind.setSimResults(sim_results, analysis, env_point,
                               waveforms_per_ext)
+            ind.moveWaveformsToStore(self.waveform_store)
             
         else:
             raise AssertionError("Unknown analysis class: %s" %
@@ -1009,7 +1173,8 @@ class SynthEngine:
 
     def varyParentsToGetGoodChildren(self, par1, par2, tabu_perfs,
                                      status_str,
-                                     max_num_rounds=500):
+                                     max_num_rounds=500,
+                                     max_num_screened_rounds=500):
         """
         @description
           Varies par1 and par2 via mutation or crossover, and returns two
@@ -1018,54 +1183,67 @@ class SynthEngine:
 
           A new child is only accepted if:
           -its netlist is different than both parents
+          -(if there is a surrogate) the surrogate deems it worth
+           evaluating; otherwise it is not even evaluated
           -its simulation results are not 'bad'
-          -its 'nice' metric string is different either parent's string,
-           and different than any string in the input 'tabu_perfs'
+          -its performanceKey() is different than either parent's key,
+           and different than any key in the input 'tabu_perfs'
          
         @arguments
           par1 -- Ind -- first parent
           par2 -- Ind -- second parent
           
-          tabu_perfs -- list of string -- the children cannot duplicate
-            these
+          tabu_perfs -- set of performanceKey() -- the children cannot
+            duplicate these
           status_str -- string -- output this string as part of each round,
             to help the user see where we are in the search
           max_num_rounds -- int -- number of rounds at generating
-            children.  If this is exceeded, stops and returns success=False.
+            children that evaluated at least one child.  If this is
+            exceeded, stops and returns success=False.
+          max_num_screened_rounds -- int -- number of rounds where the
+            surrogate deemed no child worth evaluating.  If this is
+            exceeded, stops and returns success=False.
         
         @return
           success -- bool -- True if two children were generated with
-            fewer than 'max_num_rounds'
+            fewer than 'max_num_rounds' (and 'max_num_screened_rounds')
           child1 -- Ind or None -- offspring #1 (None if unsuccessful)
           child2 -- Ind or None -- offsprign #2 (None if unsuccessful)
         """
         log.debug('Vary parents to get two good, unique children: begin')
         
         child1, child2 = None, None
-        child_perfs = []
-        par1_perf = par1.worstCaseMetricValuesStr()
-        par2_perf = par2.worstCaseMetricValuesStr()
+        child_perfs = set()
+        par1_perf = par1.performanceKey()
+        par2_perf = par2.performanceKey()
 
         vary_round = 0
+        screened_round = 0
         init_num_inds = self.state.tot_num_inds
         while child1 is None or child2 is None:
-            vary_round += 1
-            if vary_round > max_num_rounds:
+            if vary_round >= max_num_rounds:
                 log.debug('Max # rounds of %d is exceeded, so return '
-                          'without success')
+                          'without success' % max_num_rounds)
+                return False, None, None
+            if screened_round >= max_num_screened_rounds:
+                log.debug('Max # screened rounds of %d is exceeded, so '
+                          'return without success' % max_num_screened_rounds)
                 return False, None, None
             
             log.debug('Vary parents: round #%d, tot_num_inds=%d [%s]'%\
-                      (vary_round, self.state.tot_num_inds, status_str))
+                      (vary_round + 1, self.state.tot_num_inds, status_str))
 
             #note: _varyParents gives children with netlists that are
             # different than either parent's netlist
             (cand_child1, cand_child2) = self._varyParents(par1, par2)
+            num_inds_before_round = self.state.tot_num_inds
 
-            if child1 is None:
+            if child1 is None and \
+                   self._worthEvaluating(cand_child1, par1, par2):
                 self.evalInd(cand_child1)
+                self._trainSurrogate(cand_child1)
                 self.state.tot_num_inds += 1
-                child1_perf = cand_child1.worstCaseMetricValuesStr()
+                child1_perf = cand_child1.performanceKey()
                 perfs_same = child1_perf == par1_perf or \
                              child1_perf == par2_perf or \
                              child1_perf in child_perfs or \
@@ -1076,13 +1254,15 @@ class SynthEngine:
                     log.info('Do not keep cand_child1 b/c perf. not unique')
                 else:
                     child1 = cand_child1
-                    child_perfs.append(child1_perf)
+                    child_perfs.add(child1_perf)
                     log.info("Success: keep cand_child1")
 
-            if child2 is None:
+            if child2 is None and \
+                   self._worthEvaluating(cand_child2, par1, par2):
                 self.evalInd(cand_child2)
+                self._trainSurrogate(cand_child2)
                 self.state.tot_num_inds += 1
-                child2_perf = cand_child2.worstCaseMetricValuesStr()
+                child2_perf = cand_child2.performanceKey()
                 perfs_same = child2_perf == par1_perf or \
                              child2_perf == par2_perf or \
                              child2_perf in child_perfs or \
@@ -1093,8 +1273,15 @@ class SynthEngine:
                     log.info('Do not keep cand_child2 b/c perf. not unique')
                 else:
                     child2 = cand_child2
-                    child_perfs.append(child2_perf)
+                    child_perfs.add(child2_perf)
                     log.info("Success: keep cand_child2")  
+
+            #rounds where the surrogate screened out every candidate did
+            # not cost an evaluation, so they have their own budget
+            if self.state.tot_num_inds > num_inds_before_round:
+                vary_round += 1
+            else:
+                screened_round += 1
             
         log.info('Success: took %d ind evals to generate 2 unique children' %
                  (self.state.tot_num_inds - init_num_inds))
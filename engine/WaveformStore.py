@@ -0,0 +1,269 @@
+"""
+A WaveformStore keeps simulation waveforms outside of the Inds, in one
+append-only, memory-mapped file per run.  Inds only keep a small
+WaveformRef per waveforms array, so that pickled states stay small
+and waveforms get read in lazily (and only if needed).
+
+A ref can outlive its store, e.g. when a migrant's engine restarts and
+clears its output dir.  Each store has a random ID, which its refs hold,
+so reading through a stale ref raises IOError rather than returning the
+data of a newer store at the same file.
+"""
+
+import binascii
+import os
+
+import numpy
+
+import logging
+log = logging.getLogger('synth')
+
+#all waveforms are stored as little-endian float64
+WAVEFORM_DTYPE = numpy.dtype('<f8')
+
+class WaveformRef:
+    """
+    @description
+      A reference to one 2d waveforms array inside a WaveformStore.
+
+    @attributes
+      store_file -- string -- absolute name of the store's data file
+      offset -- int -- where the array starts, in # values (not bytes)
+      shape -- tuple of (# waveforms, # points per waveform)
+      store_ID -- string or None -- ID of the store (see WaveformStore);
+        None means 'do not check'
+    """
+    def __init__(self, store_file, offset, shape, store_ID=None):
+        self.store_file = store_file
+        self.offset = offset
+        self.shape = shape
+        self.store_ID = store_ID
+
+    def load(self):
+        """Returns the referenced waveforms array (read-only, memory-mapped).
+        Raises IOError if the store is not available anymore."""
+        return openWaveformStore(self.store_file).read(self)
+
+    def __str__(self):
+        s = "WaveformRef={"
+        s += ' store_file=%s' % self.store_file
+        s += '; offset=%d' % self.offset
+        s += '; shape=%s' % str(self.shape)
+        s += " /WaveformRef}"
+        return s
+
+class WaveformStore:
+    """
+    @description
+      Append-only store of waveforms arrays, keyed by
+      (ind ID, analysis ID, env point ID, file extension).
+
+    @attributes
+      store_file -- string -- absolute name of the data file, which holds
+        the raw values of every array one after the other
+      index_file -- string -- store_file + '.idx'; an ascii file that
+        starts with a 'store_ID <ID>' line, then has one line per array:
+        'ind_ID analysis_ID env_point_ID extension offset num_rows
+        num_columns'
+      _data_f, _index_f -- file objects used for appending (opened lazily)
+      _store_ID -- string or None -- random ID, given when the store's
+        files get created (None until read; and for stores from before
+        IDs existed)
+      _file_ID -- (st_dev, st_ino) of the data file that _map and
+        _store_ID are of, to notice when the file got re-created
+      _map -- numpy.memmap of the data file (None until first read;
+        re-mapped when the file has grown past it)
+      _index -- dict of (ind_ID, analysis_ID, env_point_ID) :
+        dict of extension : WaveformRef (None until first lookup)
+
+    @notes
+      Data is always written before its index line, so a reader never
+      sees an index entry pointing to partially-written data.
+    """
+    def __init__(self, store_file):
+        """
+        @arguments
+          store_file -- string -- name of the data file.  It is created
+            if it does not exist yet, and appended to otherwise.
+
+        @return
+          WaveformStore object
+        """
+        self.store_file = os.path.abspath(store_file)
+        self.index_file = self.store_file + '.idx'
+        self._data_f = None
+        self._index_f = None
+        self._store_ID = None
+        self._file_ID = None
+        self._map = None
+        self._index = None
+
+    def append(self, ind_ID, analysis_ID, env_point_ID, waveforms_per_ext):
+        """
+        @description
+          Appends the waveforms arrays of one (ind, analysis, env_point).
+
+        @arguments
+          ind_ID -- int
+          analysis_ID -- int
+          env_point_ID -- int
+          waveforms_per_ext -- dict of extension_str : 2d_waveforms_array
+
+        @return
+          refs_per_ext -- dict of extension_str : WaveformRef
+        """
+        if self._data_f is None:
+            self._openForAppend()
+
+        self._data_f.seek(0, 2)
+        refs_per_ext = {}
+        index_lines = []
+        for ext, waveforms_array in waveforms_per_ext.items():
+            X = numpy.asarray(waveforms_array, dtype=WAVEFORM_DTYPE)
+            assert len(X.shape) == 2, "expect a 2d waveforms array"
+            offset = self._data_f.tell() / WAVEFORM_DTYPE.itemsize
+            self._data_f.write(X.tostring())
+            refs_per_ext[ext] = WaveformRef(self.store_file, offset, X.shape,
+                                            self._store_ID)
+            index_lines.append('%d %d %d %s %d %d %d\n' %
+                               (ind_ID, analysis_ID, env_point_ID, ext,
+                                offset, X.shape[0], X.shape[1]))
+        self._data_f.flush()
+        self._index_f.write(''.join(index_lines))
+        self._index_f.flush()
+
+        if self._index is not None:
+            self._index[(ind_ID, analysis_ID, env_point_ID)] = refs_per_ext
+        return refs_per_ext
+
+    def read(self, ref):
+        """
+        @description
+          Returns the waveforms array that 'ref' points to.  It's a
+          read-only view into the memory-mapped data file, so no
+          data is actually read until it is accessed.
+        """
+        if not self.holds(ref):
+            raise IOError("waveform store %s does not hold %s (anymore)" %
+                          (self.store_file, ref))
+        num_values = ref.shape[0] * ref.shape[1]
+        if self._map is None or ref.offset + num_values > len(self._map):
+            if self._data_f is not None:
+                self._data_f.flush()
+            self._map = numpy.memmap(self.store_file, dtype=WAVEFORM_DTYPE,
+                                     mode='r')
+            if ref.offset + num_values > len(self._map):
+                raise IOError("waveform store %s is too short for %s" %
+                              (self.store_file, ref))
+        X = self._map[ref.offset : ref.offset + num_values]
+        return X.reshape(ref.shape)
+
+    def holds(self, ref):
+        """Returns True if 'ref' points into this store, ie its store
+        file still exists and is the same one that 'ref' was made in"""
+        if ref.store_file != self.store_file:
+            return False
+        try:
+            stat = os.stat(self.store_file)
+        except OSError:
+            return False
+        file_ID = (stat.st_dev, stat.st_ino)
+        if file_ID != self._file_ID:
+            #new (or re-created) file: forget what we knew about the old one
+            self._file_ID = file_ID
+            self._map = None
+            self._store_ID = self._readStoreID()
+        ref_store_ID = getattr(ref, 'store_ID', None)
+        return ref_store_ID is None or ref_store_ID == self._store_ID
+
+    def lookup(self, ind_ID, analysis_ID, env_point_ID):
+        """
+        @description
+          Returns the waveforms stored for (ind_ID, analysis_ID, env_point_ID)
+          as a dict of extension_str : 2d_waveforms_array, or None if
+          there are none.  Useful for tools that do not have the Ind itself.
+        """
+        if self._index is None:
+            self._index = self._readIndex()
+        refs_per_ext = self._index.get((ind_ID, analysis_ID, env_point_ID))
+        if refs_per_ext is None:
+            return None
+        return dict([(ext, self.read(ref))
+                     for ext, ref in refs_per_ext.items()])
+
+    def close(self):
+        """Close any open file handles and memory maps"""
+        if self._data_f is not None:
+            self._data_f.close()
+            self._index_f.close()
+            self._data_f = self._index_f = None
+        self._map = None
+        self._file_ID = None
+
+    def _openForAppend(self):
+        """Opens the data and index files for appending; a new store
+        gets a new ID"""
+        is_new = not os.path.exists(self.index_file) or \
+                 os.path.getsize(self.index_file) == 0
+        self._data_f = open(self.store_file, 'ab')
+        self._index_f = open(self.index_file, 'a')
+        if is_new:
+            self._store_ID = binascii.hexlify(os.urandom(8))
+            self._index_f.write('store_ID %s\n' % self._store_ID)
+            self._index_f.flush()
+        else:
+            self._store_ID = self._readStoreID()
+        stat = os.fstat(self._data_f.fileno())
+        self._file_ID = (stat.st_dev, stat.st_ino)
+
+    def _readStoreID(self):
+        """Returns the ID in the first line of self.index_file, or None"""
+        try:
+            f = open(self.index_file, 'r')
+        except IOError:
+            return None
+        tokens = f.readline().split()
+        f.close()
+        if len(tokens) == 2 and tokens[0] == 'store_ID':
+            return tokens[1]
+        return None
+
+    def _readIndex(self):
+        """Returns dict of (ind_ID, analysis_ID, env_point_ID) :
+        dict of extension : WaveformRef, as read from self.index_file"""
+        index = {}
+        if not os.path.exists(self.index_file):
+            return index
+        store_ID = self._readStoreID()
+        f = open(self.index_file, 'r')
+        for line in f:
+            tokens = line.split()
+            if len(tokens) != 7: #e.g. a line still being written
+                continue
+            ind_ID, an_ID, env_ID = [long(token) for token in tokens[:3]]
+            ext = tokens[3]
+            offset, num_rows, num_columns = [int(t) for t in tokens[4:]]
+            key = (ind_ID, an_ID, env_ID)
+            if not index.has_key(key):
+                index[key] = {}
+            index[key][ext] = WaveformRef(self.store_file, offset,
+                                          (num_rows, num_columns), store_ID)
+        f.close()
+        return index
+
+#one WaveformStore per store file, shared within this process
+_stores_per_file = {}
+
+def openWaveformStore(store_file):
+    """Returns the WaveformStore for 'store_file', creating it if needed"""
+    store_file = os.path.abspath(store_file)
+    if not _stores_per_file.has_key(store_file):
+        _stores_per_file[store_file] = WaveformStore(store_file)
+    return _stores_per_file[store_file]
+
+def closeWaveformStore(store_file):
+    """Closes and forgets the WaveformStore for 'store_file' (if open)"""
+    store_file = os.path.abspath(store_file)
+    if _stores_per_file.has_key(store_file):
+        _stores_per_file[store_file].close()
+        del _stores_per_file[store_file]
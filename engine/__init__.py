@@ -3,8 +3,10 @@ from Ind import Genotype, Ind
 from Pooler import PoolerStrategy, Pooler
 from EngineUtils import AgeLayeredPop, \
      uniqueIndsByPerformance, populationSummaryStr, \
-     SynthState, loadSynthState, \
+     SynthState, loadSynthState, RunStore, \
+     IndSummary, iterInds, loadIndSummaries, findInd, loadSynthStateHeader, \
      minMaxMetrics, \
      fastNondominatedSort, \
      Deb_fastNondominatedSort, \
      numIndsInNestedPop
+from ResultsCatalog import ResultsCatalog, buildResultsCatalog
@@ -0,0 +1,94 @@
+import unittest
+
+import os
+
+from adts import *
+from engine.EngineUtils import AgeLayeredPop, SynthState, RunStore, \
+     loadSynthState
+from engine.CheckpointWriter import CheckpointWriter
+from EngineUtils_test import twoMetricsPS, indsFromResAndPS
+
+class CheckpointWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+        self.db_file = 'test_checkpoints.db'
+        if os.path.exists(self.db_file):
+            os.remove(self.db_file)
+
+    def testGenerationsToKeep(self):
+        if self.just1: return
+        writer = CheckpointWriter(RunStore(self.db_file), 1, 2, 3)
+        self.assertEqual(writer.generationsToKeep(range(1, 11)),
+                         [3, 6, 9, 10])
+        self.assertEqual(writer.generationsToKeep([1]), [1])
+        writer.close()
+
+        writer = CheckpointWriter(RunStore(self.db_file), 1, None, 3)
+        self.assertEqual(writer.generationsToKeep([2, 1, 3]), [1, 2, 3])
+        writer.close()
+
+    def testWriteAndRetain(self):
+        if self.just1: return
+        ps = twoMetricsPS(1.5, 10.0)
+        inds = indsFromResAndPS([(i, i) for i in range(10)], ps)
+
+        writer = CheckpointWriter(RunStore(self.db_file), 10, 2, 3)
+        state = SynthState(ps, None, AgeLayeredPop([]))
+        for gen in range(1, 9):
+            #each generation keeps the previous gen's last ind, adds one more
+            state.R_per_age_layer = AgeLayeredPop([inds[gen-1:gen+1]])
+            state.generation = gen
+            writer.write(state)
+        #changing the state after write() must not affect what gets written
+        state.R_per_age_layer[0].append(inds[9])
+        writer.close()
+
+        self.assertEqual(RunStore(self.db_file).generations(), [3, 6, 7, 8])
+        for gen in [3, 6, 7, 8]:
+            loaded = loadSynthState(self.db_file, ps, gen)
+            self.assertEqual([ind.ID for ind in loaded.allInds()],
+                             [inds[gen-1].ID, inds[gen].ID])
+
+        #compacting dropped the inds that no kept generation refers to
+        f = open(self.db_file, 'rb')
+        records, end_offset = RunStore(self.db_file)._scan(f)
+        f.close()
+        self.assertEqual(len([rec for rec in records if rec[0] == 'i']), 6)
+        self.assertFalse(os.path.exists(self.db_file + '.tmp'))
+
+    def testWriteWhenBehind(self):
+        if self.just1: return
+        #with room for just 1 queued snapshot, the writer falls behind;
+        # then write() waits, rather than dropping a generation
+        ps = twoMetricsPS(1.5, 10.0)
+        inds = indsFromResAndPS([(i, i) for i in range(6)], ps)
+        writer = CheckpointWriter(RunStore(self.db_file), 1, None, None)
+        state = SynthState(ps, None, AgeLayeredPop([]))
+        for gen in range(1, 6):
+            state.R_per_age_layer = AgeLayeredPop([inds[gen-1:gen+1]])
+            state.generation = gen
+            writer.write(state)
+        writer.close()
+        self.assertEqual(RunStore(self.db_file).generations(), range(1, 6))
+
+    def testSaveIsAtomic(self):
+        if self.just1: return
+        ps = twoMetricsPS(1.5, 10.0)
+        inds = indsFromResAndPS([(1, 2)], ps)
+        state = SynthState(ps, None, AgeLayeredPop([inds]))
+        state.save(self.db_file)
+        self.assertFalse(os.path.exists(self.db_file + '.tmp'))
+        self.assertEqual(len(loadSynthState(self.db_file, ps).allInds()), 1)
+
+    def tearDown(self):
+        if os.path.exists(self.db_file):
+            os.remove(self.db_file)
+
+if __name__ == '__main__':
+
+    import logging
+    logging.basicConfig()
+    logging.getLogger('synth').setLevel(logging.DEBUG)
+
+    unittest.main()
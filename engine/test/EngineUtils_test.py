@@ -1,5 +1,6 @@
 import unittest
 
+import os
 import random
 
 #FIXME: unit tests for EngineUtils still need to be written!
@@ -193,7 +194,123 @@ class EngineUtilsTest(unittest.TestCase):
             
     def testUniqueIndsByPerformance(self):
         if self.just1: return
-        pass
+
+        #inds 1 and 3 duplicate 0; ind 4 duplicates 2 after '%g' rounding
+        res = [(2,1), (2,1), (3,4), (2,1), (3.0000001,4), (1,5)]
+        ps = twoMetricsPS(1.5, 10.0)
+        inds = indsFromResAndPS(res, ps)
+
+        unique_inds = uniqueIndsByPerformance(inds)
+        self.assertEqual([ind.ID for ind in unique_inds],
+                         [inds[0].ID, inds[2].ID, inds[5].ID])
+
+        #order of first occurrence is kept
+        unique_inds = uniqueIndsByPerformance(list(reversed(inds)))
+        self.assertEqual([ind.ID for ind in unique_inds],
+                         [inds[5].ID, inds[4].ID, inds[3].ID])
+
+        self.assertEqual(uniqueIndsByPerformance([]), [])
+
+    def testRunStore(self):
+        if self.just1: return
+
+        ps = twoMetricsPS(1.5, 10.0)
+        inds = indsFromResAndPS([(2,1), (3,4), (1,5), (4,4)], ps)
+        db_file = 'test_runstore.db'
+        if os.path.exists(db_file): os.remove(db_file)
+
+        #gen 1 has inds 0,1; gen 2 keeps ind 1 (in two layers) and adds 2,3
+        state = SynthState(ps, None, AgeLayeredPop([inds[:2]]))
+        state.generation = 1
+        state.tot_num_inds = 2
+        store = RunStore(db_file)
+        store.appendGeneration(state)
+        size_after_gen1 = os.path.getsize(db_file)
+        
+        state.R_per_age_layer = AgeLayeredPop([[inds[1], inds[2]],
+                                               [inds[1], inds[3]]])
+        state.generation = 2
+        state.tot_num_inds = 4
+        store.appendGeneration(state)
+        store.close()
+
+        self.assertTrue(isRunStoreFile(db_file))
+        self.assertEqual(RunStore(db_file).generations(), [1, 2])
+
+        #only the new inds got written in gen 2
+        f = open(db_file, 'rb')
+        records, end_offset = RunStore(db_file)._scan(f)
+        f.close()
+        self.assertEqual([rec_type for (rec_type, key, offset) in records],
+                         ['i', 'i', 'g', 'i', 'i', 'g'])
+        self.assertEqual(end_offset, os.path.getsize(db_file))
+
+        #any generation can be rebuilt
+        state1 = loadSynthState(db_file, ps, 1)
+        self.assertEqual(state1.generation, 1)
+        self.assertEqual(state1.tot_num_inds, 2)
+        self.assertEqual([[ind.ID for ind in R] for R in state1.R_per_age_layer],
+                         [[inds[0].ID, inds[1].ID]])
+        
+        state2 = loadSynthState(db_file, ps)
+        self.assertEqual(state2.generation, 2)
+        self.assertEqual([[ind.ID for ind in R] for R in state2.R_per_age_layer],
+                         [[inds[1].ID, inds[2].ID], [inds[1].ID, inds[3].ID]])
+        for ind, loaded_ind in zip([inds[1], inds[2], inds[1], inds[3]],
+                                   state2.allInds()):
+            self.assertTrue(loaded_ind._ps is ps)
+            self.assertEqual(loaded_ind.performanceKey(), ind.performanceKey())
+        self.assertFalse(state2.R_per_age_layer[0][0] is
+                         state2.R_per_age_layer[1][0])
+
+        self.assertRaises(ValueError, loadSynthState, db_file, ps, 3)
+
+        #inds can be streamed, summarized (metrics only), or found by ID
+        self.assertEqual([ind.ID for ind in iterInds(db_file, ps, 1)],
+                         [inds[0].ID, inds[1].ID])
+        summaries = loadIndSummaries(db_file, ps)
+        self.assertEqual([summary.ID for summary in summaries],
+                         [inds[1].ID, inds[2].ID, inds[1].ID, inds[3].ID])
+        self.assertEqual(summaries[1].worst_case_metric_values,
+                         inds[2].worstCaseMetricValues())
+        self.assertEqual(summaries[1].performanceKey(),
+                         inds[2].performanceKey())
+        self.assertEqual(len(uniqueIndsByPerformance(summaries)), 3)
+        loaded_ind = summaries[3].load()
+        self.assertEqual(loaded_ind.ID, inds[3].ID)
+        self.assertTrue(loaded_ind._ps is ps)
+        
+        self.assertEqual(findInd(db_file, ps, inds[2].ID).performanceKey(),
+                         inds[2].performanceKey())
+        self.assertEqual(findInd(db_file, ps, inds[2].ID, 1), None)
+        self.assertEqual(findInd(db_file, ps, inds[0].ID, 1).ID, inds[0].ID)
+
+        #a partially-written record (e.g. from a crash) is ignored by
+        # readers, and cut off by the next writer
+        f = open(db_file, 'ab')
+        f.write('i' + 'junk')
+        f.close()
+        self.assertEqual(RunStore(db_file).generations(), [1, 2])
+        state.generation = 3
+        store = RunStore(db_file)
+        store.appendGeneration(state)
+        store.close()
+        self.assertEqual(RunStore(db_file).generations(), [1, 2, 3])
+        self.assertEqual(len(loadSynthState(db_file, ps, 3).allInds()), 4)
+
+        #the original inds are untouched
+        self.assertTrue(inds[0]._ps is ps)
+
+        #summaries refuse to load from a file that replaced theirs
+        summaries = loadIndSummaries(db_file, ps)
+        self.assertEqual(summaries[0].load().ID, inds[1].ID)
+        state.save(db_file)
+        self.assertRaises(IOError, summaries[0].load)
+        self.assertEqual(RunStore(db_file).generations(), [3])
+        self.assertEqual(loadIndSummaries(db_file, ps)[0].load().ID,
+                         inds[1].ID)
+        
+        os.remove(db_file)
         
     def tearDown(self):
         pass
@@ -0,0 +1,121 @@
+import unittest
+
+import random
+
+from adts import *
+from engine.EngineUtils import fastNondominatedSort, minMaxMetrics
+from engine.EpsilonArchive import EpsilonArchive, goodnessesDominate, \
+     metricScale, thresholdEpsilons
+from EngineUtils_test import twoMetricsPS, indsFromResAndPS
+
+class EpsilonArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+
+        #metric 0 is maximize past 1.5; metric 1 is minimize past 10.0
+        # -so with rel_epsilon=0.1, boxes are 0.15 by 1.0
+        self.ps = twoMetricsPS(1.5, 10.0)
+        [self.name0, self.name1] = self.ps.flattenedMetricNames()
+        self.epsilons = thresholdEpsilons(self.ps, 0.1)
+
+    def _IDs(self, inds):
+        return sorted([ind.ID for ind in inds])
+
+    def testEpsilons(self):
+        if self.just1: return
+        [metric0, metric1] = self.ps.flattenedMetrics()
+        self.assertEqual(metricScale(metric0), 1.5)
+        self.assertEqual(metricScale(metric1), 10.0)
+        self.assertAlmostEqual(self.epsilons[self.name0], 0.15)
+        self.assertAlmostEqual(self.epsilons[self.name1], 1.0)
+
+        self.assertRaises(ValueError, EpsilonArchive, self.ps, 10,
+                          {self.name0:0.1})
+
+    def testGoodnessesDominate(self):
+        if self.just1: return
+        self.assertTrue(goodnessesDominate([2.0, 1.0], [1.0, 1.0]))
+        self.assertFalse(goodnessesDominate([1.0, 1.0], [2.0, 1.0]))
+        self.assertFalse(goodnessesDominate([1.0, 1.0], [1.0, 1.0]))
+        self.assertFalse(goodnessesDominate([2.0, 0.0], [1.0, 1.0]))
+
+    def testDominance(self):
+        if self.just1: return
+        inds = indsFromResAndPS([(3.0, 5.5), (3.05, 5.2), (2.0, 1.5),
+                                 (2.5, 5.5), (4.0, 8.5), (5.0, 1.2)], self.ps)
+        archive = EpsilonArchive(self.ps, 10, self.epsilons)
+        self.assertTrue(archive.add(inds[0]))
+        self.assertFalse(archive.add(inds[0]))
+
+        #same box: the ind closer to the box's best corner wins
+        self.assertTrue(archive.add(inds[1]))
+        self.assertEqual(self._IDs(archive.inds()), [inds[1].ID])
+        self.assertFalse(archive.add(inds[0]))
+
+        #nondominated boxes get added; a dominated box does not
+        self.assertTrue(archive.add(inds[2]))
+        self.assertFalse(archive.add(inds[3]))
+        self.assertTrue(archive.add(inds[4]))
+        self.assertEqual(self._IDs(archive.inds()),
+                         self._IDs([inds[1], inds[2], inds[4]]))
+
+        #a box that dominates all others evicts them
+        self.assertTrue(archive.add(inds[5]))
+        self.assertEqual(self._IDs(archive.inds()), [inds[5].ID])
+        self.assertEqual(len(archive), 1)
+
+    def testInfeasible(self):
+        if self.just1: return
+        #infeasible inds fill the room left by feasible inds, least
+        # violating first
+        inds = indsFromResAndPS([(1.0, 5.0), (0.5, 5.0), (1.4, 5.0),
+                                 (1.0, 20.0), (3.0, 5.0), (4.0, 6.0)], self.ps)
+        archive = EpsilonArchive(self.ps, 3, self.epsilons)
+        self.assertEqual(archive.addInds(inds[:4]), 3)
+        self.assertEqual([ind.ID for ind in archive.inds()],
+                         [inds[2].ID, inds[0].ID, inds[1].ID])
+
+        self.assertTrue(archive.add(inds[4]))
+        self.assertTrue(archive.add(inds[5]))
+        self.assertEqual([ind.ID for ind in archive.inds()],
+                         [inds[4].ID, inds[5].ID, inds[2].ID])
+
+    def testBoundedWithSpread(self):
+        if self.just1: return
+        #a front of 50 inds, in a random order, plus dominated inds
+        random.seed(2)
+        res = [(2.0 + 0.2*i, 1.0 + 0.15*i) for i in range(50)]
+        res += [(2.0 + 0.2*i, 1.5 + 0.15*i) for i in range(50)]
+        random.shuffle(res)
+        inds = indsFromResAndPS(res, self.ps)
+
+        archive = EpsilonArchive(self.ps, 10, thresholdEpsilons(self.ps, 0.01))
+        archive.addInds(inds)
+        kept = archive.inds()
+        self.assertEqual(len(kept), 10)
+
+        #only nondominated inds are kept, including both extremes
+        minmax = minMaxMetrics(self.ps, inds)
+        F = fastNondominatedSort(inds, minmax, max_layer_index=0)
+        front_IDs = [ind.ID for ind in F[0]]
+        for ind in kept:
+            self.assertTrue(ind.ID in front_IDs)
+        values0 = sorted([ind.worstCaseMetricValue(self.name0) for ind in kept])
+        self.assertAlmostEqual(values0[0], 2.0)
+        self.assertAlmostEqual(values0[-1], 2.0 + 0.2*49)
+
+        #spread: no big gaps along the front
+        gaps = [values0[i+1] - values0[i] for i in range(len(values0) - 1)]
+        self.assertTrue(max(gaps) < 3 * (values0[-1] - values0[0]) / 9.0)
+
+    def tearDown(self):
+        pass
+
+if __name__ == '__main__':
+
+    import logging
+    logging.basicConfig()
+    logging.getLogger('pooler').setLevel(logging.DEBUG)
+
+    unittest.main()
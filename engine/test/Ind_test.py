@@ -1,6 +1,9 @@
+import copy
+import cPickle as pickle
 import unittest
 
 from adts import *
+from util import mathutil
 from util.constants import BAD_METRIC_VALUE
 from engine.Ind import *
 
@@ -11,6 +14,10 @@ def some_function(x):
 def function2(x):
     return x-5
 
+class _LegacyInd:
+    """Stands in for the old-style Ind class, for making legacy pickles"""
+    pass
+
 class IndTest(unittest.TestCase):
 
     def setUp(self):
@@ -62,7 +69,7 @@ class IndTest(unittest.TestCase):
 
         #retrieve a worst-case value; see that caching didn't happen
         self.assertEqual(ind.worstCaseMetricValue(an2.metric.name), 33.2)
-        self.assertFalse(ind._cached_wc_metvals.has_key(an2.metric.name))
+        self.assertEqual(ind._cached_wc_metvals, None)
 
         #set enough sim results to be fully evaluated, and re-test
         ind.reportSimRequest(an, an.env_points[0])
@@ -74,6 +81,18 @@ class IndTest(unittest.TestCase):
         self.assertTrue(ind._cached_wc_metvals.has_key(an2.metric.name))
         self.assertEqual(ind._cached_wc_metvals[an2.metric.name], 33.2)
 
+        #performance key matches the metric values string, and is cached
+        self.assertEqual(ind.performanceKey(),
+                         mathutil.niceValuesKey(ind.worstCaseMetricValues()))
+        self.assertEqual(ind._cached_perf_key, ind.performanceKey())
+        ind2 = Ind(self.genotype, self.ps)
+        ind2.reportSimRequest(an, an.env_points[0])
+        ind2.setSimResults({an.metric.name:10.0000001}, an, an.env_points[0])
+        self.assertEqual(ind2._cached_perf_key, None)
+        ind2.reportSimRequest(an2, e)
+        ind2.setSimResults({an2.metric.name:33.2}, an2, e)
+        self.assertEqual(ind.performanceKey(), ind2.performanceKey())
+
     def testIsBad(self):        
         an = self.ps.analyses[0]
         an2 = self.ps.analyses[1]
@@ -99,6 +118,73 @@ class IndTest(unittest.TestCase):
         #can it go into a string?
         self.assertTrue(len(str(ind)) > 0)
 
+    def testCompactStorage(self):
+        an = self.ps.analyses[0]
+        e = an.env_points[0]
+        ind = Ind(self.genotype, self.ps)
+
+        #no per-ind __dict__; results are flat
+        self.assertFalse(hasattr(ind, '__dict__'))
+        self.assertEqual(len(ind._sim_results), self.ps.numSimResults())
+        self.assertEqual(ind._sim_requests_mask, 0)
+
+        ind.reportSimRequest(an, e)
+        ind.setSimResults({an.metric.name:10.0}, an, e, {'sw0':'dummy_waves'})
+        self.assertEqual(ind.simWaveforms(an, e), {'sw0':'dummy_waves'})
+        self.assertEqual(ind.sim_waveforms[an.ID][e.ID], {'sw0':'dummy_waves'})
+
+        #survives pickling and copying
+        ind._ps = None
+        ind2 = pickle.loads(pickle.dumps(ind))
+        ind3 = copy.copy(ind)
+        ind._ps = ind2._ps = ind3._ps = self.ps
+        for other_ind in [ind2, ind3]:
+            self.assertEqual(other_ind.genotype, ind.genotype)
+            self.assertTrue(other_ind.simRequestMade(an, e))
+            self.assertEqual(other_ind.sim_results, ind.sim_results)
+            self.assertEqual(other_ind.simWaveforms(an, e),
+                             {'sw0':'dummy_waves'})
+
+    def testLegacyPickle(self):
+        #an Ind as pickled before the slots-based storage: an old-style
+        # class instance whose state is its attribute dict
+        an, an2 = self.ps.analyses
+        e, e2 = an.env_points[0], an2.env_points[0]
+        legacy_ind = _LegacyInd()
+        legacy_ind.genotype = self.genotype
+        legacy_ind.sim_requests_made = {an.ID:{e.ID:True}, an2.ID:{e2.ID:False}}
+        legacy_ind.sim_results = {an.metric.name:{e.ID:12.0},
+                                  an2.metric.name:{e2.ID:None}}
+        legacy_ind.sim_waveforms = {an.ID:{e.ID:{'sw0':'dummy_waves'}},
+                                    an2.ID:{e2.ID:None}}
+        legacy_ind._ps = None
+        legacy_ind._cached_fully_evaluated = False
+        legacy_ind._cached_wc_metvals = {}
+        legacy_ind._cached_is_feasible = None
+        legacy_ind._cached_constraint_violation = {}
+        for protocol in [0, 2]:
+            s = pickle.dumps(legacy_ind, protocol)
+            s = s.replace(_LegacyInd.__module__, 'engine.Ind')
+            s = s.replace('_LegacyInd', 'Ind')
+
+            ind = pickle.loads(s)
+            self.assertTrue(isinstance(ind, Ind))
+            ind.restorePS(self.ps)
+            self.assertEqual(ind.genotype, self.genotype)
+            self.assertTrue(ind.simRequestMade(an, e))
+            self.assertFalse(ind.simRequestMade(an2, e2))
+            self.assertFalse(ind.fullyEvaluated())
+            self.assertEqual(ind.worstCaseMetricValue(an.metric.name), 12.0)
+            self.assertEqual(ind.simWaveforms(an, e), {'sw0':'dummy_waves'})
+            self.assertEqual(ind.simWaveforms(an2, e2), None)
+
+            #and it can be pickled again, the new way
+            ind._ps = None
+            ind2 = pickle.loads(pickle.dumps(ind, 2))
+            ind._ps = self.ps
+            ind2.restorePS(self.ps)
+            self.assertEqual(ind2.sim_results, ind.sim_results)
+
     def testForceBad(self):
         ind = Ind(self.genotype, self.ps)
         ind.forceFullyBad()
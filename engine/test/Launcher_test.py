@@ -0,0 +1,146 @@
+import unittest
+
+import os
+import shutil
+import sys
+import time
+
+from adts import *
+from engine.EngineUtils import AgeLayeredPop, SynthState
+from engine.SynthEngine import SynthSolutionStrategy
+from engine.Launcher import Launcher, LauncherStrategy, availableCpus, \
+     newestStateFile
+from EngineUtils_test import twoMetricsPS, indsFromResAndPS
+
+class FakeLauncher(Launcher):
+    """Runs tiny python scripts rather than real engines, so that
+    health checks can be tested quickly.  Engine i runs
+    'self.scripts[i]'."""
+
+    def engineCommand(self, engine, restart_file):
+        engine_i = self.engines.index(engine)
+        return [sys.executable, '-c', self.scripts[engine_i]]
+
+    def poolerCommand(self):
+        return [sys.executable, '-c', 'import time; time.sleep(30)']
+
+class LauncherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+        self.output_dir = os.path.abspath('test_launcher_dir') + '/'
+        self.launcher = None
+        self._cleanup()
+
+    def testLayout(self):
+        if self.just1: return
+        ss = LauncherStrategy(3, 10, 20, pin_cpus=True)
+        launcher = Launcher(2, ss, 'test_launcher_dir')
+        launcher.setUp()
+
+        #every engine gets its own dir, and the Pooler gets told about them
+        engine_dirs = [engine.db_dir for engine in launcher.engines]
+        self.assertEqual(engine_dirs, [self.output_dir + 'engine_00/',
+                                       self.output_dir + 'engine_01/',
+                                       self.output_dir + 'engine_02/'])
+        f = open(self.output_dir + 'pool.dirs', 'r')
+        self.assertEqual(f.read().split(), engine_dirs)
+        f.close()
+        self.assertTrue(os.path.isdir(self.output_dir + 'logs/'))
+
+        #engines and pooler share the pooled db
+        engine_command = launcher.engineCommand(launcher.engines[1], None)
+        self.assertEqual(engine_command[-5:],
+                         ['2', '10', engine_dirs[1],
+                          self.output_dir + 'pooled.db', 'None'])
+        self.assertEqual(launcher.poolerCommand()[-4:],
+                         ['2', self.output_dir + 'pool.dirs',
+                          self.output_dir + 'pooled.db', '20'])
+
+        #engines get pinned round robin
+        cpus = availableCpus()
+        self.assertTrue(len(cpus) > 0)
+        self.assertEqual(launcher.engines[0].cpus, [cpus[0]])
+        self.assertEqual(launcher.engines[2].cpus, [cpus[2 % len(cpus)]])
+        self.assertEqual(launcher.pooler.cpus, None)
+
+    def testNewestStateFile(self):
+        if self.just1: return
+        os.mkdir(self.output_dir)
+        self.assertEqual(newestStateFile(self.output_dir + 'nodir/'), None)
+        self.assertEqual(newestStateFile(self.output_dir), None)
+
+        open(self.output_dir + 'state_gen0001.db', 'w').close()
+        open(self.output_dir + 'state_gen0002.db', 'w').close()
+        self.assertEqual(newestStateFile(self.output_dir),
+                         self.output_dir + 'state_gen0002.db')
+
+        ps = twoMetricsPS(1.5, 10.0)
+        inds = indsFromResAndPS([(2,1), (3,4)], ps)
+        SynthState(ps, SynthSolutionStrategy(2),
+                   AgeLayeredPop([inds])).save(self.output_dir + 'run.db')
+        self.assertEqual(newestStateFile(self.output_dir),
+                         self.output_dir + 'run.db')
+
+    def testHealthCheck(self):
+        if self.just1: return
+        ss = LauncherStrategy(3, 10, 20, pin_cpus=True, niceness=0,
+                              max_restarts=1)
+        self.launcher = FakeLauncher(2, ss, 'test_launcher_dir')
+        self.launcher.scripts = ['import time; time.sleep(30)', #healthy
+                                 'pass',                        #finishes
+                                 'import sys; sys.exit(3)']     #crashes
+        self.launcher.setUp()
+        self.launcher.startAll()
+        [healthy, finisher, crasher] = self.launcher.engines
+        self._waitForExit([finisher, crasher])
+
+        #the crashed engine gets restarted, the finished one is done
+        self.assertEqual(self.launcher.checkHealth(), 1)
+        self.assertFalse(healthy.done)
+        self.assertTrue(finisher.done)
+        self.assertFalse(crasher.done)
+        self.assertEqual(crasher.num_restarts, 1)
+        self.assertFalse(self.launcher.allEnginesDone())
+
+        #after max_restarts, give up on it
+        self._waitForExit([crasher])
+        self.assertEqual(self.launcher.checkHealth(), 0)
+        self.assertTrue(crasher.done)
+        self.assertTrue(healthy.process.poll() is None)
+        self.assertTrue(os.path.exists(self.output_dir + 'logs/engine_02.log'))
+
+        #stalled engines get killed and restarted
+        ss.stall_time = 0.0
+        time.sleep(0.05)
+        self.assertEqual(self.launcher.checkHealth(), 1)
+        self.assertEqual(healthy.num_restarts, 1)
+        self.assertEqual(self.launcher.pooler.num_restarts, 0)
+        ss.stall_time = None
+
+        self.launcher.stopAll()
+        self.assertEqual(healthy.process, None)
+
+    def _waitForExit(self, children):
+        end_time = time.time() + 10.0
+        while time.time() < end_time:
+            if not [child for child in children
+                    if child.process.poll() is None]:
+                return
+            time.sleep(0.05)
+
+    def _cleanup(self):
+        if os.path.exists(self.output_dir):
+            shutil.rmtree(self.output_dir)
+
+    def tearDown(self):
+        if self.launcher is not None:
+            self.launcher.stopAll()
+        self._cleanup()
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig()
+    logging.getLogger('launcher').setLevel(logging.WARNING)
+
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+
+import os
+import stat
+
+from adts import *
+from engine.SynthEngine import SynthSolutionStrategy
+from engine.Migration import MigrationServer, MigrationClient, \
+     migrationInfoFile, readMigrationInfo
+from engine.Pooler import Pooler, PoolerStrategy
+from EngineUtils_test import twoMetricsPS, indsFromResAndPS
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+        self.info_file = migrationInfoFile('test_migration_pooled.db')
+        self.ps = twoMetricsPS(1.5, 10.0)
+        self.inds = indsFromResAndPS([(2,1), (3,4), (1,5), (4,9), (5,2)],
+                                     self.ps)
+        self.server = None
+
+    def testInfoFile(self):
+        if self.just1: return
+        self.assertEqual(migrationInfoFile('test_migration_pooled.db'),
+                         migrationInfoFile(os.path.abspath(
+                             'test_migration_pooled.db')))
+        self.assertNotEqual(self.info_file, migrationInfoFile('other.db'))
+
+    def testPrivate(self):
+        if self.just1: return
+        self.server = MigrationServer(self.info_file, self.ps)
+        self.server.start()
+
+        #only the current user can read the info file, or reach the socket
+        address, authkey = readMigrationInfo(self.info_file)
+        self.assertEqual(address, self.server.address)
+        self.assertEqual(stat.S_IMODE(os.stat(self.info_file).st_mode), 0600)
+        socket_dir = os.path.dirname(address)
+        self.assertEqual(stat.S_IMODE(os.stat(socket_dir).st_mode), 0700)
+        self.assertEqual(stat.S_IMODE(os.stat(address).st_mode) & 077, 0)
+
+        #a client without the authkey gets refused
+        f = open(self.info_file, 'w')
+        f.write('%s\n%s\n' % (address, '00' * 32))
+        f.close()
+        client = MigrationClient(self.info_file, timeout=5.0)
+        self.assertRaises(IOError, client.getMigrants, self.ps, 2)
+
+        #closing removes the socket's dir
+        self.server.close()
+        self.server = None
+        self.assertFalse(os.path.exists(socket_dir))
+
+    def testGetAndPush(self):
+        if self.just1: return
+        client = MigrationClient(self.info_file, timeout=5.0)
+        self.assertFalse(client.serverExists())
+        self.assertRaises(IOError, client.getMigrants, self.ps, 2)
+
+        self.server = MigrationServer(self.info_file, self.ps)
+        self.server.start()
+        self.assertTrue(client.serverExists())
+        self.assertRaises(ValueError,
+                          MigrationServer(self.info_file, self.ps).start)
+        self.assertEqual(client.getMigrants(self.ps, 2), [])
+
+        #clients get just the number of migrants that they ask for
+        self.server.setPool(self.inds)
+        pool_IDs = [ind.ID for ind in self.inds]
+        migrants = client.getMigrants(self.ps, 2)
+        self.assertEqual(len(migrants), 2)
+        for migrant in migrants:
+            self.assertTrue(migrant.ID in pool_IDs)
+            self.assertTrue(migrant._ps is self.ps)
+        self.assertEqual(len(client.getMigrants(self.ps, 10)), 5)
+
+        #pushed inds get collected until they are popped
+        ss = SynthSolutionStrategy(2)
+        client.pushInds(self.inds[:2], ss)
+        client.pushInds(self.inds[2:3], ss)
+        pushed_inds, pushed_ss = self.server.popPushedInds()
+        self.assertEqual([ind.ID for ind in pushed_inds], pool_IDs[:3])
+        self.assertEqual(pushed_ss.num_inds_per_age_layer, 2)
+        self.assertEqual(self.server.popPushedInds()[0], [])
+
+        #closing removes the info file
+        self.server.close()
+        self.assertFalse(client.serverExists())
+
+    def testPoolerIngestsPushedInds(self):
+        if self.just1: return
+        self._cleanup()
+        f = open('test_migration_dirs.txt', 'w')
+        f.write('test_migration_nodir\n')
+        f.close()
+
+        ss = PoolerStrategy(0, 10, False, serve_migrants=True)
+        pooler = Pooler(self.ps, ss, 'test_migration_dirs.txt',
+                        'test_migration_pooled.db')
+        self.server = MigrationServer(self.info_file, self.ps)
+        self.server.start()
+        pooler.migration_server = self.server
+        self.assertEqual(pooler.run__OneIteration(), 0)
+
+        #no db files, but pushed inds get pooled, and then served
+        client = MigrationClient(self.info_file)
+        client.pushInds(self.inds[:3], SynthSolutionStrategy(2))
+        self.assertEqual(pooler.run__OneIteration(), 1)
+        self.assertEqual(sorted([ind.ID for ind in pooler.pooled_inds]),
+                         [ind.ID for ind in self.inds[:3]])
+        self.assertTrue(os.path.exists('test_migration_pooled.db'))
+        self.assertEqual(len(client.getMigrants(self.ps, 10)), 3)
+        self._cleanup()
+
+    def _cleanup(self):
+        for filename in ['test_migration_dirs.txt', 'test_migration_pooled.db',
+                         self.info_file]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.close()
+        self._cleanup()
+
+if __name__ == '__main__':
+
+    import logging
+    logging.basicConfig()
+    logging.getLogger('pooler').setLevel(logging.DEBUG)
+
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+
+import random
+
+from adts import *
+from engine.EngineUtils import AgeLayeredPop, SynthState, \
+     fastNondominatedSort, minMaxMetrics
+from engine.ParetoArchive import ParetoArchive
+from EngineUtils_test import twoMetricsPS, indsFromResAndPS
+
+class ParetoArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+
+        #metric 0 is maximize past 1.5; metric 1 is minimize past 10.0
+        self.ps = twoMetricsPS(1.5, 10.0)
+
+    def _IDs(self, inds):
+        return sorted([ind.ID for ind in inds])
+
+    def testAdd(self):
+        if self.just1: return
+        inds = indsFromResAndPS([(1.0, 5.0), (1.2, 5.0), (1.0, 20.0),
+                                 (3.0, 4.0), (2.0, 1.0), (2.5, 5.0),
+                                 (3.0, 4.0), (2.2, 0.5)], self.ps)
+        archive = ParetoArchive(self.ps)
+
+        #until there is a feasible ind, hold the least-violating one
+        self.assertTrue(archive.add(inds[0]))
+        self.assertTrue(archive.add(inds[1]))
+        self.assertFalse(archive.add(inds[2]))
+        self.assertEqual(self._IDs(archive.front()), [inds[1].ID])
+
+        #feasible inds replace it
+        self.assertTrue(archive.add(inds[3]))
+        self.assertTrue(archive.add(inds[4]))
+        self.assertEqual(self._IDs(archive.front()),
+                         self._IDs([inds[3], inds[4]]))
+        self.assertTrue(archive.isDominated(inds[0]))
+
+        #dominated, or same performance: not added
+        self.assertTrue(archive.isDominated(inds[5]))
+        self.assertFalse(archive.add(inds[5]))
+        self.assertFalse(archive.add(inds[6]))
+
+        #a dominating ind removes what it dominates
+        self.assertFalse(archive.isDominated(inds[7]))
+        self.assertTrue(archive.add(inds[7]))
+        self.assertEqual(self._IDs(archive.front()),
+                         self._IDs([inds[3], inds[7]]))
+        self.assertEqual(len(archive), 2)
+
+    def testInfeasible(self):
+        if self.just1: return
+        #inds 0 and 1 violate by the same (scaled) amount; ind 2 has the
+        # same performance as ind 0
+        inds = indsFromResAndPS([(0.0, 5.0), (2.0, 20.0), (0.0, 5.0)],
+                                self.ps)
+        [name0, name1] = self.ps.flattenedMetricNames()
+
+        #equally-violating inds all stay, one per performance
+        archive = ParetoArchive(self.ps)
+        self.assertEqual(archive.addInds(inds), 2)
+        self.assertEqual(self._IDs(archive.front()), self._IDs(inds[:2]))
+        self.assertTrue(archive.isDominated(inds[2]))
+
+        #metric weights count
+        metric_weights = {name1 : 2.0}
+        archive = ParetoArchive(self.ps, metric_weights)
+        archive.addInds(inds)
+        self.assertEqual(self._IDs(archive.front()), [inds[0].ID])
+
+    def testMatchesNondominatedSort(self):
+        if self.just1: return
+        random.seed(3)
+        res = [(random.uniform(1.5, 10.0), random.uniform(0.0, 10.0))
+               for i in range(200)]
+        inds = indsFromResAndPS(res, self.ps)
+
+        archive = ParetoArchive(self.ps)
+        archive.addInds(inds)
+
+        minmax = minMaxMetrics(self.ps, inds)
+        F = fastNondominatedSort(inds, minmax, max_layer_index=0)
+        self.assertEqual(self._IDs(archive.front()), self._IDs(F[0]))
+
+    def testSynthState(self):
+        if self.just1: return
+        inds = indsFromResAndPS([(3.0, 4.0), (2.0, 1.0), (2.5, 5.0)], self.ps)
+        state = SynthState(self.ps, None, AgeLayeredPop([inds[:2], inds[2:]]))
+        self.assertEqual(self._IDs(state.paretoArchive().front()),
+                         self._IDs(inds[:2]))
+        self.assertTrue(state.paretoArchive() is state.paretoArchive())
+
+    def tearDown(self):
+        pass
+
+if __name__ == '__main__':
+
+    import logging
+    logging.basicConfig()
+    logging.getLogger('synth').setLevel(logging.DEBUG)
+
+    unittest.main()
@@ -2,6 +2,8 @@ import unittest
 
 import os
 import shutil
+import threading
+import time
 
 from adts import *
 from problems import ProblemFactory
@@ -9,6 +11,7 @@ from engine.SynthEngine import *
 from engine.SynthEngine import NsgaInd
 from engine.Ind import Ind
 from engine.Pooler import Pooler, PoolerStrategy
+from EngineUtils_test import twoMetricsPS, indsFromResAndPS
 
 class PoolerTest(unittest.TestCase):
 
@@ -20,6 +23,191 @@ class PoolerTest(unittest.TestCase):
         ps = ProblemFactory().build(2)
         ss = PoolerStrategy(0.5, 10, False)
         pooler = Pooler(ps, ss, '.', 'blah_db.db')
+
+    def testIncremental(self):
+        if self.just1: return
+        ps = twoMetricsPS(1.5, 10.0)
+        inds = indsFromResAndPS([(2,1), (3,4), (1,5), (4,9), (5,2)], ps)
+        synth_ss = SynthSolutionStrategy(2)
+
+        #two engine output dirs, listed in a db_dirs_file
+        self._cleanup()
+        for db_dir in ['test_pooldir1', 'test_pooldir2']:
+            os.mkdir(db_dir)
+        f = open('test_pool_dirs.txt', 'w')
+        f.write('test_pooldir1\ntest_pooldir2\ntest_pooldir_missing\n')
+        f.close()
+        SynthState(ps, synth_ss, AgeLayeredPop([inds[:2]])).save(
+            'test_pooldir1/run.db')
+
+        pooler = Pooler(ps, PoolerStrategy(0, 10, False),
+                        'test_pool_dirs.txt', 'test_pooled.db')
+        pooler.run__OneIteration()
+        self.assertEqual(sorted([ind.ID for ind in pooler.pooled_inds]),
+                         [inds[0].ID, inds[1].ID])
+        pooled = loadSynthState('test_pooled.db', ps)
+        self.assertEqual(len(pooled.allInds()), 2)
+
+        #nothing changed, so nothing gets ingested or saved
+        os.remove('test_pooled.db')
+        pooler.run__OneIteration()
+        self.assertFalse(os.path.exists('test_pooled.db'))
+
+        #new data: only the inds that are new to the pool get added
+        SynthState(ps, synth_ss, AgeLayeredPop([inds[:4]])).save(
+            'test_pooldir1/run.db')
+        SynthState(ps, synth_ss, AgeLayeredPop([[inds[4]]])).save(
+            'test_pooldir2/run.db')
+        pooler.run__OneIteration()
+        self.assertEqual(sorted([ind.ID for ind in pooler.pooled_inds]),
+                         [ind.ID for ind in inds])
+        self.assertEqual(len(loadSynthState('test_pooled.db', ps).allInds()),
+                         5)
+
+        #a restarted pooler carries on from the pooled db
+        pooler = Pooler(ps, PoolerStrategy(0, 10, False),
+                        'test_pool_dirs.txt', 'test_pooled.db')
+        pooler.run__OneIteration()
+        self.assertEqual(len(pooler.pooled_inds), 5)
+        
+        self._cleanup()
+
+    def testEventDriven(self):
+        if self.just1: return
+        ps = twoMetricsPS(1.5, 10.0)
+        inds = indsFromResAndPS([(2,1), (3,4)], ps)
+        synth_ss = SynthSolutionStrategy(2)
+
+        self._cleanup()
+        os.mkdir('test_pooldir1')
+        f = open('test_pool_dirs.txt', 'w')
+        f.write('test_pooldir1\n')
+        f.close()
+        SynthState(ps, synth_ss, AgeLayeredPop([inds[:1]])).save(
+            'test_pooldir1/run.db')
+
+        ss = PoolerStrategy(20, 10, False, event_driven=True,
+                            debounce_time=0.1, poll_interval=0.05)
+        pooler = Pooler(ps, ss, 'test_pool_dirs.txt', 'test_pooled.db')
+        pooler._startWatching()
+        self.assertEqual(pooler.run__OneIteration(), 1)
+
+        #the wait ends soon after a new generation lands, not after 20 s
+        save = lambda: SynthState(ps, synth_ss, AgeLayeredPop([inds])).save(
+            'test_pooldir1/run.db')
+        timer = threading.Timer(0.2, save)
+        timer.start()
+        start = time.time()
+        pooler._wait(1)
+        self.assertTrue(time.time() - start < 10.0)
+        timer.join()
+        pooler.run__OneIteration()
+        self.assertEqual(len(pooler.pooled_inds), 2)
+
+        #a generation that lands during an iteration is not missed either
+        save()
+        start = time.time()
+        pooler._wait(1)
+        self.assertTrue(time.time() - start < 10.0)
+        pooler._watcher.close()
+
+        self._cleanup()
+
+    def testParallelIngest(self):
+        if self.just1: return
+        ps = twoMetricsPS(1.5, 10.0)
+        inds = indsFromResAndPS([(2,1), (3,4), (1,5), (4,9), (5,2), (6,3)],
+                                ps)
+        synth_ss = SynthSolutionStrategy(2)
+
+        self._cleanup()
+        for i, db_dir in enumerate(['test_pooldir1', 'test_pooldir2']):
+            os.mkdir(db_dir)
+            SynthState(ps, synth_ss, AgeLayeredPop([inds[i*3:i*3+3]])).save(
+                db_dir + '/run.db')
+        f = open('test_pool_dirs.txt', 'w')
+        f.write('test_pooldir1\ntest_pooldir2\n')
+        f.close()
+
+        #loading dbs in worker processes gives the same pool as serially
+        pooled_IDs = []
+        for num_processes in [1, 2]:
+            ss = PoolerStrategy(0, 30, True, num_processes=num_processes)
+            pooler = Pooler(ps, ss, 'test_pool_dirs.txt', 'test_pooled.db')
+            pooler.run__OneIteration()
+            pooled_IDs.append(sorted([ind.ID for ind in pooler.pooled_inds]))
+            for ind in pooler.pooled_inds:
+                self.assertTrue(ind._ps is ps)
+        self.assertEqual(pooled_IDs[0], [ind.ID for ind in inds])
+        self.assertEqual(pooled_IDs[0], pooled_IDs[1])
+        self.assertEqual(pooler.synth_ss.num_inds_per_age_layer, 2)
+
+        #the next iterations reuse the same worker processes
+        process_pool = pooler._process_pool
+        self.assertNotEqual(process_pool, None)
+        for db_dir in ['test_pooldir1', 'test_pooldir2']:
+            SynthState(ps, synth_ss, AgeLayeredPop([inds[:2]])).save(
+                db_dir + '/run.db')
+        pooler.run__OneIteration()
+        self.assertTrue(pooler._process_pool is process_pool)
+        self.assertEqual(sorted([ind.ID for ind in pooler.pooled_inds]),
+                         pooled_IDs[0])
+        pooler._stopProcessPool()
+        self.assertEqual(pooler._process_pool, None)
+
+        self._cleanup()
+
+    def testStreaming(self):
+        if self.just1: return
+        ps = twoMetricsPS(1.5, 10.0)
+        inds = indsFromResAndPS([(2,1), (3,4), (1,5), (4,9), (5,2), (6,3)],
+                                ps)
+        synth_ss = SynthSolutionStrategy(2)
+
+        self._cleanup()
+        for i, db_dir in enumerate(['test_pooldir1', 'test_pooldir2']):
+            os.mkdir(db_dir)
+            SynthState(ps, synth_ss, AgeLayeredPop([inds[i*3:i*3+3]])).save(
+                db_dir + '/run.db')
+        f = open('test_pool_dirs.txt', 'w')
+        f.write('test_pooldir1\ntest_pooldir2\n')
+        f.close()
+
+        #merging db by db gives the same pool as merging all at once
+        pooled_IDs = []
+        for streaming in [False, True]:
+            ss = PoolerStrategy(0, 30, True, streaming=streaming)
+            pooler = Pooler(ps, ss, 'test_pool_dirs.txt', 'test_pooled.db')
+            pooler.run__OneIteration()
+            pooled_IDs.append(sorted([ind.ID for ind in pooler.pooled_inds]))
+        self.assertEqual(pooled_IDs[0], [ind.ID for ind in inds])
+        self.assertEqual(pooled_IDs[0], pooled_IDs[1])
+        self.assertEqual(len(loadSynthState('test_pooled.db', ps).allInds()),
+                         6)
+
+        #the pool stays bounded
+        ss = PoolerStrategy(0, 3, True, streaming=True)
+        pooler = Pooler(ps, ss, 'test_pool_dirs.txt', 'test_pooled.db')
+        pooler.run__OneIteration()
+        self.assertTrue(0 < len(pooler.pooled_inds) <= 3)
+
+        #with an epsilon archive, dominated feasible inds are dropped, and
+        # infeasible inds fill the rest of the room
+        ss = PoolerStrategy(0, 30, True, streaming=True, epsilon=0.01)
+        pooler = Pooler(ps, ss, 'test_pool_dirs.txt', 'test_pooled.db')
+        pooler.run__OneIteration()
+        self.assertEqual(sorted([ind.ID for ind in pooler.pooled_inds]),
+                         sorted([inds[i].ID for i in [0, 2, 4, 5]]))
+
+        self._cleanup()
+
+    def _cleanup(self):
+        for db_dir in ['test_pooldir1', 'test_pooldir2']:
+            if os.path.exists(db_dir):
+                shutil.rmtree(db_dir)
+        for filename in ['test_pool_dirs.txt', 'test_pooled.db']:
+            if os.path.exists(filename):
+                os.remove(filename)
         
     def tearDown(self):
         pass
@@ -0,0 +1,141 @@
+import unittest
+
+import os
+import random
+
+from adts import *
+from engine.EngineUtils import AgeLayeredPop, SynthState
+from engine.ResultsCatalog import ResultsCatalog, buildResultsCatalog, \
+     _dominates, _nondominatedIndices
+from util.constants import BAD_METRIC_VALUE
+from EngineUtils_test import twoMetricsPS, indsFromResAndPS
+
+class ResultsCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+        self.catalog_file = 'test_catalog.sqlite'
+        self.db_file = 'test_catalog_state.db'
+        self._cleanup()
+
+        #metric 0 is maximize past 1.5; metric 1 is minimize past 10.0
+        # -ind 2 is infeasible; ind 4 is dominated by ind 0
+        self.ps = twoMetricsPS(1.5, 10.0)
+        self.inds = indsFromResAndPS([(2,1), (3,4), (1,5), (4,9), (2,2)],
+                                     self.ps)
+        self.state = SynthState(self.ps, None, AgeLayeredPop([self.inds]))
+        [self.name0, self.name1] = self.ps.flattenedMetricNames()
+
+    def _IDs(self, entries):
+        return sorted([entry.ID for entry in entries])
+
+    def testQuery(self):
+        if self.just1: return
+        catalog = ResultsCatalog(self.catalog_file, self.ps)
+        catalog.addSynthState(self.state, 'source_a')
+        self.assertEqual(catalog.numInds(), 5)
+        inds = self.inds
+
+        #no thresholds: nondominated feasible inds
+        self.assertEqual(self._IDs(catalog.query({})),
+                         self._IDs([inds[0], inds[1], inds[3]]))
+
+        #thresholds select first, then nondominated among those
+        self.assertEqual(self._IDs(catalog.query({self.name1:(None, 5.0)})),
+                         self._IDs([inds[0], inds[1]]))
+        self.assertEqual(self._IDs(catalog.query({self.name0:(3.0, None)})),
+                         self._IDs([inds[1], inds[3]]))
+        self.assertEqual(self._IDs(catalog.query({self.name0:(3.0, None),
+                                                  self.name1:(None, 2.0)})),
+                         [])
+        self.assertEqual(len(catalog.query({}, False, False)), 5)
+        self.assertRaises(ValueError, catalog.query, {'blah':(1.0, None)})
+
+        #entries have the worst-case metric values and netlists
+        [entry] = catalog.query({self.name1:(None, 1.0)})
+        self.assertEqual(entry.ID, inds[0].ID)
+        self.assertEqual(entry.source, 'source_a')
+        self.assertTrue(entry.is_feasible)
+        self.assertEqual(entry.worst_case_metric_values,
+                         {self.name0:2.0, self.name1:1.0})
+        self.assertEqual(entry.netlist, inds[0].netlist())
+
+        #lookup by ID
+        [entry] = catalog.lookup(inds[2].ID)
+        self.assertFalse(entry.is_feasible)
+        self.assertEqual(catalog.lookup(inds[2].ID, 'source_b'), [])
+
+        #adding a source again replaces it; other sources are kept
+        catalog.addSynthState(self.state, 'source_a')
+        catalog.addSynthState(self.state, 'source_b')
+        self.assertEqual(catalog.numInds(), 10)
+        self.assertEqual(len(catalog.lookup(inds[2].ID)), 2)
+        catalog.close()
+
+        #a catalog can be queried without a ps
+        catalog = ResultsCatalog(self.catalog_file)
+        self.assertEqual(catalog.metricNames(), [self.name0, self.name1])
+        self.assertEqual(len(catalog.query({self.name1:(None, 1.0)})), 2)
+        catalog.close()
+
+    def testBadMetricValue(self):
+        if self.just1: return
+        self.inds[4].forceFullyBad()
+        catalog = ResultsCatalog(self.catalog_file, self.ps)
+        catalog.addSynthState(self.state, 'source_a')
+        [entry] = catalog.lookup(self.inds[4].ID)
+        self.assertEqual(entry.worst_case_metric_values[self.name0],
+                         BAD_METRIC_VALUE)
+        self.assertEqual(len(catalog.query({}, False, False)), 5)
+        catalog.close()
+
+    def testNondominatedIndices(self):
+        if self.just1: return
+        random.seed(2)
+        inf = float('inf')
+        for num_objectives in [0, 1, 2, 3]:
+            for trial in range(20):
+                #few distinct values, so that there are ties and duplicates
+                goodnesses = [tuple([random.choice([-inf, 0, 1, 2, 3])
+                                     for j in range(num_objectives)])
+                              for i in range(random.randint(0, 30))]
+                target_I = [i for i, goodness in enumerate(goodnesses)
+                            if not [other for other in goodnesses
+                                    if _dominates(other, goodness)]]
+                self.assertEqual(_nondominatedIndices(goodnesses), target_I)
+
+    def testBuildResultsCatalog(self):
+        if self.just1: return
+        self.state.save(self.db_file)
+        catalog = buildResultsCatalog(self.ps, [self.db_file],
+                                      self.catalog_file)
+        self.assertEqual(catalog.numInds(), 5)
+        self.assertEqual(catalog.topologies(), {'':5})
+        self.assertEqual(catalog.query({})[0].source,
+                         os.path.abspath(self.db_file))
+        catalog.close()
+
+        #catalogs only hold inds of one set of metrics
+        an = FunctionAnalysis(lambda x: x, [EnvPoint(True)], 1.0,
+                              float('+Inf'), True)
+        dummy_part = WireFactory().build()
+        emb_part = EmbeddedPart(dummy_part, dummy_part.unityPortMap(), {})
+        other_ps = ProblemSetup(emb_part, [an])
+        self.assertRaises(ValueError, ResultsCatalog, self.catalog_file,
+                          other_ps)
+
+    def _cleanup(self):
+        for filename in [self.catalog_file, self.db_file]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def tearDown(self):
+        self._cleanup()
+
+if __name__ == '__main__':
+
+    import logging
+    logging.basicConfig()
+    logging.getLogger('synth').setLevel(logging.DEBUG)
+
+    unittest.main()
@@ -0,0 +1,202 @@
+import unittest
+
+import os
+import random
+import shutil
+
+from adts import *
+from problems import ProblemFactory
+from engine.Ind import Genotype, Ind
+from engine.Surrogate import Surrogate
+from engine.SynthEngine import SynthEngine, SynthSolutionStrategy, \
+     loadSynthState
+
+def f1(x):
+    return x+1
+
+def f2(x):
+    return x+2
+
+def surrogatePS():
+    """Makes a PS whose part has continuous vars 'x' and 'y', and choice
+    var 'choice'; metric 0 is maximize past 0.0, metric 1 is minimize
+    past 10.0"""
+    pm = PointMeta([ContinuousVarMeta(False, 0, 10, 'x'),
+                    ContinuousVarMeta(False, 0, 10, 'y'),
+                    DiscreteVarMeta([0, 1], 'choice')])
+    part = CompoundPart([], pm, 'surrogate_part')
+    emb_part = EmbeddedPart(part, {}, {'x':None, 'y':None, 'choice':None})
+    an_f1 = FunctionAnalysis(f1, [EnvPoint(True)], 0.0, float('+Inf'), True)
+    an_f2 = FunctionAnalysis(f2, [EnvPoint(True)], float('-Inf'), 10.0, True)
+    return ProblemSetup(emb_part, [an_f1, an_f2])
+
+def unevaluatedInd(ps, x, y, choice=0):
+    genotype = Genotype()
+    genotype.unscaled_opt_point = Point(False, {'x':x, 'y':y,
+                                                'choice':choice})
+    return Ind(genotype, ps)
+
+def evaluatedInd(ps, x, y, choice=0):
+    """Returns an ind which is bad if x > 5.0, and otherwise has
+    metric values (y, x)"""
+    ind = unevaluatedInd(ps, x, y, choice)
+    if x > 5.0:
+        ind.forceFullyBad()
+        return ind
+    for analysis, value in zip(ps.analyses, [y, x]):
+        env_point = analysis.env_points[0]
+        ind.reportSimRequest(analysis, env_point)
+        ind.setSimResults({analysis.metric.name:value}, analysis, env_point)
+    return ind
+
+class SurrogateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+        self.ps = surrogatePS()
+        [self.name0, self.name1] = self.ps.flattenedMetricNames()
+        self.ss = SynthSolutionStrategy(3)
+        self.ss.surrogate_exploration_rate = 0.0
+        self.ss.surrogate_bandwidth = 0.2
+
+    def _trainedSurrogate(self, max_x=10.0):
+        random.seed(3)
+        surrogate = Surrogate(self.ps, self.ss)
+        for i in range(500):
+            surrogate.addInd(evaluatedInd(self.ps, random.uniform(0, max_x),
+                                          random.uniform(0, 10)))
+        return surrogate
+
+    def testPredict(self):
+        if self.just1: return
+        surrogate = self._trainedSurrogate()
+
+        #in the bad region
+        (prob_bad, metric_values) = surrogate.predict(
+            unevaluatedInd(self.ps, 8.0, 5.0))
+        self.assertTrue(prob_bad > 0.99)
+
+        #in the good region
+        (prob_bad, metric_values) = surrogate.predict(
+            unevaluatedInd(self.ps, 2.0, 7.0))
+        self.assertTrue(prob_bad < 0.01)
+        self.assertAlmostEqual(metric_values[self.name0], 7.0, 0)
+        self.assertAlmostEqual(metric_values[self.name1], 2.0, 0)
+
+        #other topology: no data
+        self.assertEqual(surrogate.predict(
+            unevaluatedInd(self.ps, 2.0, 7.0, 1)), None)
+
+        #unevaluated inds do not get trained on
+        surrogate.addInd(unevaluatedInd(self.ps, 2.0, 7.0, 1))
+        self.assertEqual(surrogate.predict(
+            unevaluatedInd(self.ps, 2.0, 7.0, 1)), None)
+
+    def testTooFewNeighbours(self):
+        if self.just1: return
+        surrogate = self._trainedSurrogate(max_x=4.0)
+        self.assertNotEqual(surrogate.predict(
+            unevaluatedInd(self.ps, 2.0, 7.0)), None)
+        self.assertEqual(surrogate.predict(
+            unevaluatedInd(self.ps, 9.0, 7.0)), None)
+
+    def testScreen(self):
+        if self.just1: return
+        surrogate = self._trainedSurrogate()
+        par1 = evaluatedInd(self.ps, 1.0, 9.0)
+        par2 = evaluatedInd(self.ps, 2.0, 8.0)
+
+        #likely bad
+        self.assertFalse(surrogate.screen(unevaluatedInd(self.ps, 8.0, 5.0),
+                                          [par1, par2]))
+
+        #likely dominated by both parents
+        self.assertFalse(surrogate.screen(unevaluatedInd(self.ps, 4.0, 3.0),
+                                          [par1, par2]))
+
+        #nondominated
+        self.assertTrue(surrogate.screen(unevaluatedInd(self.ps, 1.5, 8.5),
+                                         [par1, par2]))
+        self.assertTrue(surrogate.screen(unevaluatedInd(self.ps, 0.5, 3.0),
+                                         [par1, par2]))
+
+        #unknown
+        self.assertTrue(surrogate.screen(unevaluatedInd(self.ps, 4.0, 3.0, 1),
+                                         [par1, par2]))
+        self.assertEqual(surrogate.num_screened, 5)
+        self.assertEqual(surrogate.num_rejected, 2)
+        self.assertEqual(surrogate.num_explored, 0)
+
+        #a bad parent does not dominate
+        bad_par = evaluatedInd(self.ps, 9.0, 9.0)
+        self.assertTrue(surrogate.screen(unevaluatedInd(self.ps, 4.0, 3.0),
+                                         [par1, bad_par]))
+
+        #no dominance screening
+        self.ss.surrogate_screen_dominated = False
+        surrogate = self._trainedSurrogate()
+        self.assertTrue(surrogate.screen(unevaluatedInd(self.ps, 4.0, 3.0),
+                                         [par1, par2]))
+        self.assertFalse(surrogate.screen(unevaluatedInd(self.ps, 8.0, 5.0),
+                                          [par1, par2]))
+
+        #always explore
+        self.ss.surrogate_exploration_rate = 1.0
+        surrogate = self._trainedSurrogate()
+        self.assertTrue(surrogate.screen(unevaluatedInd(self.ps, 8.0, 5.0),
+                                         [par1, par2]))
+        self.assertEqual(surrogate.num_rejected, 0)
+        self.assertEqual(surrogate.num_explored, 1)
+        self.assertTrue('#explored=1' in str(surrogate))
+
+    def testEngine(self):
+        if self.just1: return
+        ps = ProblemFactory().build(2)
+        ss = SynthSolutionStrategy(3)
+        ss.max_num_inds = 10
+        ss.use_surrogate = True
+        ss.surrogate_min_num_neighbours = 1
+
+        #possible cleanup from prev run
+        if os.path.exists('test_surrogate_outpath'):
+            shutil.rmtree('test_surrogate_outpath')
+
+        engine = SynthEngine(ps, ss, 'test_surrogate_outpath', None, None)
+        engine.run()
+        state = loadSynthState('test_surrogate_outpath/run.db', ps, 1)
+        self.assertEqual(len(state.allInds()), 6)
+        self.assertTrue(engine.surrogate.num_screened > 0)
+
+        #rounds where every candidate gets screened out have their own
+        # budget, and do not use up max_num_rounds
+        [par1, par2] = state.allInds()[:2]
+        engine.surrogate.screen = lambda ind, parents: False
+        num_inds = engine.state.tot_num_inds
+        (success, child1, child2) = engine.varyParentsToGetGoodChildren(
+            par1, par2, set(), '', max_num_rounds=1, max_num_screened_rounds=3)
+        self.assertFalse(success)
+        self.assertEqual(engine.state.tot_num_inds, num_inds)
+
+        calls = []
+        def screen(ind, parents):
+            calls.append(ind)
+            return len(calls) > 6
+        engine.surrogate.screen = screen
+        (success, child1, child2) = engine.varyParentsToGetGoodChildren(
+            par1, par2, set(), '', max_num_rounds=1, max_num_screened_rounds=4)
+        self.assertEqual(len(calls), 8)
+        self.assertEqual(engine.state.tot_num_inds, num_inds + 2)
+
+        #cleanup
+        shutil.rmtree('test_surrogate_outpath')
+
+    def tearDown(self):
+        pass
+
+if __name__ == '__main__':
+
+    import logging
+    logging.basicConfig()
+    logging.getLogger('synth').setLevel(logging.WARNING)
+
+    unittest.main()
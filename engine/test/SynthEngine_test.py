@@ -41,9 +41,10 @@ class SynthEngineTest(unittest.TestCase):
         engine = SynthEngine(ps, ss, 'test_outpath', None, None)
         engine.run()
         self.assertTrue(os.path.exists('test_outpath'))
-        state = loadSynthState('test_outpath/state_gen0001.db', ps)
+        state = loadSynthState('test_outpath/run.db', ps, 1)
         self.assertTrue(len(state.allInds()) == pop_size*2)
         self.assertTrue(len(state.R_per_age_layer) == 1)
+        self.assertEqual(state.generation, 1)
 
         #on one problem, see if we can recover from a previous state
         if problem_number == 2:
@@ -55,19 +56,19 @@ class SynthEngineTest(unittest.TestCase):
             
             # -recover onto a different output directory
             engine = SynthEngine(ps, ss, 'test_outpath2', None,
-                                 'test_outpath/state_gen0001.db')
+                                 'test_outpath/run.db')
             engine.run()
 
             # -recover on an already-existing output directory
             engine = SynthEngine( ps, ss, 'test_outpath', None,
-                                  'test_outpath/state_gen0001.db')
+                                  'test_outpath/run.db')
             engine.run()
             # -see that it will have deleted all prior files in that
             #  directory
             #we'd need to start from gen0002 or higher in order to
             # ensure that gen0001 is missing, but that will make the
             # unit test runtime too long.  So turn off this test for now.
-            #self.assertFalse(os.path.exists('test_outpath/state_gen0001.db'))
+            #self.assertFalse(os.path.exists('test_outpath/run.db'))
             
 
             #cleanup
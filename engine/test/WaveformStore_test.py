@@ -0,0 +1,152 @@
+import unittest
+
+import os
+import shutil
+
+import numpy
+
+from adts import *
+from engine.Ind import Genotype, Ind
+from engine.WaveformStore import *
+
+def some_function(x):
+    return x+2
+
+class WaveformStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+        
+        #possible cleanup from prev run
+        if os.path.exists('test_waveforms'):
+            shutil.rmtree('test_waveforms')
+        os.mkdir('test_waveforms')
+        self.store_file = 'test_waveforms/waveforms.db'
+
+    def testAppendAndRead(self):
+        if self.just1: return
+        store = openWaveformStore(self.store_file)
+        self.assertTrue(store is openWaveformStore(self.store_file))
+
+        sw0 = numpy.array([[0.0, 0.1, 0.2], [1.0, 1.1, 1.2]])
+        tr0 = numpy.array([[5.0, 6.0, 7.0, 8.0]])
+        refs = store.append(3, 1, 2, {'sw0':sw0, 'tr0':tr0})
+        refs2 = store.append(4, 1, 2, {'sw0':sw0 * 2.0})
+
+        #read via refs
+        self.assertEqual(sorted(refs.keys()), ['sw0', 'tr0'])
+        self.assertEqual(refs['sw0'].shape, (2,3))
+        self.assertTrue(numpy.all(refs['sw0'].load() == sw0))
+        self.assertTrue(numpy.all(refs['tr0'].load() == tr0))
+        self.assertTrue(numpy.all(refs2['sw0'].load() == sw0 * 2.0))
+
+        #read via (ind ID, analysis ID, env point ID), even after reopening
+        closeWaveformStore(self.store_file)
+        store = openWaveformStore(self.store_file)
+        self.assertTrue(numpy.all(store.lookup(3, 1, 2)['tr0'] == tr0))
+        self.assertTrue(numpy.all(store.lookup(4, 1, 2)['sw0'] == sw0 * 2.0))
+        self.assertEqual(store.lookup(5, 1, 2), None)
+
+        #appending after reopening keeps prior data
+        refs3 = store.append(5, 1, 2, {'sw0':tr0})
+        self.assertTrue(numpy.all(refs3['sw0'].load() == tr0))
+        self.assertTrue(numpy.all(refs['sw0'].load() == sw0))
+        closeWaveformStore(self.store_file)
+
+    def testInd(self):
+        if self.just1: return
+        an = FunctionAnalysis(some_function, [EnvPoint(True)], 10, 20, False)
+        e = an.env_points[0]
+        dummy_part = WireFactory().build()
+        emb_part = EmbeddedPart(dummy_part, dummy_part.unityPortMap(), {})
+        ps = ProblemSetup(emb_part, [an])
+        genotype = Genotype()
+        genotype.unscaled_opt_point = Point(False)
+        
+        ind = Ind(genotype, ps)
+        sw0 = numpy.array([[0.0, 0.1, 0.2], [1.0, 1.1, 1.2]])
+        ind.reportSimRequest(an, e)
+        ind.setSimResults({an.metric.name:10.0}, an, e, {'sw0':sw0})
+
+        #after moving, the ind only holds a reference
+        store = openWaveformStore(self.store_file)
+        ind.moveWaveformsToStore(store)
+        self.assertTrue(isinstance(ind._sim_waveforms[(an.ID, e.ID)]['sw0'],
+                                   WaveformRef))
+        self.assertTrue(numpy.all(ind.simWaveforms(an, e)['sw0'] == sw0))
+        self.assertTrue(numpy.all(store.lookup(ind.ID, an.ID, e.ID)['sw0'] ==
+                                  sw0))
+
+        #moving again does not duplicate data
+        size_before = os.path.getsize(self.store_file)
+        ind.moveWaveformsToStore(store)
+        self.assertEqual(os.path.getsize(self.store_file), size_before)
+
+        #waveforms can be pulled back into memory, e.g. before store removal
+        ind.loadWaveformsIntoMemory()
+        closeWaveformStore(self.store_file)
+        shutil.rmtree('test_waveforms')
+        self.assertTrue(numpy.all(ind.simWaveforms(an, e)['sw0'] == sw0))
+        
+    def testForeignAndStaleRefs(self):
+        if self.just1: return
+        an = FunctionAnalysis(some_function, [EnvPoint(True)], 10, 20, False)
+        e = an.env_points[0]
+        dummy_part = WireFactory().build()
+        emb_part = EmbeddedPart(dummy_part, dummy_part.unityPortMap(), {})
+        ps = ProblemSetup(emb_part, [an])
+        genotype = Genotype()
+        genotype.unscaled_opt_point = Point(False)
+        sw0 = numpy.array([[0.0, 0.1, 0.2], [1.0, 1.1, 1.2]])
+
+        def newInd():
+            ind = Ind(genotype, ps)
+            ind.reportSimRequest(an, e)
+            ind.setSimResults({an.metric.name:10.0}, an, e, {'sw0':sw0})
+            ind.moveWaveformsToStore(openWaveformStore(self.store_file))
+            return ind
+
+        #a migrant's waveforms get copied into the receiving run's store
+        ind = newInd()
+        other_store_file = 'test_waveforms/other_waveforms.db'
+        other_store = openWaveformStore(other_store_file)
+        ind.moveWaveformsToStore(other_store)
+        ref = ind._sim_waveforms[(an.ID, e.ID)]['sw0']
+        self.assertTrue(other_store.holds(ref))
+        self.assertTrue(numpy.all(ind.simWaveforms(an, e)['sw0'] == sw0))
+
+        #the first run restarts: clears its store, and writes other
+        # waveforms at the same offsets
+        stale_ind = newInd()
+        closeWaveformStore(self.store_file)
+        os.remove(self.store_file)
+        os.remove(self.store_file + '.idx')
+        openWaveformStore(self.store_file).append(1, an.ID, e.ID,
+                                                  {'sw0':sw0 * 2.0})
+
+        #the copied waveforms are still fine; stale refs are unavailable,
+        # rather than wrong
+        self.assertTrue(numpy.all(ind.simWaveforms(an, e)['sw0'] == sw0))
+        self.assertEqual(stale_ind.simWaveforms(an, e), None)
+        stale_ind.loadWaveformsIntoMemory()
+        self.assertEqual(stale_ind._sim_waveforms, None)
+
+        #same, if the store is gone altogether
+        stale_ind = newInd()
+        closeWaveformStore(self.store_file)
+        shutil.rmtree('test_waveforms')
+        self.assertEqual(stale_ind.simWaveforms(an, e), None)
+        os.mkdir('test_waveforms')
+        stale_ind.moveWaveformsToStore(openWaveformStore(self.store_file))
+        self.assertEqual(stale_ind._sim_waveforms, None)
+        closeWaveformStore(other_store_file)
+
+    def tearDown(self):
+        closeWaveformStore(self.store_file)
+        if os.path.exists('test_waveforms'):
+            shutil.rmtree('test_waveforms')
+
+if __name__ == '__main__':
+    #if desired, this is where logging would be set up
+    
+    unittest.main()
@@ -5,11 +5,27 @@ from Ind_test import IndTest
 from Pooler_test import PoolerTest
 from SynthEngine_test import SynthEngineTest
 from EngineUtils_test import EngineUtilsTest
+from WaveformStore_test import WaveformStoreTest
+from CheckpointWriter_test import CheckpointWriterTest
+from ResultsCatalog_test import ResultsCatalogTest
+from Migration_test import MigrationTest
+from EpsilonArchive_test import EpsilonArchiveTest
+from Surrogate_test import SurrogateTest
+from ParetoArchive_test import ParetoArchiveTest
+from Launcher_test import LauncherTest
 
 TestClasses = [IndTest,
                PoolerTest,
                SynthEngineTest,
                EngineUtilsTest,
+               WaveformStoreTest,
+               CheckpointWriterTest,
+               ResultsCatalogTest,
+               MigrationTest,
+               EpsilonArchiveTest,
+               SurrogateTest,
+               ParetoArchiveTest,
+               LauncherTest,
                ]
 
 def unittest_suite():
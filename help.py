@@ -16,6 +16,7 @@ To generate results
 ===================
 -synth.py - run a single synthesis process (can invoke multiple times to get parallelism)
 -pooler.py - enables migration between synthesis processes (just invoke once)
+-launch.py - run many synthesis processes plus a pooler on one machine
 -doprune_lut_data - shrinks the size of a lookup table (lut)
 
 ==================
@@ -24,6 +25,7 @@ To analyze results
 -aggregator.py -- merge results across many DBs into a single DB
 -summarize_db.py - list nondominated inds and their performances in a DB
 -netlister.py - netlist a single ind
+-catalog.py - build a catalog from DBs, then query it for sized topologies that meet specs
 
 ==================
 Maintenance
@@ -0,0 +1,33 @@
+#!/usr/bin/env python 
+
+import sys
+
+from problems import ProblemFactory
+from engine.Launcher import Launcher, LauncherStrategy
+
+if __name__== '__main__':
+
+    num_args = len(sys.argv)
+    if num_args not in [6]:
+        print 'Usage: launch PROBLEM_NUM NUM_ENGINES POP_SIZE POOL_SIZE OUTPUT_DIR'
+        print ''
+        print ' Runs NUM_ENGINES synth engines plus a pooler on this machine,'
+        print ' with results in OUTPUT_DIR/engine_XX/ and OUTPUT_DIR/pooled.db.'
+        print ' Re-run with the same OUTPUT_DIR to continue a campaign.'
+        print ''
+        print ProblemFactory().problemDescriptions()
+        sys.exit(0)
+
+    problem_choice = eval(sys.argv[1])
+    num_engines = eval(sys.argv[2])
+    pop_size = eval(sys.argv[3])
+    pool_size = eval(sys.argv[4])
+    output_dir = sys.argv[5]
+    
+    import logging
+    logging.basicConfig()
+    logging.getLogger('launcher').setLevel(logging.DEBUG)
+
+    ss = LauncherStrategy(num_engines, pop_size, pool_size)
+    launcher = Launcher(problem_choice, ss, output_dir)
+    launcher.run()
@@ -6,7 +6,7 @@ import sys
 from adts import *
 from problems import ProblemFactory
 
-from engine.SynthEngine import loadSynthState
+from engine.EngineUtils import findInd
 
 if __name__== '__main__':            
     #set up logging
@@ -24,7 +24,7 @@ Can make it simulatable by also specifying an analysis and env_point.
 
 Details:
  PROBLEM_NUM -- int -- see below
- DB_FILE -- string -- e.g. ~/synth_results/state_genXXXX.db or pooled_db.db
+ DB_FILE -- string -- e.g. ~/synth_results/run.db (newest generation), state_genXXXX.db or pooled_db.db
  IND_ID -- int -- eg 2212
  ANNOTATE_POINTS -- 0 or 1 -- if 1, add unscaled_point and scaled_point info
  ANNOTATE_BB -- 0 or 1 -- if 1, add building block info
@@ -57,14 +57,9 @@ Details:
     if not os.path.exists(db_file):
         print "Cannot find file with name %s" % db_file
         sys.exit(0)
-    state = loadSynthState(db_file, ps)
-
-    # -find ind
-    ind = None
-    for cand_ind in state.allInds():
-        if cand_ind.ID == ind_ID:
-            ind = cand_ind
-            break
+
+    # -find ind (without loading the other inds, if db_file allows it)
+    ind = findInd(db_file, ps, ind_ID)
     if ind is None:
         print "ind with ID=%d not found in db; use summarize_db to learn IDs" %\
               ind_ID
@@ -62,7 +62,7 @@ Details:
     ind=pickle.load(fid);
     fid.close();
         
-    ind._ps = ps
+    ind.restorePS(ps)
     
     # -generate design_netlist; it may be annotated
     design_netlist = ind.netlist(annotate_bb_info = annotate_bb_info, add_infostring=True)
@@ -10,8 +10,12 @@ from engine.Pooler import *
 if __name__== '__main__':
 
     num_args = len(sys.argv)
-    if num_args not in [5]:
-        print 'Usage: pooler PROBLEM_NUM DB_DIRS_FILE POOLED_DB_FILE POOL_SIZE'
+    if num_args not in [5,6,7,8,9]:
+        print 'Usage: pooler PROBLEM_NUM DB_DIRS_FILE POOLED_DB_FILE POOL_SIZE [EPSILON] [EVENT_DRIVEN] [SERVE_MIGRANTS] [NUM_PROCESSES]'
+        print ' EPSILON -- float -- if > 0, keep the pool on an epsilon-grid whose box width is this fraction of each objective\'s threshold scale (default 0 = nondominated sort)'
+        print ' EVENT_DRIVEN -- bool -- wake up on db file changes rather than every 120 s (default False)'
+        print ' SERVE_MIGRANTS -- bool -- serve migrants to SynthEngines over a local socket (default False)'
+        print ' NUM_PROCESSES -- int -- number of processes that load dbs (default 1)'
         print ProblemFactory().problemDescriptions()
         sys.exit(0)
         
@@ -20,6 +24,19 @@ if __name__== '__main__':
     pooled_db_file = sys.argv[3]
     pool_size = eval(sys.argv[4])
     loop_wait_time = 120 #currently a magic number instead of an argument
+    epsilon = 0.0
+    event_driven = False
+    serve_migrants = False
+    num_processes = 1
+
+    if num_args >= 6:
+        epsilon = float(sys.argv[5])
+    if num_args >= 7:
+        event_driven = bool(eval(sys.argv[6]))
+    if num_args >= 8:
+        serve_migrants = bool(eval(sys.argv[7]))
+    if num_args >= 9:
+        num_processes = eval(sys.argv[8])
     
     import logging
     logging.basicConfig()
@@ -27,7 +44,9 @@ if __name__== '__main__':
 
     ps = ProblemFactory().build(problem_choice)
     ss = PoolerStrategy(loop_wait_time=loop_wait_time, max_pool_size=pool_size,
-                        just_one_iter=False)
+                        just_one_iter=False, event_driven=event_driven,
+                        serve_migrants=serve_migrants,
+                        num_processes=num_processes, epsilon=epsilon)
 
     pooler = Pooler(ps, ss, db_dirs_file, pooled_db_file)
     pooler.run()
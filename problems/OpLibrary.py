@@ -6,8 +6,6 @@ import types
 import copy
 import sys
 import math
-import pickle
-import os
 
 import numpy
 
@@ -18,20 +16,51 @@ from Library import whoami, Library
 from util.constants import REGION_SATURATION
 from util.ascii import asciiRowToStrings, asciiTo2dArray, \
      hdrValFilesToTrainingData
-from regressor.Lut import LutStrategy, LutModel, LutFactory, LutCluster
+from regressor.Lut import LutStrategy, LutModel, LutFactory
+from regressor.LutCache import lutCacheKey, loadLutCache, saveLutCache
 from regressor.PointRegressor import PointRegressor
+from util.lrucache import LruCache
 
 import logging
 log = logging.getLogger('problems')
 
+#regressor types whose built models get cached next to the data, and the
+# extension of the cache file for each
+_CACHED_MODEL_EXTENSIONS = {'LutCluster' : '.clustermodel.npz',
+                            'LutGrid' : '.gridmodel.npz'}
+
+def _roundMantissa(value, mantissa_bits):
+    """Returns float -- 'value' rounded to 'mantissa_bits' bits of
+    mantissa"""
+    mantissa, exponent = math.frexp(value)
+    return math.ldexp(round(mantissa * (1 << mantissa_bits)),
+                      exponent - mantissa_bits)
+
 class ApproxMosModels:
     """
     @description
       Holds information about the MOS lookup tables which the user
       needs to specify.
+
+      Width estimates get cached (one LRU cache per device type), since
+      netlisting asks for the same operating points over and over, e.g.
+      for a parent and its children.  The cache key is the operating
+      point with each value rounded to 'cache_mantissa_bits' bits, and
+      the estimate is for that rounded point, so that an estimate does
+      not depend on what was asked before.  With caching off, points
+      do not get rounded.
+
+    @attributes
+      regressor_type -- string -- see LutStrategy.regressor_type
+      cache_mantissa_bits -- int or None -- # mantissa bits that the
+        values of an operating point get rounded to; None means don't round
+      nmos_width_cache -- LruCache -- of operating point key : nmos width
+      pmos_width_cache -- LruCache -- of operating point key : pmos width
     """
 
-    def __init__(self, nmos_filebase, pmos_filebase):
+    def __init__(self, nmos_filebase, pmos_filebase,
+                 regressor_type='LutCluster', cache_size=10000,
+                 cache_mantissa_bits=32):
         """
         @description        
           nmos_filebase -- string -- To crate nmos data.  Expect ascii files:
@@ -39,10 +68,20 @@ class ApproxMosModels:
             -nmos_filebase.val where each column corresponds to one variable,
              and each row is a different sample.
           pmos_filebase -- string -- same as nmos_filebase
+          regressor_type -- string -- see LutStrategy.regressor_type.
+            'LutGrid' resamples the data onto a regular grid, which makes
+            each estimate cheaper.
+          cache_size -- int -- max # cached widths per device type
+            (0 turns off caching)
+          cache_mantissa_bits -- int or None -- see class description
 
         @return
           mosdata -- ApproxMosModels  object --
         """
+        self.regressor_type = regressor_type
+        self.cache_mantissa_bits = cache_mantissa_bits
+        self.nmos_width_cache = LruCache(cache_size)
+        self.pmos_width_cache = LruCache(cache_size)
         self._nmos_model = self._buildModel(nmos_filebase, 'W')
         self._pmos_model = self._buildModel(pmos_filebase, 'W')
 
@@ -60,22 +99,78 @@ class ApproxMosModels:
         @return
           width -- float -- 
         """
-                
-        # correct for the device multiplier
-        new_point=copy.copy(input_point)
-        new_point['Ids']=new_point['Ids']/mult;
-                
-        return self._nmos_model.simulatePoint(new_point)
+        return self._estimateWidths(self._nmos_model, self.nmos_width_cache,
+                                    [input_point], [mult], False)[0]
 
     def estimatePmosWidth(self, input_point, mult=1):
         """Like estimateNmosWidth(), except pmos.
         """
-        
-        # correct for the device multiplier
-        new_point=copy.copy(input_point)
-        new_point['Ids']=new_point['Ids']/mult;
-        
-        return self._pmos_model.simulatePoint(new_point)
+        return self._estimateWidths(self._pmos_model, self.pmos_width_cache,
+                                    [input_point], [mult], False)[0]
+
+    def estimateNmosWidths(self, input_points, mults=None):
+        """
+        @description
+          Like estimateNmosWidth(), but for many devices at once (e.g.
+          all the nmos devices of a netlist), with one call to the model
+          for the points that are not cached.
+
+        @arguments
+          input_points -- list of dict of var_name : var_value
+          mults -- list of int, or None -- the device multiplier of each
+            point (None means all 1)
+
+        @return
+          widths -- list of float
+        """
+        return self._estimateWidths(self._nmos_model, self.nmos_width_cache,
+                                    input_points, mults, True)
+
+    def estimatePmosWidths(self, input_points, mults=None):
+        """Like estimateNmosWidths(), except pmos.
+        """
+        return self._estimateWidths(self._pmos_model, self.pmos_width_cache,
+                                    input_points, mults, True)
+
+    def _estimateWidths(self, model, cache, input_points, mults, batch):
+        if mults is None:
+            mults = [1] * len(input_points)
+        assert len(mults) == len(input_points)
+
+        widths = [None] * len(input_points)
+        missed_points = {} #key : (point, list of index into widths)
+        for i, (input_point, mult) in enumerate(zip(input_points, mults)):
+            # correct for the device multiplier
+            new_point = copy.copy(input_point)
+            new_point['Ids'] = new_point['Ids']/mult
+
+            if self.cache_mantissa_bits is not None and cache.max_size > 0:
+                for varname, value in new_point.items():
+                    new_point[varname] = _roundMantissa(
+                        value, self.cache_mantissa_bits)
+            key = tuple(sorted(new_point.items()))
+
+            widths[i] = cache.get(key)
+            if widths[i] is None:
+                if missed_points.has_key(key):
+                    missed_points[key][1].append(i)
+                else:
+                    missed_points[key] = (new_point, [i])
+
+        if missed_points:
+            keys = missed_points.keys()
+            points = [missed_points[key][0] for key in keys]
+            if batch:
+                missed_widths = model.simulatePoints(points)
+            else:
+                missed_widths = [model.simulatePoint(point)
+                                 for point in points]
+            for key, width in zip(keys, missed_widths):
+                cache.put(key, width)
+                for i in missed_points[key][1]:
+                    widths[i] = width
+
+        return widths
         
     def _buildModel(self, filebase, target_varname):
         """
@@ -90,20 +185,25 @@ class ApproxMosModels:
           model -- PointRegressor object -- 
 
         @notes
-          Currently the regressor is a Lut.
+          Currently the regressor is a Lut.  LutCluster and LutGrid models
+          get cached next to the data (see regressor/LutCache.py); the
+          cache gets rebuilt whenever the data or the LutStrategy changes.
         """
         log.info("Build LUT model using filebase=%s: begin" % filebase)
 
         #build Lut regressor
         lut_ss = LutStrategy()
         
-        lut_ss.regressor_type = 'LutCluster'
+        lut_ss.regressor_type = self.regressor_type
         
-        if lut_ss.regressor_type == 'LutCluster':
-            clusterfile = filebase + '.clustermodel'
+        if _CACHED_MODEL_EXTENSIONS.has_key(lut_ss.regressor_type):
+            modelfile = filebase + \
+                        _CACHED_MODEL_EXTENSIONS[lut_ss.regressor_type]
+            key = lutCacheKey(filebase, target_varname, lut_ss)
+            model = loadLutCache(modelfile, key)
             
-            if not os.path.exists(clusterfile):
-                log.warning("No cached LUT model, so build one")
+            if model is None:
+                log.warning("No valid cached LUT model, so build one")
                 
                 #get training data
                 log.info("Load training data...")
@@ -116,18 +216,11 @@ class ApproxMosModels:
                 #build PointRegressor
                 model = PointRegressor(regressor, input_varnames, False)
                 
-                fid = open(filebase + '.clustermodel','w')
-                pickle.dump(model,fid)
-                fid.close()                
-                log.info("Saving cached model to disk: %s" % clusterfile)
+                saveLutCache(modelfile, key, lut_ss.regressor_type, model)
+                log.info("Saving cached model to disk: %s" % modelfile)
             
             else:
-                log.info("Reusing the cached model %s..." % clusterfile)
-                
-                #FIXME: we should check the model to see if it corresponds.
-                fid = open(clusterfile, 'r')
-                model = pickle.load(fid)
-                fid.close()
+                log.info("Reusing the cached model %s..." % modelfile)
                 
         else: #old (slow) way
             #get training data
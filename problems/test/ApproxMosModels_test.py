@@ -0,0 +1,97 @@
+import unittest
+
+import os
+import shutil
+
+import numpy
+
+from problems.OpLibrary import ApproxMosModels
+from util.ascii import trainingDataToHdrValFiles
+
+class ApproxMosModelsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+
+        #small synthetic lookup tables, so that no real device data is
+        # needed: W as a function of Vgs and Ids on a grid
+        self.dir = 'test_mosdir'
+        if os.path.exists(self.dir):
+            shutil.rmtree(self.dir)
+        os.mkdir(self.dir)
+        Vgs, Ids = numpy.meshgrid(numpy.linspace(0.5, 1.5, 6),
+                                  numpy.linspace(1e-4, 2e-3, 6))
+        Vgs, Ids = Vgs.ravel(), Ids.ravel()
+        self.nmos_filebase = os.path.join(self.dir, 'nmos_data')
+        self.pmos_filebase = os.path.join(self.dir, 'pmos_data')
+        for filebase, k in [(self.nmos_filebase, 1e-3),
+                            (self.pmos_filebase, 3e-3)]:
+            W = k * Ids / (Vgs - 0.3)**2
+            trainingDataToHdrValFiles(filebase, ['Vgs', 'Ids', 'W'],
+                                      numpy.array([Vgs, Ids, W]))
+
+    def _models(self, cache_size=10000, cache_mantissa_bits=32):
+        return ApproxMosModels(self.nmos_filebase, self.pmos_filebase,
+                               cache_size=cache_size,
+                               cache_mantissa_bits=cache_mantissa_bits)
+
+    def testWidthCache(self):
+        if self.just1: return
+        models = self._models()
+        cache = models.nmos_width_cache
+        point = {'Vgs':1.0, 'Ids':1e-3}
+
+        w = models.estimateNmosWidth(point)
+        self.assertEqual((cache.num_hits, cache.num_misses), (0, 1))
+        self.assertEqual(models.estimateNmosWidth(dict(point)), w)
+        self.assertEqual((cache.num_hits, cache.num_misses), (1, 1))
+
+        #same operating point per device
+        point2 = dict(point)
+        point2['Ids'] = 2e-3
+        self.assertEqual(models.estimateNmosWidth(point2, 2), w)
+        self.assertEqual((cache.num_hits, cache.num_misses), (2, 1))
+
+        #batches use the same cache
+        point3 = dict(point)
+        point3['Vgs'] = 0.8
+        widths = models.estimateNmosWidths([point, point3, point3])
+        self.assertEqual(widths[0], w)
+        self.assertEqual(widths[1], widths[2])
+        self.assertEqual(models.estimateNmosWidth(point3), widths[1])
+        self.assertEqual(len(cache), 2)
+
+        #the pmos cache is separate
+        self.assertEqual(len(models.pmos_width_cache), 0)
+        self.assertNotEqual(models.estimatePmosWidth(point), w)
+
+    def testRounding(self):
+        if self.just1: return
+        point = {'Vgs':1.01, 'Ids':1.01e-3}
+        rounded_point = {'Vgs':1.0, 'Ids':1.0 / 1024.0}
+
+        #with the cache on, estimates are for the rounded point
+        models = self._models(cache_mantissa_bits=4)
+        self.assertEqual(models.estimateNmosWidth(point),
+                         models._nmos_model.simulatePoint(rounded_point))
+        self.assertNotEqual(models.estimateNmosWidth(point),
+                            models._nmos_model.simulatePoint(point))
+
+        #with the cache off, points do not get rounded
+        models = self._models(cache_size=0, cache_mantissa_bits=4)
+        self.assertEqual(models.estimateNmosWidth(point),
+                         models._nmos_model.simulatePoint(point))
+        self.assertEqual(models.estimateNmosWidths([point, point]),
+                         [models._nmos_model.simulatePoint(point)] * 2)
+        self.assertEqual(len(models.nmos_width_cache), 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+if __name__ == '__main__':
+
+    import logging
+    logging.basicConfig()
+    logging.getLogger('problems').setLevel(logging.WARNING)
+
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest, os
 from tests import doctest, importSuite
 
+from ApproxMosModels_test import ApproxMosModelsTest
 from Library_test import LibraryTest
 from OpLibrary_test import OpLibraryTest
 from Problems_test import ProblemsTest
@@ -10,6 +11,7 @@ TestClasses = [ \
     LibraryTest,
     SizesLibraryTest,
     OpLibraryTest,
+    ApproxMosModelsTest,
     ProblemsTest,
     ]
 
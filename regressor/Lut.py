@@ -5,19 +5,22 @@ Holds:
 -LutStrategy
 -LutModel
 -LutFactory
+-LutCluster
+-LutGrid
 """
 
+import copy
 import math
+import multiprocessing
 import random
+import types
 
 import numpy
 
-# For the removed KD tree implementation (see simulate)
-# from util.KDTree import *
-
 from adts import *
 from util.ascii import *
 from util import mathutil
+from util.kdtree import KDTree
 
 import logging
 
@@ -31,6 +34,21 @@ class LutStrategy:
     @attributes
       bandwidth -- the bigger this number is, the more 'smoothing' it does,
         i.e. the more that faraway training points matter.  In (0,1.0]
+      max_chunk_bytes -- int -- LutModel.simulate() handles the query
+        points in chunks, such that its temporary arrays take about this
+        much memory
+      use_spatial_index -- bool -- if True, LutModel keeps its training
+        points in a k-d tree, and each query only looks at the training
+        points within the bandwidth (rather than at all of them)
+      min_num_neighbours -- int -- if > 0 (and use_spatial_index), then
+        for a query point with fewer training points than this within the
+        bandwidth, the bandwidth gets widened (up to 1.0) until there are
+        that many
+      regressor_type -- string -- 'LutModel', 'LutCluster' or 'LutGrid'
+      grid_points_per_var -- int -- for LutGrid: the max # grid points
+        along each input var
+      grid_fill_type -- string -- for LutGrid: the regressor_type that
+        computes the grid values from the (scattered) training data
     """ 
     def __init__(self):
         """        
@@ -38,16 +56,27 @@ class LutStrategy:
           lut_ss -- LutStrategy object          
         """
         self.bandwidth = 0.05
+        self.max_chunk_bytes = 32 * 1024 * 1024
+        self.use_spatial_index = True
+        self.min_num_neighbours = 0
         
         # indicate the regressortype to use
         self.regressor_type = 'LutModel'
         
         # self.regressor_type = 'LutCluster'
+
+        self.grid_points_per_var = 16
+        self.grid_fill_type = 'LutCluster'
         
     def __str__(self):
         s = "LutStrategy={"
         s += ' bandwidth=%.3f' % self.bandwidth
+        s += ' max_chunk_bytes=%d' % self.max_chunk_bytes
+        s += ' use_spatial_index=%s' % self.use_spatial_index
+        s += ' min_num_neighbours=%d' % self.min_num_neighbours
         s += ' regressor=%s' % self.regressor_type
+        s += ' grid_points_per_var=%d' % self.grid_points_per_var
+        s += ' grid_fill_type=%s' % self.grid_fill_type
         s += " /LutStrategy}"  
         return s
 
@@ -81,13 +110,18 @@ class LutFactory:
           model is during simulation.
         """
         if ss.regressor_type=='LutModel':
-            return LutModel(X, y, ss.bandwidth)
+            return LutModel(X, y, ss.bandwidth, ss.max_chunk_bytes,
+                            ss.use_spatial_index, ss.min_num_neighbours)
             
         elif ss.regressor_type=='LutCluster':
-            return LutCluster(None, X, y)
+            return LutCluster(X, y)
+
+        elif ss.regressor_type=='LutGrid':
+            return LutGrid(X, y, ss)
             
         else:
-            return LutModel(X, y, ss.bandwidth)
+            return LutModel(X, y, ss.bandwidth, ss.max_chunk_bytes,
+                            ss.use_spatial_index, ss.min_num_neighbours)
             
 
 class LutModel:
@@ -104,13 +138,21 @@ class LutModel:
         [0,1] based on the max and min value found for that input variable
       training_y -- 1d array [sample #] -- all the training output data
       bandwidth -- float -- kernel width
+      max_chunk_bytes -- int -- see LutStrategy
+      training_tree -- KDTree or None -- over training_X01, if
+        LutStrategy.use_spatial_index
+      min_num_neighbours -- int -- see LutStrategy
+      bandwidth_increase -- float -- step size for widening the bandwidth
     """ 
-    def __init__(self, X, y, bandwidth):
+    def __init__(self, X, y, bandwidth, max_chunk_bytes=32 * 1024 * 1024,
+                 use_spatial_index=False, min_num_neighbours=0):
         """        
         @arguments
           X -- 2d array [input variable #][sample #] -- the training input data
           y -- 1d array [sample #] -- all the training output dat
-          ss -- LutStrategy object
+          bandwidth, max_chunk_bytes, min_num_neighbours -- see class
+            description
+          use_spatial_index -- bool -- see LutStrategy
         
         @return
           lut_model -- LutModel object -- a simulatable model          
@@ -131,21 +173,23 @@ class LutModel:
         self.training_X01 = mathutil.scaleTo01(keep_X, self.min_x, self.max_x)
         self.training_y = y
         
-# For the removed KD tree implementation (see simulate)
-#         # construct the KDTree for the training data
-#         self.training_tree = KDTree(self.training_X01.shape[0], 1)
-#         tt=numpy.transpose(self.training_X01).astype("f")
-#         self.training_tree.set_coords(tt)
-#         self.bandwidth_increase = bandwidth * 0.01
-#         self.min_nb_lut_indices=20
-                
         self.bandwidth = bandwidth
+        self.max_chunk_bytes = max_chunk_bytes
+
+        #a k-d tree lets each query just look at the training points
+        # within the bandwidth
+        if use_spatial_index:
+            self.training_tree = KDTree(self.training_X01)
+        else:
+            self.training_tree = None
+        self.min_num_neighbours = min_num_neighbours
+        self.bandwidth_increase = bandwidth * 0.01
 
     def __str__(self):
         s = "LutModel={"
         s += ' bandwidth=%.3f' % self.bandwidth
         s += '; # varying input variables=%d' % self.training_X01.shape[0]
-        s += '; # training samples=%d' % self.full_X.shape[1]
+        s += '; # training samples=%d' % self.training_X01.shape[1]
         s += " /LutModel}"  
         return s
 
@@ -160,79 +204,196 @@ class LutModel:
         
         @return
           yhat -- 1d array [sample #] -- simulated outputs
+
+        @notes
+          Each output is the kernel-weighted average of the training
+          outputs, where the kernel is mathutil.epanechnikovQuadraticKernel
+          of the (scaled) euclidian distance.
+
+          Either way (with or without training_tree), the sums are
+          accumulated in training-sample order (via cumsum, not sum, which
+          adds pairwise), and training points outside the bandwidth only
+          add 0.0.  So the outputs are identical to those of adding up one
+          training sample at a time -- unless the bandwidth gets widened
+          (see min_num_neighbours).
         """
         keep_X = numpy.take(X, self.keep_I, 0)
         X01 = mathutil.scaleTo01(keep_X, self.min_x, self.max_x)
-        yhat = numpy.zeros(X.shape[1])
-        
+        if self.training_X01.shape[1] == 0:
+            return numpy.zeros(X.shape[1])
+        if self.training_tree is not None:
+            return self._simulateWithTree(X01)
+        else:
+            return self._simulateChunked(X01)
+
+    def _simulateChunked(self, X01):
+        """Simulates the (scaled) query points X01, in chunks.  For each
+        chunk, the distances to all training points come from array
+        operations."""
+        num_samples = X01.shape[1]
+        yhat = numpy.zeros(num_samples)
+        training_X01 = numpy.asarray(self.training_X01, dtype=float)
+        training_y = numpy.asarray(self.training_y, dtype=float)
+        N = training_X01.shape[1]
+
+        #about 4 temporary arrays of [chunk sample #][training sample #]
+        chunk_size = max(1, self.max_chunk_bytes / (4 * 8 * N))
+        for start in range(0, num_samples, chunk_size):
+            chunk_X01 = X01[:, start:start + chunk_size]
+
+            #squared distances, adding up the vars in order like
+            # mathutil.distance() does (and squaring with numpy.power(),
+            # like its '** 2' does)
+            sq_dists = numpy.zeros((chunk_X01.shape[1], N))
+            for var_i in range(training_X01.shape[0]):
+                diffs = numpy.subtract.outer(chunk_X01[var_i, :],
+                                             training_X01[var_i, :])
+                sq_dists += numpy.power(diffs, 2.0)
+
+            W = mathutil.epanechnikovQuadraticKernels(numpy.sqrt(sq_dists),
+                                                      self.bandwidth)
+            sum_w = numpy.cumsum(W, axis=1)[:, -1]
+            sum_output = numpy.cumsum(W * training_y, axis=1)[:, -1]
+
+            chunk_yhat = numpy.zeros(len(sum_w))
+            ok = sum_w > 0
+            chunk_yhat[ok] = sum_output[ok] / sum_w[ok]
+            yhat[start:start + chunk_size] = chunk_yhat
+
+        return yhat
+
+    def _simulateWithTree(self, X01):
+        """Simulates the (scaled) query points X01, one at a time, where
+        each one only looks at the training points that training_tree
+        finds within the bandwidth"""
+        yhat = numpy.zeros(X01.shape[1])
+        training_y = numpy.asarray(self.training_y, dtype=float)
+        tree = self.training_tree
         for sample_i in range(X01.shape[1]):
-            sum_w, sum_output = 0.0, 0.0
-            for training_sample_j in range(self.training_X01.shape[1]):
-                dist = mathutil.distance(X01[:, sample_i],
-                                         self.training_X01[:,training_sample_j])
-                w = mathutil.epanechnikovQuadraticKernel(dist, self.bandwidth)
-                sum_output += w * self.training_y[training_sample_j]
-                sum_w += w
-            
+            x = X01[:, sample_i]
+            bw = self.bandwidth
+            I = tree.candidates(x, bw)
+            dists = tree.distances(x, I)
+            if self.min_num_neighbours > 0 and \
+                   numpy.sum(dists <= bw) < self.min_num_neighbours:
+                bw = self._widenedBandwidth(x)
+                I = tree.candidates(x, bw)
+                dists = tree.distances(x, I)
+            if len(I) == 0:
+                continue
+
+            W = mathutil.epanechnikovQuadraticKernels(dists, bw)
+            sum_w = numpy.cumsum(W)[-1]
             if sum_w > 0:
+                sum_output = numpy.cumsum(W * training_y[I])[-1]
                 yhat[sample_i] = sum_output / sum_w
-            else:
-                yhat[sample_i] = 0.0
-
-# It can be done with a KD tree like this 
-# (using the KDtree implementation removed in rev 168)
-#
-#             sum_w, sum_output = 0.0, 0.0
-#             point=numpy.transpose(X01[:, sample_i]).astype("f")
-#             bw=self.bandwidth
-#             
-#             # search neighbors
-#             self.training_tree.search(point, bw)
-#     
-#             # get indices & radii of points
-#             indices=self.training_tree.get_indices()
-#             
-#             if len(indices) < self.min_nb_lut_indices:
-#                 log.warning('Not enough LUT indices found, increasing bandwidth...')        
-#                 while len(indices) < self.min_nb_lut_indices:              
-#                     bw=bw + self.bandwidth_increase
-#                     
-#                     # search neighbors
-#                     self.training_tree.search(point, bw)
-#             
-#                     # get indices & radii of points
-#                     indices=self.training_tree.get_indices()
-#                     if bw > 1:
-#                         log.warning(' Bandwith too high, out of range')
-#                         bw=1
-#                         break
-#                 
-#                 log.warning(' Increased bandwidth to %f, found %d indices' %\
-#                         (bw, len(indices)))
-#             
-#             for training_sample_j in indices:
-#                 dist = mathutil.distance(X01[:, sample_i],
-#                                          self.training_X01[:,training_sample_j])
-#                 w = mathutil.epanechnikovQuadraticKernel(dist, bw)
-#                 sum_output += w * self.training_y[training_sample_j]
-#                 sum_w += w
-# 
-#                 
-#             if sum_w > 0.0:
-#                 yhat[sample_i] = sum_output / sum_w
-#             else:
-#                 yhat[sample_i] = 0.0
-       
+
         return yhat
 
+    def _widenedBandwidth(self, x):
+        """
+        @description
+          Returns the bandwidth to use for query point 'x' when it has
+          fewer than min_num_neighbours training points within
+          self.bandwidth: the smallest self.bandwidth + k*bandwidth_increase
+          that has enough, but at most 1.0.
+        """
+        tree = self.training_tree
+        num_needed = min(self.min_num_neighbours, len(tree))
+
+        #find a radius that has enough training points, doubling it
+        radius = self.bandwidth
+        while True:
+            I, dists = tree.query(x, radius)
+            if len(I) >= num_needed or radius >= 1.0:
+                break
+            radius = min(2.0 * radius, 1.0)
+
+        if len(I) < num_needed:
+            bw = 1.0
+        else:
+            needed_dist = numpy.sort(dists)[num_needed - 1]
+            k = max(1, int(math.ceil((needed_dist - self.bandwidth) /
+                                     self.bandwidth_increase)))
+            bw = self.bandwidth + k * self.bandwidth_increase
+            while bw < needed_dist:
+                bw += self.bandwidth_increase
+            bw = min(bw, 1.0)
+        log.debug('Not enough LUT neighbours within bandwidth %g; widened '
+                  'it to %g' % (self.bandwidth, bw))
+        return bw
+
     def simulate1(self, x):
         X = numpy.reshape(x, (len(x),1))
         return self.simulate(X)[0]
 
+    def numNeighbours(self, X):
+        """
+        @description
+          For each input point (column) in X, returns the number of
+          training points within the bandwidth, ie that its simulated
+          output is based on.  (Ignores min_num_neighbours.)
+
+        @arguments
+          X -- 2d array [input variable #][sample #] -- inputs
+
+        @return
+          num_neighbours -- 1d array of int [sample #]
+        """
+        keep_X = numpy.take(X, self.keep_I, 0)
+        X01 = mathutil.scaleTo01(keep_X, self.min_x, self.max_x)
+        num_neighbours = numpy.zeros(X.shape[1], dtype=int)
+        if self.training_X01.shape[1] == 0:
+            return num_neighbours
+        training_X01 = numpy.asarray(self.training_X01, dtype=float)
+        for sample_i in range(X.shape[1]):
+            x = X01[:, sample_i]
+            if self.training_tree is not None:
+                I, dists = self.training_tree.query(x, self.bandwidth)
+            else:
+                sq_dists = numpy.zeros(training_X01.shape[1])
+                for var_i in range(training_X01.shape[0]):
+                    sq_dists += numpy.power(x[var_i] - training_X01[var_i, :],
+                                            2.0)
+                dists = numpy.sqrt(sq_dists)
+            num_neighbours[sample_i] = numpy.sum(dists <= self.bandwidth)
+        return num_neighbours
+
 class LutDataPruner:
-    """Prunes data in a lookup table"""
-    def __init__(self):
-        pass
+    """
+    @description
+      Prunes data in a lookup table
+
+    @attributes
+      lut_ss -- LutStrategy -- of the LUT models that the pruned data is for
+      num_processes -- int -- # processes that compute kernel sums (see
+        _LeaveOneOutSums)
+      num_cands -- int -- max # samples to consider per pruning step
+
+    @notes
+      For a LutModel without bandwidth widening, each sample's error when
+      it gets left out comes from kernel sums that get updated as samples
+      get pruned (see _LeaveOneOutSums), so scoring a candidate is O(1).
+      For other strategies, each candidate needs its own model.
+    """
+    def __init__(self, lut_ss=None, num_processes=1, num_cands=10000):
+        """
+        @arguments
+          lut_ss -- LutStrategy or None -- None means LutStrategy()
+          num_processes, num_cands -- see class description
+
+        @return
+          LutDataPruner object
+        """
+        if lut_ss is None:
+            lut_ss = LutStrategy()
+        self.lut_ss = lut_ss
+        self.num_processes = num_processes
+        self.num_cands = num_cands
+
+        #can the leave-one-out errors come from _LeaveOneOutSums?
+        self._incremental = (lut_ss.regressor_type == 'LutModel' and
+                             lut_ss.min_num_neighbours == 0)
         
     def prune(self, X, y, Xy, thr_error, min_N, pruned_filebase, all_varnames):
         """
@@ -256,7 +417,7 @@ class LutDataPruner:
             
         @return        
           keep_I -- list of int -- the indices of the samples of X or
-            y that we want to keep.  Rest have been pruned away.
+            y that we want to keep (sorted).  Rest have been pruned away.
           AND
           <<pruned_filebase.hdr, pruned_filebase.val>>
         """
@@ -264,34 +425,49 @@ class LutDataPruner:
         assert X.shape[1] == Xy.shape[1] == len(y)
         N = len(y)
         keep_I = range(N)
+        #position of each sample in keep_I, so that pruning one is O(1)
+        position = range(N)
+        y_range = max(y) - min(y)
+
+        if self._incremental:
+            loo_sums = _LeaveOneOutSums(X, y, self.lut_ss.bandwidth,
+                                        self.num_processes)
+        else:
+            loo_sums = None
 
         max_error = 0
         for prune_iter in range(100000):
             log.info('=======================================================')
             log.info('LutDataPruner iteration #%d; #samples init=%d, now=%d' %
                      (prune_iter, N, len(keep_I)))
-            max_error, next_keep_I = self._prune1(X, y, keep_I, thr_error)
-            if len(next_keep_I) <= min_N:
+            max_error, prune_i = self._prune1(X, y, y_range, keep_I,
+                                              thr_error, loo_sums)
+            if len(keep_I) - 1 <= min_N:
                 log.info('Stop pruning because we have <= min num samples')
                 break
             elif max_error > thr_error:
                 log.info('Stop pruning because it would exceed error threshold')
                 break
             else:
-                keep_I = next_keep_I
+                last_i = keep_I.pop()
+                if last_i != prune_i:
+                    keep_I[position[prune_i]] = last_i
+                    position[last_i] = position[prune_i]
+                if loo_sums is not None:
+                    loo_sums.remove(prune_i)
 
             # -periodically store data to file
             if prune_iter > 10 and prune_iter%10 == 0:
-                keep_Xy = numpy.take(Xy, keep_I, 1)
+                keep_Xy = numpy.take(Xy, sorted(keep_I), 1)
                 trainingDataToHdrValFiles(pruned_filebase, all_varnames,keep_Xy)
                 log.info("Updated pruned output in %s.hdr, %s.val" %
                          (pruned_filebase, pruned_filebase))
                 
                 
         log.info('=======================================================')
-        return keep_I
+        return sorted(keep_I)
 
-    def _prune1(self, X, y, keep_I, thr_error):
+    def _prune1(self, X, y, y_range, keep_I, thr_error, loo_sums):
         """
         @description
           Strategy: keep randomly choosing samples from keep_I until we find
@@ -302,39 +478,37 @@ class LutDataPruner:
         @arguments
           X -- 2d array -- has _all_ data
           y -- 1d array -- has _all_ data
+          y_range -- float -- max(y) - min(y), to normalize errors
           keep_I -- list of int -- the indices of the samples of X or
             y that we want to keep.  Rest have been pruned away.
           thr_error -- float -- 
+          loo_sums -- _LeaveOneOutSums or None -- for keep_I, if the
+            errors can come from it
             
         @return
-          new_keep_I -- list of int -- remove_I, with one more
-            sample removed from
+          best_error -- float -- error at the sample to prune
+          best_i -- int -- the sample to prune
         """
-        num_cands = 10000 #magic number alert
-
-        #
-        lut_factory = LutFactory()
-        lut_ss = LutStrategy()
-
         #choose which samples we consider pruning away
         N = len(keep_I)
-        num_cands = min(N, max(1, num_cands))
-        cand_sample_I = random.sample(keep_I, num_cands)
+        num_cands = min(N, max(1, self.num_cands))
 
         #'best' here is the sample which returns the lowest error
-        best_error, best_keep_I = float('inf'), None
-        for j, cand_sample_i in enumerate(cand_sample_I):
-            cand_keep_I = [i for i in keep_I if i != cand_sample_i]
-            model = lut_factory.build(numpy.take(X, cand_keep_I, 1),
-                                      numpy.take(y, cand_keep_I), lut_ss)
-            error = abs(model.simulate1(X[:,cand_sample_i]) - y[cand_sample_i])
-            error = error / (max(y) - min(y)) #normalize
+        best_error, best_i = float('inf'), None
+        for j, cand_sample_i in enumerate(_randomSample(keep_I, num_cands)):
+            if loo_sums is not None and \
+                   not loo_sums.changesScaling(cand_sample_i):
+                yhat = loo_sums.looEstimate(cand_sample_i)
+            else:
+                yhat = self._looEstimate(X, y, keep_I, cand_sample_i)
+            error = abs(yhat - y[cand_sample_i])
+            error = error / y_range #normalize
             
             if error < best_error:
                 best_error = error
-                best_keep_I = cand_keep_I
+                best_i = cand_sample_i
 
-            if (j % 10) == 0 or cand_sample_i == cand_sample_I[-1]:
+            if (j % 10) == 0 or j == num_cands - 1:
                 log.info('  LutDataPruner cand #%i/%i; error=%8g, lowest=%8g' % 
                          (j+1, num_cands, error, best_error))
 
@@ -343,7 +517,186 @@ class LutDataPruner:
                          (thr_error, j+1))
                 break
 
-        return best_error, best_keep_I
+        return best_error, best_i
+
+    def _looEstimate(self, X, y, keep_I, sample_i):
+        """Returns what a LUT model of the samples in keep_I, except
+        sample_i, estimates at sample_i"""
+        cand_keep_I = sorted([i for i in keep_I if i != sample_i])
+        lut_ss = self.lut_ss
+        if self._incremental:
+            #one query point: a k-d tree would not pay off
+            lut_ss = copy.copy(lut_ss)
+            lut_ss.use_spatial_index = False
+        model = LutFactory().build(numpy.take(X, cand_keep_I, 1),
+                                   numpy.take(y, cand_keep_I), lut_ss)
+        return model.simulate1(X[:,sample_i])
+
+def _randomSample(population, num_samples):
+    """Generates 'num_samples' distinct elements of 'population' (a
+    list), in random order.  Unlike random.sample(), the cost is in
+    proportion to how many elements the caller actually uses."""
+    N = len(population)
+    chosen = set()
+    while len(chosen) < num_samples:
+        i = random.randrange(N)
+        if i not in chosen:
+            chosen.add(i)
+            yield population[i]
+
+class _LeaveOneOutSums:
+    """
+    @description
+      For each kept sample of a LUT dataset, the sums that a LutModel of
+      the _other_ kept samples would compute at that sample: of kernel
+      weights, and of kernel-weighted outputs.  Their ratio is the
+      sample's leave-one-out estimate.
+
+      Pruning a sample only changes the sums of its neighbours (the kept
+      samples within the bandwidth) -- unless it is the only kept sample
+      at the min or max of some var, because then the scaling of the vars
+      changes and all the sums get recomputed.
+
+    @attributes
+      X, y -- 2d array [var #][sample #], 1d array [sample #] -- all data
+      bandwidth -- float -- kernel width, as in LutModel
+      num_processes -- int -- when recomputing all sums, spread them across
+        this many processes
+      alive -- 1d array of bool [sample #] -- is the sample kept?
+      min_x, max_x -- 1d array [var #] -- over the kept samples
+      num_at_min, num_at_max -- 1d array of int [var #] -- # kept samples
+        at min_x, max_x
+      X01 -- 2d array [varying var #][sample #] -- X of the vars that vary
+        among the kept samples, scaled like LutModel does
+      tree -- KDTree -- over X01 of the kept samples, as of when it got built
+      tree_I -- 1d array of int -- sample index of each tree point
+      sum_w, sum_wy -- 1d array [sample #] -- the sums
+      num_neighbours -- 1d array of int [sample #] -- # terms in the sums
+    """
+
+    def __init__(self, X, y, bandwidth, num_processes=1):
+        self.X = numpy.asarray(X, dtype=float)
+        self.y = numpy.asarray(y, dtype=float)
+        self.bandwidth = bandwidth
+        self.num_processes = num_processes
+        self.alive = numpy.ones(len(y), dtype=bool)
+        self._recompute()
+
+    def looEstimate(self, sample_i):
+        """Returns float -- what a LutModel of the kept samples except
+        sample_i would estimate at sample_i.  Only valid if
+        changesScaling(sample_i) is False."""
+        if self.num_neighbours[sample_i] == 0:
+            return 0.0
+        return self.sum_wy[sample_i] / self.sum_w[sample_i]
+
+    def changesScaling(self, sample_i):
+        """Returns True if leaving out sample_i changes the min or max of
+        some var among the kept samples"""
+        x = self.X[:, sample_i]
+        return bool(numpy.any((x == self.min_x) & (self.num_at_min == 1)) or
+                    numpy.any((x == self.max_x) & (self.num_at_max == 1)))
+
+    def remove(self, sample_i):
+        """Prunes sample_i (a kept sample), and updates the sums"""
+        assert self.alive[sample_i]
+        changes_scaling = self.changesScaling(sample_i)
+        self.alive[sample_i] = False
+        if changes_scaling:
+            self._recompute()
+            return
+
+        x = self.X[:, sample_i]
+        self.num_at_min -= (x == self.min_x)
+        self.num_at_max -= (x == self.max_x)
+        I, K = self._neighbours(sample_i)
+        self.sum_w[I] -= K
+        self.sum_wy[I] -= K * self.y[sample_i]
+        self.num_neighbours[I] -= 1
+
+        #don't let the tree fill up with pruned samples
+        if len(self.tree_I) > 2 * numpy.sum(self.alive):
+            self._buildTree()
+
+    def _recompute(self):
+        """Recomputes the scaling, the tree, and all the sums"""
+        alive_I = numpy.nonzero(self.alive)[0]
+        alive_X = numpy.take(self.X, alive_I, 1)
+        self.min_x = numpy.min(alive_X, 1)
+        self.max_x = numpy.max(alive_X, 1)
+        self.num_at_min = numpy.sum(alive_X == self.min_x[:, numpy.newaxis], 1)
+        self.num_at_max = numpy.sum(alive_X == self.max_x[:, numpy.newaxis], 1)
+
+        keep_vars = [var_i for var_i in range(self.X.shape[0])
+                     if self.min_x[var_i] < self.max_x[var_i]]
+        self.X01 = mathutil.scaleTo01(numpy.take(self.X, keep_vars, 0),
+                                      numpy.take(self.min_x, keep_vars),
+                                      numpy.take(self.max_x, keep_vars))
+        self._buildTree()
+
+        N = len(self.y)
+        self.sum_w = numpy.zeros(N)
+        self.sum_wy = numpy.zeros(N)
+        self.num_neighbours = numpy.zeros(N, dtype=int)
+        num_processes = min(self.num_processes, len(alive_I))
+        if num_processes <= 1:
+            results = [self._kernelSums(alive_I)]
+            chunks = [alive_I]
+        else:
+            #the workers are forked, so the initializer hands them self
+            # without pickling it (also to any worker that gets respawned)
+            chunks = numpy.array_split(alive_I, 4 * num_processes)
+            log.info('Compute kernel sums of %d samples across %d processes' %
+                     (len(alive_I), num_processes))
+            process_pool = multiprocessing.Pool(num_processes, _initWorker,
+                                                (self,))
+            try:
+                results = process_pool.map(_kernelSumsInWorker, chunks)
+            finally:
+                process_pool.terminate()
+        for I, (sum_w, sum_wy, num_neighbours) in zip(chunks, results):
+            self.sum_w[I] = sum_w
+            self.sum_wy[I] = sum_wy
+            self.num_neighbours[I] = num_neighbours
+
+    def _buildTree(self):
+        self.tree_I = numpy.nonzero(self.alive)[0]
+        self.tree = KDTree(numpy.take(self.X01, self.tree_I, 1))
+
+    def _neighbours(self, sample_i):
+        """Returns the kept samples (other than sample_i) within the
+        bandwidth of sample_i, and their kernel weights"""
+        x = self.X01[:, sample_i]
+        tree_I = self.tree.candidates(x, self.bandwidth)
+        dists = self.tree.distances(x, tree_I)
+        K = mathutil.epanechnikovQuadraticKernels(dists, self.bandwidth)
+        I = self.tree_I[tree_I]
+        keep = (K > 0.0) & self.alive[I] & (I != sample_i)
+        return I[keep], K[keep]
+
+    def _kernelSums(self, sample_I):
+        """Returns the sums (sum_w, sum_wy, num_neighbours) of each
+        sample in sample_I"""
+        sum_w = numpy.zeros(len(sample_I))
+        sum_wy = numpy.zeros(len(sample_I))
+        num_neighbours = numpy.zeros(len(sample_I), dtype=int)
+        for j, sample_i in enumerate(sample_I):
+            I, K = self._neighbours(sample_i)
+            sum_w[j] = numpy.sum(K)
+            sum_wy[j] = numpy.dot(K, self.y[I])
+            num_neighbours[j] = len(I)
+        return sum_w, sum_wy, num_neighbours
+
+_worker_loo_sums = None #of _kernelSumsInWorker(); set by _initWorker()
+
+def _initWorker(loo_sums):
+    """Sets up a worker process of _LeaveOneOutSums._recompute()"""
+    global _worker_loo_sums
+    _worker_loo_sums = loo_sums
+
+def _kernelSumsInWorker(sample_I):
+    """Like _LeaveOneOutSums._kernelSums(), in a worker process"""
+    return _worker_loo_sums._kernelSums(sample_I)
 
 class LutCluster:
     """ Represents a cluster of data points in the LUT point space 
@@ -359,9 +712,26 @@ class LutCluster:
         
         This approach seems to be yielding good results and has good
         performance, also for large datasets.
+
+    @attributes
+      num_vars -- int -- the cluster tree has one level per var
+      _start, _end -- 1d array of int [node #] -- each node's slice of
+        _xvalues (node 0 is the root)
+      _xvalues -- 1d array [entry #] -- per node, its axis values: sorted
+        and unique for a node with children; for a bottom level node, the
+        x values of its data points, sorted by their y value
+      _yvalues -- 1d array [entry #] -- for bottom level nodes, the y
+        value of each data point
+      _child -- 1d array of int [entry #] -- for nodes with children,
+        the child node of each axis value (-1 in bottom level nodes)
+
+    @notes
+      The cluster tree gets compiled into the flat arrays above, so that
+      simulate() can walk it for many points at once with array
+      operations, rather than with 2^num_vars python calls per point.
     """
     
-    def __init__(self, parent, X, y):
+    def __init__(self, X, y):
         """
         @description
             Build the cluster
@@ -376,115 +746,375 @@ class LutCluster:
         #preconditions
         assert len(y) == X.shape[1]
 
-        #base data
-        n, N = X.shape
-        self.children = []
-        self.level = 0
-                
-        # determine the level of the cluster
-        if parent==None:
-            # root cluster
-            self.level=0
-        else:
-            self.level=parent.level+1
+        X = numpy.asarray(X, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        self.num_vars = X.shape[0]
+
+        starts, ends = [], []
+        xvalues, yvalues, children = [], [], []
+        self._addNode(X, y, 0, starts, ends, xvalues, yvalues, children)
+
+        self._start = numpy.array(starts, dtype=int)
+        self._end = numpy.array(ends, dtype=int)
+        self._xvalues = numpy.concatenate(xvalues)
+        self._yvalues = numpy.concatenate(yvalues)
+        self._child = numpy.concatenate(children)
+
+    def _addNode(self, X, y, level, starts, ends, xvalues, yvalues, children):
+        """Adds the node for data X=>y at 'level' (and all its children);
+        returns the node's index"""
+        node = len(starts)
+        #each node's entries come right after those of the previous node
+        if ends: start = ends[-1]
+        else:    start = 0
+        starts.append(start)
         
         # determine if this cluster is bottom level
         # i.e. are there only one variable left
-        if self.level + 1 == n:
-            # yes it is
-            
-            self.has_children=False
-            
-            # we save the values sorted, otherwise we'll have to do it during
-            # the interpolation            
-            
-            # note that we save the values sorted by target value, as we
-            # cannot be sure that the I=f(W) is really a function (i.e. invertible).
-            # the effect will be that when we interpolate, we'll always choose
-            # the smallest W available.            
-            
+        if level + 1 == self.num_vars:
+            # we save the values sorted by target value, as we
+            # cannot be sure that the I=f(W) is really a function (i.e.
+            # invertible).  The effect will be that when we interpolate,
+            # we'll always choose the smallest W available.
             perm_I = numpy.argsort(y)
-            
-            self.xvalues = numpy.take(X[self.level,:], perm_I)
-            self.yvalues = numpy.take(y, perm_I)
-            
-        else:
-            self.has_children = True
-            
-            # construct the list of axis-values for this cluster
-            # returns a sorted list without duplicates
-            self.xvalues = mathutil.uniquifyVector(X[self.level,:])
-            
-            # build a cluster for each axis value
-            for xvalue in self.xvalues:            
-                # find the points that are contained in the new child cluster
-                I = [i for i,val in enumerate(X[self.level,:]) if val==xvalue]
+            node_xvalues = numpy.take(X[level,:], perm_I)
+            ends.append(start + len(node_xvalues))
+            xvalues.append(node_xvalues)
+            yvalues.append(numpy.take(y, perm_I))
+            children.append(-numpy.ones(len(node_xvalues), dtype=int))
+            return node
 
-                # build the child
-                child = LutCluster(self, numpy.take(X,I,1), numpy.take(y,I))
-                
-                self.children.append(child)
-                
-    def simulate(self, point):
+        # construct the list of axis-values for this cluster
+        # returns a sorted list without duplicates
+        node_xvalues = mathutil.uniquifyVector(X[level,:])
+        ends.append(start + len(node_xvalues))
+        xvalues.append(node_xvalues)
+        yvalues.append(numpy.zeros(len(node_xvalues)))
+        node_children = numpy.zeros(len(node_xvalues), dtype=int)
+        children.append(node_children)
+
+        # build a cluster for each axis value
+        for k, xvalue in enumerate(node_xvalues):
+            I = numpy.nonzero(X[level,:] == xvalue)[0]
+            node_children[k] = self._addNode(numpy.take(X, I, 1),
+                                             numpy.take(y, I), level + 1,
+                                             starts, ends, xvalues, yvalues,
+                                             children)
+        return node
+
+    def simulate(self, X):
         """ 
         @description
-            find the predicted value for the given point based upon the 
+            find the predicted value for the given points based upon the 
             data present in this cluster. This is either interpolation of
             the actual data present, or choosing the best child clusters
             to interpolate between.
             
         @arguments
-          point -- list -- contains the point data
+          X -- 2d array [input variable #][sample #] -- inputs.  (Or a
+            list holding just one point.)
             
         @return
-          the interpolated value
+          yhat -- 1d array [sample #] -- the interpolated values.  (Or
+            one float, if X was just one point.)
+
+        @notes
+          All the points walk down the tree together, one level at a time:
+          at each level, every 'path' (a point, and a node that it is in)
+          splits into the two paths of the axis values around the point.
+          Then the interpolations combine the pairs of paths again, from
+          the bottom level up.  The per-path calculations are the same as
+          what a recursive walk of the tree would do for each point.
         """
-        # strip the first entry, as this will be used to select the subclusters
-        target_point = point[self.level]
-    
-        # find the clusters that should be interpolated
-        # calculate linear distance
-        xdist = self.xvalues-target_point
-    
-        nb_xvalues = xdist.shape[0]
-        
-        # find the center element
-        idxR = numpy.searchsorted(xdist,0);
-        while idxR < nb_xvalues and xdist[idxR] < 0:
-            idxR = idxR + 1
-    
+        X = numpy.asarray(X, dtype=float)
+        if len(X.shape) == 1:
+            return self.simulate(numpy.reshape(X, (len(X), 1)))[0]
+        assert X.shape[0] == self.num_vars
+        num_samples = X.shape[1]
+
+        #walk down: path j at one level becomes paths 2j, 2j+1 at the next
+        sample_I = numpy.arange(num_samples)
+        nodes = numpy.zeros(num_samples, dtype=int)
+        down = [] #per level: (target values, x1, x2, left entries)
+        for level in range(self.num_vars):
+            targets = X[level, sample_I]
+            idxL, idxR = self._neighbourEntries(nodes, targets)
+            down.append((targets, self._xvalues[idxL], self._xvalues[idxR],
+                         idxL, idxR))
+            if level + 1 < self.num_vars:
+                nodes = numpy.column_stack((self._child[idxL],
+                                            self._child[idxR])).ravel()
+                sample_I = numpy.repeat(sample_I, 2)
+
+        #interpolate, from the bottom level up
+        targets, x1, x2, idxL, idxR = down[-1]
+        y1, y2 = self._yvalues[idxL], self._yvalues[idxR]
+        yhat = y1+(y2-y1)/(x2-x1)*(targets-x1)
+        for targets, x1, x2, idxL, idxR in reversed(down[:-1]):
+            y1, y2 = yhat[0::2], yhat[1::2]
+            yhat = y1+(y2-y1)/(x2-x1)*(targets-x1)
+        return yhat
+
+    def simulate1(self, x):
+        return self.simulate(numpy.reshape(x, (len(x),1)))[0]
+
+    def toArrays(self):
+        """Returns dict of name : array -- everything that
+        regressorFromArrays() needs to rebuild this cluster"""
+        return {'num_vars' : numpy.array(self.num_vars),
+                'start' : self._start, 'end' : self._end,
+                'xvalues' : self._xvalues, 'yvalues' : self._yvalues,
+                'child' : self._child}
+
+    def _neighbourEntries(self, nodes, targets):
+        """
+        @description
+          For each (node, target value) pair, find the node's two entries
+          to interpolate between: the first axis value >= the target, and
+          the one before it (or the two at the matching end, when
+          extrapolating).
+
+        @arguments
+          nodes -- 1d array of int [path #]
+          targets -- 1d array [path #]
+
+        @return
+          idxL, idxR -- 1d array of int [path #] -- entries into _xvalues
+
+        @notes
+          Bottom level nodes are sorted by y rather than x, so this does
+          exactly what numpy.searchsorted() does (a binary search, even
+          if the values are not sorted), followed by a scan forward past
+          values < target.
+        """
+        start, end = self._start[nodes], self._end[nodes]
+        assert numpy.all(end - start >= 2), "Need >= 2 values per cluster"
+
+        #binary search, like numpy.searchsorted(xdist, 0)
+        lo, hi = start.copy(), end.copy()
+        active = lo < hi
+        while numpy.any(active):
+            mid = lo + ((hi - lo) >> 1)
+            mid_below = (self._xvalues[numpy.where(active, mid, start)]
+                         - targets) < 0
+            go_right = active & mid_below
+            go_left = active & ~mid_below
+            lo[go_right] = mid[go_right] + 1
+            hi[go_left] = mid[go_left]
+            active = lo < hi
+        idxR = lo
+
+        #scan forward past values < target
+        while True:
+            scan = idxR < end
+            scan[scan] = (self._xvalues[idxR[scan]] - targets[scan]) < 0
+            if not numpy.any(scan):
+                break
+            idxR[scan] += 1
+
         # handle extrapolation
-        if idxR == nb_xvalues:
-            #log.warning('Extrapolation at the right side')
-            idxR = nb_xvalues-1
-    
-        idxL = idxR-1
-    
-        if idxL<0:
-            #corner case: is target point the first point in the dataset?
-            #if target_point != self.xvalues[0]:
-                #log.warning('Extrapolation at the left side')
-                
-            idxL = 0
-            idxR = 1
-        
-        # sanity check
-        assert(idxL>=0 and idxL<nb_xvalues and idxR>=0 and idxR<nb_xvalues)
-    
-        # find the x-axis values
-        x1 = self.xvalues[idxL]
-        x2 = self.xvalues[idxR]
-        
-        # check if this is a bottom level cluster
-        if self.has_children:
-            # it is not a bottom level cluster so recurse down
-            
-            y1 = self.children[idxL].simulate(point)
-            y2 = self.children[idxR].simulate(point)
+        idxR = numpy.where(idxR == end, end - 1, idxR)
+        idxL = idxR - 1
+        at_left = idxL < start
+        idxL[at_left] = start[at_left]
+        idxR[at_left] = start[at_left] + 1
+        return idxL, idxR
+
+class LutGrid:
+    """
+    @description
+      A lookup table on a regular grid: the training data gets resampled
+      onto the grid once, and then each query is just index arithmetic
+      plus multilinear interpolation between the 2^n surrounding grid
+      points.  (Outside the grid, it extrapolates linearly from the
+      outermost grid cells, like LutCluster does.)
+
+      Suits data from device sweeps (e.g. Vgs, Vds, Vbs, L, Ids => W),
+      which is often almost gridded already: an input var whose training
+      values are evenly spaced keeps exactly those values as its axis.
+
+    @attributes
+      keep_I -- list of int -- indices of input vars that actually vary
+      min_x -- 1d array [varying var #] -- first grid value per var
+      step_x -- 1d array [varying var #] -- grid spacing per var
+      num_x -- 1d array of int [varying var #] -- # grid values per var
+      strides -- 1d array of int [varying var #] -- offset in 'values'
+        of one step along each var
+      values -- 1d array of float32 -- the grid values, flattened
+        (the last var varies fastest)
+    """
+
+    def __init__(self, X, y, ss):
+        """
+        @arguments
+          X -- 2d array [input variable #][sample #] -- training input data
+          y -- 1d array [sample #] -- training output data
+          ss -- LutStrategy -- uses grid_points_per_var, grid_fill_type,
+            and max_chunk_bytes (plus whatever grid_fill_type uses)
+
+        @return
+          lut_grid -- LutGrid object
+        """
+        assert ss.grid_points_per_var >= 2
+        assert ss.grid_fill_type != 'LutGrid'
+        X = numpy.asarray(X, dtype=float)
+
+        #grid axes: only for vars that vary
+        self.keep_I, mins, steps, nums = [], [], [], []
+        for var_i in range(X.shape[0]):
+            axis = _gridAxis(X[var_i, :], ss.grid_points_per_var)
+            if axis is None: continue
+            self.keep_I.append(var_i)
+            mins.append(axis[0])
+            steps.append(axis[1])
+            nums.append(axis[2])
+        self.min_x = numpy.array(mins, dtype=float)
+        self.step_x = numpy.array(steps, dtype=float)
+        self.num_x = numpy.array(nums, dtype=int)
+        n = len(self.keep_I)
+        self.strides = numpy.ones(n, dtype=int)
+        for k in range(n - 2, -1, -1):
+            self.strides[k] = self.strides[k+1] * self.num_x[k+1]
+
+        #the value at each grid point comes from a regressor on the
+        # scattered data (of the vars that vary)
+        fill_ss = copy.copy(ss)
+        fill_ss.regressor_type = ss.grid_fill_type
+        fill_regressor = LutFactory().build(numpy.take(X, self.keep_I, 0), y,
+                                            fill_ss)
+        num_grid_points = int(numpy.prod(self.num_x))
+        self.values = numpy.zeros(num_grid_points, dtype=numpy.float32)
+        #bytes per grid point of a chunk: its n coordinates, plus what
+        # the fill regressor keeps per point.  A LutCluster walks 2^l paths
+        # per point at level l (so ~2^n in all), with 5 arrays per path.
+        bytes_per_point = 8 * (n + 5 * 2 ** n)
+        chunk_size = max(1, ss.max_chunk_bytes / bytes_per_point)
+        for start in range(0, num_grid_points, chunk_size):
+            flat_I = numpy.arange(start, min(start + chunk_size,
+                                             num_grid_points))
+            grid_X = numpy.zeros((n, len(flat_I)))
+            for k in range(n):
+                grid_I = (flat_I // self.strides[k]) % self.num_x[k]
+                grid_X[k, :] = self.min_x[k] + grid_I * self.step_x[k]
+            self.values[start:start + len(flat_I)] = \
+                fill_regressor.simulate(grid_X)
+
+    def __str__(self):
+        s = "LutGrid={"
+        s += ' # varying input variables=%d' % len(self.keep_I)
+        s += '; grid shape=%s' % list(self.num_x)
+        s += " /LutGrid}"
+        return s
+
+    def simulate(self, X):
+        """
+        @description
+          For each input point (column) in X, compute the response
+          of this model.
+
+        @arguments
+          X -- 2d array [input variable #][sample #] -- inputs
+
+        @return
+          yhat -- 1d array [sample #] -- simulated outputs
+        """
+        X = numpy.asarray(X, dtype=float)
+        num_samples = X.shape[1]
+        n = len(self.keep_I)
+
+        #per var: the lower grid index of the cell, and the position in it
+        # (< 0 or > 1 when extrapolating)
+        cell_I = numpy.zeros((n, num_samples), dtype=int)
+        fracs = numpy.zeros((n, num_samples))
+        for k, var_i in enumerate(self.keep_I):
+            u = (X[var_i, :] - self.min_x[k]) / self.step_x[k]
+            cell_I[k] = numpy.clip(numpy.floor(u), 0, self.num_x[k] - 2)
+            fracs[k] = u - cell_I[k]
+        base_I = numpy.dot(self.strides, cell_I)
+
+        #add up the 2^n corners of each cell
+        yhat = numpy.zeros(num_samples)
+        for corner in range(2 ** n):
+            I = base_I.copy()
+            weights = numpy.ones(num_samples)
+            for k in range(n):
+                if (corner >> (n - 1 - k)) & 1:
+                    I += self.strides[k]
+                    weights *= fracs[k]
+                else:
+                    weights *= 1.0 - fracs[k]
+            yhat += weights * self.values[I]
+        return yhat
+
+    def simulate1(self, x):
+        X = numpy.reshape(x, (len(x),1))
+        return self.simulate(X)[0]
+
+    def toArrays(self):
+        """Returns dict of name : array -- everything that
+        regressorFromArrays() needs to rebuild this grid"""
+        return {'keep_I' : numpy.array(self.keep_I, dtype=int),
+                'min_x' : self.min_x, 'step_x' : self.step_x,
+                'num_x' : self.num_x, 'strides' : self.strides,
+                'values' : self.values}
+
+def regressorFromArrays(regressor_type, arrays):
+    """
+    @description
+      Rebuilds a LutCluster or LutGrid from what its toArrays() returned.
+      The arrays get used as they are (e.g. they may be memory-mapped).
+
+    @arguments
+      regressor_type -- string -- 'LutCluster' or 'LutGrid'
+      arrays -- dict of name : array
+
+    @return
+      regressor -- LutCluster or LutGrid object
+    """
+    if regressor_type == 'LutCluster':
+        regressor = types.InstanceType(LutCluster)
+        regressor.num_vars = int(arrays['num_vars'])
+        regressor._start = arrays['start']
+        regressor._end = arrays['end']
+        regressor._xvalues = arrays['xvalues']
+        regressor._yvalues = arrays['yvalues']
+        regressor._child = arrays['child']
+    elif regressor_type == 'LutGrid':
+        regressor = types.InstanceType(LutGrid)
+        regressor.keep_I = [int(i) for i in arrays['keep_I']]
+        regressor.min_x = arrays['min_x']
+        regressor.step_x = arrays['step_x']
+        regressor.num_x = arrays['num_x']
+        regressor.strides = arrays['strides']
+        regressor.values = arrays['values']
+    else:
+        raise ValueError("Can't rebuild regressor_type '%s' from arrays" %
+                         regressor_type)
+    return regressor
+
+def _gridAxis(x, max_num_points):
+    """
+    @description
+      Chooses the regular grid axis for an input var with training
+      values 'x': its unique values, if they are evenly spaced and there
+      are not too many of them; otherwise max_num_points values that are
+      evenly spaced between min(x) and max(x).
+
+    @arguments
+      x -- 1d array -- training values of the var
+      max_num_points -- int
+
+    @return
+      axis -- (first value, step, # values) -- or None if x is constant
+    """
+    unique_x = mathutil.uniquifyVector(x)
+    if len(unique_x) < 2:
+        return None
+    mn, mx = unique_x[0], unique_x[-1]
+    if len(unique_x) <= max_num_points:
+        step = (mx - mn) / (len(unique_x) - 1)
+        expected_x = mn + step * numpy.arange(len(unique_x))
+        if numpy.allclose(unique_x, expected_x, rtol=0.0, atol=1e-6 * step):
+            return (mn, step, len(unique_x))
+    return (mn, (mx - mn) / (max_num_points - 1), max_num_points)
 
-            return y1+(y2-y1)/(x2-x1)*(target_point-x1)
-        
-        else:
-            # it is bottom level. The cluster contains yvalues; interpolate between them.
-            return self.yvalues[idxL]+(self.yvalues[idxR]-self.yvalues[idxL]) / \
-                (x2-x1)*(target_point-x1)
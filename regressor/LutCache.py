@@ -0,0 +1,186 @@
+"""
+A binary cache for built lookup-table models (LutCluster, LutGrid), so
+that a program which needs a LUT model does not have to rebuild it from
+the .hdr/.val data every time it starts.
+
+A cache file is an (uncompressed) numpy .npz file, holding the model's
+arrays plus a key: a hash of the data files, the target var and the
+LutStrategy.  A cache file whose key does not match is stale, and gets
+ignored.  On load, the arrays get memory-mapped rather than read.
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+import zipfile
+
+import numpy
+from numpy.lib import format as npy_format
+
+from regressor.Lut import regressorFromArrays
+from regressor.PointRegressor import PointRegressor
+
+import logging
+log = logging.getLogger('lut')
+
+#bump this whenever the arrays of a cached model change meaning
+CACHE_FORMAT_VERSION = 1
+
+#a zip file's local file header (see the .ZIP file format spec)
+_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+
+def lutCacheKey(filebase, target_varname, lut_ss):
+    """
+    @description
+      Returns the key that identifies a model built from
+      filebase.hdr/.val, for target_varname, with strategy lut_ss.
+
+    @arguments
+      filebase -- string -- expect to find filebase.hdr and filebase.val
+      target_varname -- string
+      lut_ss -- LutStrategy
+
+    @return
+      key -- string -- a hex digest
+    """
+    h = hashlib.sha1()
+    h.update('format=%d;target=%s;%s;' %
+             (CACHE_FORMAT_VERSION, target_varname, str(lut_ss)))
+    for extension in ['.hdr', '.val']:
+        f = open(filebase + extension, 'rb')
+        try:
+            while True:
+                block = f.read(1 << 20)
+                if not block: break
+                h.update(block)
+        finally:
+            f.close()
+        h.update(';')
+    return h.hexdigest()
+
+def saveLutCache(cache_file, key, regressor_type, model):
+    """
+    @description
+      Saves 'model' into cache_file, under 'key'.  The file gets written
+      to a temporary name first and then renamed, so that readers never
+      see a partial file.
+
+    @arguments
+      cache_file -- string -- typically ends with '.npz'
+      key -- string -- see lutCacheKey()
+      regressor_type -- string -- 'LutCluster' or 'LutGrid'
+      model -- PointRegressor -- whose regressor is a regressor_type
+
+    @return
+      <<none>> but creates cache_file
+    """
+    arrays = dict([('regressor_' + name, array) for name, array
+                   in model.regressor.toArrays().items()])
+    arrays['key'] = numpy.array(key)
+    arrays['regressor_type'] = numpy.array(regressor_type)
+    arrays['input_varnames'] = numpy.array(model.input_varnames)
+    arrays['case_matters'] = numpy.array(model.case_matters)
+
+    cache_dir = os.path.dirname(os.path.abspath(cache_file))
+    fd, tmp_file = tempfile.mkstemp(suffix='.npz', dir=cache_dir)
+    os.close(fd)
+    try:
+        numpy.savez(tmp_file, **arrays)
+        os.rename(tmp_file, cache_file)
+    except:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+def loadLutCache(cache_file, key):
+    """
+    @description
+      Loads the model that cache_file holds, if its key is 'key'.
+
+    @arguments
+      cache_file -- string
+      key -- string -- see lutCacheKey()
+
+    @return
+      model -- PointRegressor, or None if cache_file does not exist, is
+        stale (other key), or can't be read
+    """
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        arrays = mmapNpz(cache_file)
+        if str(arrays['key']) != key:
+            log.info('Cached LUT model %s is stale' % cache_file)
+            return None
+        regressor_arrays = dict([(name[len('regressor_'):], array)
+                                 for name, array in arrays.items()
+                                 if name.startswith('regressor_') and
+                                 name != 'regressor_type'])
+        regressor = regressorFromArrays(str(arrays['regressor_type']),
+                                        regressor_arrays)
+        input_varnames = [str(varname) for varname in arrays['input_varnames']]
+        return PointRegressor(regressor, input_varnames,
+                              bool(arrays['case_matters']))
+    except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile), e:
+        log.warning('Could not load cached LUT model %s: %s' % (cache_file, e))
+        return None
+
+def mmapNpz(npz_file):
+    """
+    @description
+      Returns the arrays in an uncompressed .npz file (as written by
+      numpy.savez()), memory-mapped read-only.  (numpy.load() only
+      memory-maps .npy files.)  Arrays that can't be memory-mapped,
+      e.g. of strings, get read instead.
+
+    @arguments
+      npz_file -- string
+
+    @return
+      arrays -- dict of name : array
+    """
+    arrays = {}
+    zf = zipfile.ZipFile(npz_file, 'r')
+    try:
+        f = open(npz_file, 'rb')
+        try:
+            for info in zf.infolist():
+                name = info.filename
+                if name.endswith('.npy'):
+                    name = name[:-len('.npy')]
+                array = None
+                if info.compress_type == zipfile.ZIP_STORED:
+                    array = _mmapMember(npz_file, f, info)
+                if array is None:
+                    array = npy_format.read_array(
+                        zf.open(info.filename), allow_pickle=False)
+                arrays[name] = array
+        finally:
+            f.close()
+    finally:
+        zf.close()
+    return arrays
+
+def _mmapMember(npz_file, f, info):
+    """Returns the .npy member 'info' of the zip file 'npz_file' (open
+    as 'f') as a read-only memmap, or None if it can't be mapped"""
+    f.seek(info.header_offset)
+    header = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+    if header[0] != 'PK\x03\x04':
+        raise zipfile.BadZipfile('Bad local file header in %s' % npz_file)
+    name_len, extra_len = header[-2], header[-1]
+    f.seek(info.header_offset + _LOCAL_HEADER.size + name_len + extra_len)
+
+    version = npy_format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = npy_format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = npy_format.read_array_header_2_0(f)
+    if dtype.hasobject or dtype.kind in 'SU':
+        return None
+    if numpy.prod(shape) == 0:
+        return numpy.zeros(shape, dtype=dtype)
+    order = {True:'F', False:'C'}[fortran_order]
+    return numpy.memmap(npz_file, dtype=dtype, mode='r', offset=f.tell(),
+                        shape=shape, order=order)
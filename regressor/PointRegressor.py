@@ -1,10 +1,22 @@
 import numpy
 
+#max # point key orders that a PointRegressor remembers
+MAX_NUM_KEY_ORDERS = 8
+
 class PointRegressor:
     """
     @description
       Like a regressor, but is aware of the input variable names
       and thus can simulate directly off of an input point.
+
+    @attributes
+      regressor -- a regressor -- see __init__
+      input_varnames -- list of string -- lowercase if not case_matters
+      case_matters -- bool
+      _key_orders -- list of list of string -- each entry holds, per input
+        var, the key that a point has for that var; for points whose keys
+        differ in case from input_varnames (if not case_matters).  The
+        most recently used order is first.
     """
     def __init__(self, regressor, input_varnames, case_matters):
         """
@@ -16,9 +28,10 @@ class PointRegressor:
             for the input vars?
 
         @return
-          new_point_regressor -- PointRegressor object -- 
+          new_point_regressor -- PointRegressor object --
         """
         self.regressor = regressor
+        self._key_orders = [list(input_varnames)]
         if not case_matters:
             input_varnames = [varname.lower() for varname in input_varnames]
         self.input_varnames = input_varnames
@@ -37,24 +50,62 @@ class PointRegressor:
           point -- dict mapping input_varname : input_value
 
         @return
-          simulated_output_value -- float          
+          simulated_output_value -- float
         """
-        #make input point's varnames lowercase if case_matters == False
-        if self.case_matters:
-            point2 = point
-        else:
-            point2 = {}
-            for varname, varval in point.items():
-                point2[varname.lower()] = varval
-        
         #set _X
-        # -recall that each 'self_varname' is already lowercase, if
-        #  case_matters == False
-        for var_index, self_varname in enumerate(self.input_varnames):
-            self._X[var_index,0] = point2[self_varname]
+        self._X[:,0] = self._pointValues(point)
 
         #simulate with regressor
         y = self.regressor.simulate(self._X)
 
         #done
         return y[0]
+
+    def simulatePoints(self, points):
+        """
+        @description
+          Simulates at many input points, with one call to the regressor
+
+        @arguments
+          points -- list of dict mapping input_varname : input_value --
+            OR 2d array [input var #][point #], where the vars are in the
+            order of input_varnames
+
+        @return
+          simulated_output_values -- 1d array [point #]
+        """
+        if isinstance(points, numpy.ndarray):
+            assert len(points.shape) == 2
+            assert points.shape[0] == len(self.input_varnames)
+            return self.regressor.simulate(points)
+
+        X = numpy.zeros((len(self.input_varnames), len(points)))
+        for point_i, point in enumerate(points):
+            X[:, point_i] = self._pointValues(point)
+
+        return self.regressor.simulate(X)
+
+    def _pointValues(self, point):
+        """Returns list of float -- the point's value of each input var"""
+        for order_i, keys in enumerate(self._key_orders):
+            try:
+                values = [point[key] for key in keys]
+            except KeyError:
+                continue
+            if order_i > 0:
+                self._key_orders.insert(0, self._key_orders.pop(order_i))
+            return values
+
+        #new key order: find the point's key for each input var
+        # -recall that each 'self_varname' is already lowercase, if
+        #  case_matters == False
+        if self.case_matters:
+            return [point[key] for key in self.input_varnames] #KeyError
+        key_per_varname = {}
+        for key in point.iterkeys():
+            key_per_varname[key.lower()] = key
+        keys = [key_per_varname[self_varname]
+                for self_varname in self.input_varnames]
+        self._key_orders.insert(0, keys)
+        del self._key_orders[MAX_NUM_KEY_ORDERS:]
+        return [point[key] for key in keys]
@@ -0,0 +1,117 @@
+import unittest
+
+import os
+import shutil
+
+import numpy
+
+from regressor.Lut import LutStrategy, LutFactory, LutCluster, LutGrid
+from regressor.LutCache import lutCacheKey, saveLutCache, loadLutCache
+from regressor.PointRegressor import PointRegressor
+from util.ascii import trainingDataToHdrValFiles, hdrValFilesToTrainingData
+
+class LutCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+        self.dir = 'test_lutcache'
+        if os.path.exists(self.dir):
+            shutil.rmtree(self.dir)
+        os.mkdir(self.dir)
+        self.filebase = os.path.join(self.dir, 'nmos')
+        self._writeData(0.0)
+
+    def _writeData(self, offset):
+        #a sweep, like MOS data
+        points = [(0.25 * a, 0.5 * b) for a in range(12) for b in range(6)]
+        X = numpy.transpose(numpy.array(points))
+        y = numpy.sin(X[0, :]) + X[1, :] + offset
+        Xy = numpy.concatenate([X, numpy.reshape(y, (1, len(points)))])
+        trainingDataToHdrValFiles(self.filebase, ['Vgs', 'Ids', 'W'], Xy)
+
+    def _build(self, lut_ss):
+        Xy, X, y, all_varnames, input_varnames = \
+            hdrValFilesToTrainingData(self.filebase, 'W')
+        regressor = LutFactory().build(X, y, lut_ss)
+        return PointRegressor(regressor, input_varnames, False)
+
+    def _testRoundTrip(self, regressor_type):
+        lut_ss = LutStrategy()
+        lut_ss.regressor_type = regressor_type
+        model = self._build(lut_ss)
+        cache_file = self.filebase + '.model.npz'
+        key = lutCacheKey(self.filebase, 'W', lut_ss)
+        saveLutCache(cache_file, key, regressor_type, model)
+
+        loaded = loadLutCache(cache_file, key)
+        self.assertTrue(loaded is not None)
+        self.assertEqual(loaded.regressor.__class__, model.regressor.__class__)
+        self.assertEqual(loaded.input_varnames, model.input_varnames)
+        self.assertEqual(loaded.case_matters, False)
+
+        #the loaded model simulates exactly like the built one
+        numpy.random.seed(3)
+        X2 = numpy.random.rand(2, 40) * 3.0
+        points = [{'Vgs':X2[0, i], 'Ids':X2[1, i]} for i in range(40)]
+        self.assertEqual(list(loaded.simulatePoints(points)),
+                         list(model.simulatePoints(points)))
+        return loaded
+
+    def testClusterRoundTrip(self):
+        if self.just1: return
+        loaded = self._testRoundTrip('LutCluster')
+        self.assertTrue(isinstance(loaded.regressor, LutCluster))
+        self.assertTrue(isinstance(loaded.regressor._xvalues, numpy.memmap))
+
+    def testGridRoundTrip(self):
+        if self.just1: return
+        loaded = self._testRoundTrip('LutGrid')
+        self.assertTrue(isinstance(loaded.regressor, LutGrid))
+        self.assertTrue(isinstance(loaded.regressor.values, numpy.memmap))
+
+    def testStale(self):
+        if self.just1: return
+        lut_ss = LutStrategy()
+        lut_ss.regressor_type = 'LutCluster'
+        cache_file = self.filebase + '.model.npz'
+        key = lutCacheKey(self.filebase, 'W', lut_ss)
+        self.assertEqual(loadLutCache(cache_file, key), None)
+        saveLutCache(cache_file, key, 'LutCluster', self._build(lut_ss))
+        self.assertTrue(loadLutCache(cache_file, key) is not None)
+
+        #other strategy
+        lut_ss2 = LutStrategy()
+        lut_ss2.regressor_type = 'LutCluster'
+        lut_ss2.bandwidth *= 2.0
+        key2 = lutCacheKey(self.filebase, 'W', lut_ss2)
+        self.assertNotEqual(key2, key)
+        self.assertEqual(loadLutCache(cache_file, key2), None)
+
+        #other target var
+        self.assertNotEqual(lutCacheKey(self.filebase, 'Ids', lut_ss), key)
+
+        #other data
+        self._writeData(1.0)
+        key3 = lutCacheKey(self.filebase, 'W', lut_ss)
+        self.assertNotEqual(key3, key)
+        self.assertEqual(loadLutCache(cache_file, key3), None)
+
+    def testCorrupt(self):
+        if self.just1: return
+        cache_file = self.filebase + '.model.npz'
+        f = open(cache_file, 'w')
+        f.write('not a zip file')
+        f.close()
+        key = lutCacheKey(self.filebase, 'W', LutStrategy())
+        self.assertEqual(loadLutCache(cache_file, key), None)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+if __name__ == '__main__':
+
+    import logging
+    logging.basicConfig()
+    logging.getLogger('lut').setLevel(logging.ERROR)
+
+    unittest.main()
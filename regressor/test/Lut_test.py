@@ -1,10 +1,13 @@
 import unittest
 
 import numpy
+import random
 import time
 
 from adts import *
 from regressor.Lut import *
+from regressor.PointRegressor import PointRegressor
+from util import mathutil
 
 # specify the maximum error a regressor can have
 regressor_max_error=0.5
@@ -72,8 +75,8 @@ class LutTest(unittest.TestCase):
         self._testSpeednD(50, 5)
         
     def _testSpeednD(self,nr_points, dim):
-        points = 100*numpy.random(dim, nr_points)
-        vals = 100*numpy.random(nr_points)
+        points = 100*numpy.random.rand(dim, nr_points)
+        vals = 100*numpy.random.rand(nr_points)
         
         #build the model
         lut_ss = LutStrategy()
@@ -97,13 +100,169 @@ class LutTest(unittest.TestCase):
         
         print "%d simulations (%d-D) of %d points took %f seconds (%d lookups/sec)" % ( cnt, dim , nr_points, elapsed, lookups_per_sec)
         
+    def testBatchSimulateMatchesLoop(self):
+        if self.just1: return
+        #training data with a constant var (which gets dropped), 
+        # and float32 outputs
+        numpy.random.seed(3)
+        X = numpy.random.rand(3, 60)
+        X[1,:] = 2.0
+        y = (10.0 * numpy.random.rand(60)).astype('f')
+        X2 = numpy.random.rand(3, 45) * 1.1 - 0.05
+        X2[:, 0] = X[:, 7] #exactly on a training point
+        X2[0, 1] = 100.0   #far away from every training point
+
+        lut_ss = LutStrategy()
+        lut_ss.bandwidth = 0.3
+        expected_yhat = self._loopSimulate(LutFactory().build(X, y, lut_ss),
+                                           X2)
+        self.assertEqual(expected_yhat[1], 0.0)
+
+        #identical results, no matter how the query points are chunked,
+        # or whether they use a spatial index
+        lut_ss.use_spatial_index = False
+        for max_chunk_bytes in [1, 4 * 8 * 60 * 7, lut_ss.max_chunk_bytes]:
+            lut_ss.max_chunk_bytes = max_chunk_bytes
+            lut_model = LutFactory().build(X, y, lut_ss)
+            self.assertEqual(lut_model.training_tree, None)
+            yhat = lut_model.simulate(X2)
+            self.assertEqual(list(yhat), list(expected_yhat))
+            self.assertEqual(lut_model.simulate1(X2[:, 5]), expected_yhat[5])
+
+        lut_ss.use_spatial_index = True
+        lut_model = LutFactory().build(X, y, lut_ss)
+        self.assertEqual(len(lut_model.training_tree), 60)
+        self.assertEqual(list(lut_model.simulate(X2)), list(expected_yhat))
+
+    def testWidenBandwidth(self):
+        if self.just1: return
+        #training points at 0.0, 0.1, ..., 1.0
+        X = numpy.array([[i * 0.1 for i in range(11)]])
+        y = numpy.arange(11.0)
+        lut_ss = LutStrategy()
+        lut_ss.bandwidth = 0.05
+        lut_ss.min_num_neighbours = 3
+        lut_model = LutFactory().build(X, y, lut_ss)
+
+        #with 0.05, just 1 neighbour of 0.3; 3 neighbours need about 0.1
+        # (a hair more, due to rounding), in steps of 0.0005
+        bw = lut_model._widenedBandwidth(numpy.array([0.3]))
+        self.assertTrue(0.1 <= bw <= 0.1 + 2 * 0.0005, bw)
+        self.assertAlmostEqual(lut_model.simulate1([0.3]), 3.0)
+
+        #far away points get a bandwidth of at most 1.0
+        self.assertEqual(lut_model._widenedBandwidth(numpy.array([3.0])), 1.0)
+        self.assertEqual(lut_model.simulate1([3.0]), 0.0)
+
+        #without widening, a point between the training points has none
+        lut_ss.bandwidth = 0.04
+        lut_ss.min_num_neighbours = 0
+        lut_model = LutFactory().build(X, y, lut_ss)
+        self.assertEqual(lut_model.simulate1([0.35]), 0.0)
+        lut_ss.min_num_neighbours = 2
+        lut_model = LutFactory().build(X, y, lut_ss)
+        self.assertAlmostEqual(lut_model.simulate1([0.35]), 3.5)
+
+    def testNumNeighbours(self):
+        if self.just1: return
+        #training points at 0.0, 0.1, ..., 1.0
+        X = numpy.array([[i * 0.1 for i in range(11)]])
+        y = numpy.arange(11.0)
+        lut_ss = LutStrategy()
+        lut_ss.bandwidth = 0.12
+        for use_spatial_index in [True, False]:
+            lut_ss.use_spatial_index = use_spatial_index
+            lut_model = LutFactory().build(X, y, lut_ss)
+            self.assertEqual(
+                list(lut_model.numNeighbours(numpy.array([[0.3, 0.0, 3.0]]))),
+                [3, 2, 0])
+
+    def _loopSimulate(self, lut_model, X):
+        """Simulates like LutModel.simulate(), one pair of points at a time"""
+        keep_X = numpy.take(X, lut_model.keep_I, 0)
+        X01 = mathutil.scaleTo01(keep_X, lut_model.min_x, lut_model.max_x)
+        yhat = numpy.zeros(X.shape[1])
+        for sample_i in range(X01.shape[1]):
+            sum_w, sum_output = 0.0, 0.0
+            for j in range(lut_model.training_X01.shape[1]):
+                dist = mathutil.distance(X01[:, sample_i],
+                                         lut_model.training_X01[:, j])
+                w = mathutil.epanechnikovQuadraticKernel(dist,
+                                                         lut_model.bandwidth)
+                sum_output += w * lut_model.training_y[j]
+                sum_w += w
+            if sum_w > 0:
+                yhat[sample_i] = sum_output / sum_w
+        return yhat
+
+    def testLeaveOneOutSums(self):
+        if self.just1: return
+        from regressor.Lut import _LeaveOneOutSums
+        numpy.random.seed(5)
+        random.seed(5)
+        X = numpy.random.rand(3, 150)
+        X[2, :] = 0.5 #a var that does not vary
+        X[0, :20] = numpy.floor(X[0, :20] * 4.0) / 4.0 #some shared values
+        y = numpy.sin(4.0 * X[0, :]) + X[1, :]
+        lut_ss = LutStrategy()
+        lut_ss.bandwidth = 0.2
+        loo_sums = _LeaveOneOutSums(X, y, lut_ss.bandwidth)
+        pool_loo_sums = _LeaveOneOutSums(X, y, lut_ss.bandwidth, 2)
+        self.assertEqual(list(pool_loo_sums.sum_w), list(loo_sums.sum_w))
+        self.assertEqual(list(pool_loo_sums.sum_wy), list(loo_sums.sum_wy))
+
+        keep_I = range(150)
+        num_scaling_changes = 0
+        for prune_iter in range(100):
+            #each estimate is like that of a new LutModel
+            for sample_i in random.sample(keep_I, 10):
+                if loo_sums.changesScaling(sample_i): continue
+                other_I = [i for i in keep_I if i != sample_i]
+                model = LutFactory().build(numpy.take(X, other_I, 1),
+                                           numpy.take(y, other_I), lut_ss)
+                self.assertAlmostEqual(loo_sums.looEstimate(sample_i),
+                                       model.simulate1(X[:, sample_i]), 10)
+
+            #prune, sometimes a sample at the min or max of a var
+            if prune_iter % 10 == 0:
+                prune_i = keep_I[numpy.argmax(numpy.take(X[0], keep_I))]
+                self.assertTrue(loo_sums.changesScaling(prune_i))
+                num_scaling_changes += 1
+            else:
+                prune_i = random.choice(keep_I)
+            loo_sums.remove(prune_i)
+            keep_I.remove(prune_i)
+        self.assertEqual(num_scaling_changes, 10)
+
+    def testPruner(self):
+        if self.just1: return
+        numpy.random.seed(6)
+        X = numpy.random.rand(2, 80)
+        y = X[0, :] + 0.5 * X[1, :]
+        Xy = numpy.concatenate([X, numpy.reshape(y, (1, 80))])
+        lut_ss = LutStrategy()
+        lut_ss.bandwidth = 0.3
+
+        #the kernel sums and a model per candidate prune the same samples.
+        # (Few enough iterations that nothing gets saved.)
+        keep_Is = []
+        for incremental in [True, False]:
+            pruner = LutDataPruner(lut_ss, num_cands=20)
+            pruner._incremental = incremental
+            random.seed(6)
+            keep_Is.append(pruner.prune(X, y, Xy, 0.05, 65, 'unused_filebase',
+                                        ['a', 'b', 'y']))
+        self.assertEqual(keep_Is[0], keep_Is[1])
+        self.assertEqual(len(keep_Is[0]), 66)
+        self.assertEqual(keep_Is[0], sorted(set(keep_Is[0])))
+
     def testSingleCluster(self):
         if self.just1: return
         
         xvalues=numpy.array([[1,3,4,2,5,7,6]],'f')
         yvalues=numpy.array([2,8,16,4,32,128,64],'f')
         
-        tst=LutCluster(None, xvalues,yvalues)
+        tst=LutCluster(xvalues,yvalues)
         self.assertEqual(tst.simulate([0.5]),1.0)
         self.assertEqual(tst.simulate([1.0]),2.0)
         self.assertEqual(tst.simulate([1.5]),3.0)
@@ -119,7 +278,7 @@ class LutTest(unittest.TestCase):
         xvalues=numpy.array([[1,1,4,4,2,2],[5,6,5,6,5,6]],'f')
         yvalues=numpy.array([15,16,45,46,25,26],'f')
         
-        tst=LutCluster(None, xvalues,yvalues)
+        tst=LutCluster(xvalues,yvalues)
 
         # the data points should be exact
         self.assertEqual(tst.simulate([1,5]),15)
@@ -141,10 +300,11 @@ class LutTest(unittest.TestCase):
         #create training data
         X = numpy.zeros((1,50))
         y = numpy.zeros(50)
+        #(a cluster's bottom level needs y to be monotonic in x)
         for i in range(50):
             x = i * 0.1
             X[0,i] = x
-            y[i] = math.sin(x)
+            y[i] = math.sin(x / 4.0)
 
         #build the model
         lut_ss = LutStrategy()
@@ -158,7 +318,112 @@ class LutTest(unittest.TestCase):
         # the borders of the interpolation are not really good
         for yi, yhati in zip(y[1:-1], yhat[1:-1]):
             self.assertTrue( abs(yi - yhati)/((yi + yhati + 1e-20)/2) < regressor_max_error, (yi,yhati))
-            
+
+    def testClusterBatch(self):
+        if self.just1: return
+        #3d grid, with a function that is linear along each axis
+        values_per_var = [[0.0, 1.0, 2.5, 3.0], [1.0, 2.0, 4.0],
+                          [0.0, 0.25, 0.5, 0.75, 1.0]]
+        points = [(a, b, c) for a in values_per_var[0]
+                  for b in values_per_var[1] for c in values_per_var[2]]
+        X = numpy.transpose(numpy.array(points))
+        f = lambda x: 2.0 * x[0] - 3.0 * x[1] + 0.5 * x[2] + x[0] * x[2]
+        y = numpy.array([f(point) for point in points])
+        tst = LutCluster(X, y)
+
+        #inside the grid, and extrapolating beyond it
+        numpy.random.seed(2)
+        X2 = numpy.random.rand(3, 200) * numpy.array([[4.0], [5.0], [1.4]])
+        X2 = X2 - numpy.array([[0.5], [0.5], [0.2]])
+        yhat = tst.simulate(X2)
+        self.assertEqual(yhat.shape, (200,))
+        for sample_i in range(200):
+            self.assertAlmostEqual(yhat[sample_i], f(X2[:, sample_i]))
+
+            #same as one point at a time
+            self.assertEqual(tst.simulate1(X2[:, sample_i]), yhat[sample_i])
+            self.assertEqual(tst.simulate(list(X2[:, sample_i])),
+                             yhat[sample_i])
+
+    def testClusterPointRegressor(self):
+        if self.just1: return
+        xvalues=numpy.array([[1,1,4,4,2,2],[5,6,5,6,5,6]],'f')
+        yvalues=numpy.array([15,16,45,46,25,26],'f')
+        model = PointRegressor(LutCluster(xvalues, yvalues),
+                               ['A', 'b'], False)
+
+        points = [{'a':1.5, 'B':5.0}, {'a':4.0, 'B':6.0}, {'a':1.5, 'B':5.5}]
+        yhat = model.simulatePoints(points)
+        self.assertEqual(list(yhat), [20.0, 46.0, 20.5])
+        self.assertEqual([model.simulatePoint(point) for point in points],
+                         list(yhat))
+        self.assertEqual(len(model.simulatePoints([])), 0)
+
+    def testPointRegressor(self):
+        if self.just1: return
+        numpy.random.seed(7)
+        X = numpy.random.rand(2, 30)
+        y = X[0, :] - 2.0 * X[1, :]
+        lut_model = LutFactory().build(X, y, LutStrategy())
+        model = PointRegressor(lut_model, ['Vgs', 'Ids'], False)
+        self.assertEqual(model.input_varnames, ['vgs', 'ids'])
+
+        #points with differently-cased keys, in any mix
+        X2 = numpy.random.rand(2, 5)
+        yhat = lut_model.simulate(X2)
+        keys_per_point = [('Vgs', 'Ids'), ('vgs', 'ids'), ('VGS', 'Ids'),
+                          ('Vgs', 'Ids'), ('vgs', 'ids')]
+        points = [{vgs_key:X2[0, i], ids_key:X2[1, i], 'extra':1.0}
+                  for i, (vgs_key, ids_key) in enumerate(keys_per_point)]
+        self.assertEqual([model.simulatePoint(point) for point in points],
+                         list(yhat))
+        self.assertEqual(list(model.simulatePoints(points)), list(yhat))
+        self.assertEqual(list(model.simulatePoints(X2)), list(yhat))
+        self.assertRaises(KeyError, model.simulatePoint, {'Vgs':0.5})
+
+        #with case_matters, only the exact names do
+        model = PointRegressor(lut_model, ['Vgs', 'Ids'], True)
+        self.assertEqual(model.simulatePoint(points[0]), yhat[0])
+        self.assertRaises(KeyError, model.simulatePoint, points[1])
+
+    def testGrid(self):
+        if self.just1: return
+        #3d sweep, with a var that does not vary, and one var whose values
+        # are not evenly spaced
+        values_per_var = [[0.0, 1.0, 2.5, 3.0], [7.0], [1.0, 2.0, 3.0],
+                          [0.0, 0.25, 0.5, 0.75, 1.0]]
+        points = [(a, b, c, d) for a in values_per_var[0]
+                  for b in values_per_var[1] for c in values_per_var[2]
+                  for d in values_per_var[3]]
+        X = numpy.transpose(numpy.array(points))
+        f = lambda x: 2.0 * x[0] - 3.0 * x[2] + 0.5 * x[3] + x[0] * x[3]
+        y = numpy.array([f(point) for point in points])
+
+        lut_ss = LutStrategy()
+        lut_ss.regressor_type = 'LutGrid'
+        lut_ss.grid_points_per_var = 7
+        lut_ss.max_chunk_bytes = 8 * 4 * 10 #fill the grid in many chunks
+        grid = LutFactory().build(X, y, lut_ss)
+        self.assertTrue(isinstance(grid, LutGrid))
+
+        #evenly spaced vars keep their values as grid axis
+        self.assertEqual(grid.keep_I, [0, 2, 3])
+        self.assertEqual(list(grid.num_x), [7, 3, 5])
+        self.assertEqual(list(grid.min_x), [0.0, 1.0, 0.0])
+        self.assertEqual(list(grid.step_x), [0.5, 1.0, 0.25])
+        self.assertEqual(len(grid.values), 7 * 3 * 5)
+        self.assertEqual(grid.values.dtype, numpy.float32)
+
+        #multilinear data gets reproduced, also when extrapolating
+        numpy.random.seed(4)
+        X2 = numpy.random.rand(4, 100) * numpy.array([[4.0], [1.0], [3.0],
+                                                      [1.4]])
+        X2 = X2 - numpy.array([[0.5], [0.0], [0.0], [0.2]])
+        yhat = grid.simulate(X2)
+        for sample_i in range(100):
+            self.assertAlmostEqual(yhat[sample_i], f(X2[:, sample_i]), 4)
+        self.assertEqual(grid.simulate1(X2[:, 3]), yhat[3])
+
     def testCluster2d(self):
         return #FIXME: this test is not good
         if self.just1: return
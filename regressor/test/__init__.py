@@ -2,8 +2,10 @@ import unittest, os
 from tests import doctest, importSuite
 
 from Lut_test import LutTest
+from LutCache_test import LutCacheTest
 
 TestClasses = [LutTest,
+               LutCacheTest,
                ]
 
 def unittest_suite():
@@ -29,7 +29,7 @@ Prints a summary of db contents:
 
 Details:
  PROBLEM_NUM -- int -- see below
- DB_FILE -- string -- e.g. ~/synth_results/state_genXXXX.db or pooled_db.db
+ DB_FILE -- string -- e.g. ~/synth_results/run.db (newest generation), state_genXXXX.db or pooled_db.db
  SORT_METRIC -- string -- if specified, it sorts the inds by that metric name
    in ascending order
  MATLAB_METRIC_FILE -- string -- if specified, outputs the metrics to a file
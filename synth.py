@@ -24,8 +24,8 @@ Usage: synth PROBLEM_NUM POP_SIZE OUTPUT_DIR POOLED_DB_FILE [RESTART_DB_FILE]
  PROBLEM_NUM -- int -- details below
  POP_SIZE -- int -- population size
  OUTPUT_DIR -- string -- output directory for state db files
- POOLED_DB_FILE -- string or None -- enables parallel synth engines (use same value for every engine!)
- RESTART_DB_FILE -- string or None -- set to a previous state_genXXXX.db to continue a previous run
+ POOLED_DB_FILE -- string or None -- enables parallel synth engines (use same value for every engine, and for the pooler!)
+ RESTART_DB_FILE -- string or None -- set to a previous run.db (continues from its newest generation) or state_genXXXX.db to continue a previous run
  
 """ + ProblemFactory().problemDescriptions()
 
@@ -1,3 +1,3 @@
 from mathutil import *
 from constants import *
-from ascii import asciiRowToStrings, asciiTo2dArray
+from ascii import asciiRowToStrings, asciiTo2dArray, cachedAsciiTo2dArray
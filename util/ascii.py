@@ -2,10 +2,17 @@
 Routines python_data <=> ascii_files.
 """
 
+import os
+import struct
+import tempfile
 import types
+import warnings
 
 import numpy
 
+import logging
+log = logging.getLogger('ascii')
+
 #===========================================================
 # Routines for importing / exporting to simple ascii files
 
@@ -28,33 +35,139 @@ def asciiRowToStrings(filename):
 def asciiTo2dArray(filename):
     """
     @description
-      Extracts and returns a 2d array from the file.
+      Extracts and returns a 2d array from the file.  Each non-blank line
+      is one row; values are separated by whitespace.
       
     @arguments
       filename -- string 
 
     @return
       a -- 2d array of Float
+
+    @exceptions
+      Raises ValueError if the rows have differing numbers of values, or
+      if a value is not a number.
     """
     f = open(filename, 'r')
-    lines = f.readlines()
+    data = f.read()
     f.close()
+    lines = [line for line in data.splitlines() if line.strip()]
     num_rows = len(lines)
 
     #corner case
     if num_rows == 0:
         return numpy.zeros((0,0))
 
-    #main case
+    #every row needs the same number of values
     num_columns = len(lines[0].split())
-    a = numpy.zeros((num_rows, num_columns))
+    for row_i, line in enumerate(lines):
+        if len(line.split()) != num_columns:
+            raise ValueError("Expected %d numbers in row %d of %s, not %d" %
+                             (num_columns, row_i, filename,
+                              len(line.split())))
+
+    #main case: let numpy parse all values in one go.  It stops at the
+    # first value that is not a number, which the count check catches.
+    # (It also warns then; ignore that, but only here.)
+    catcher = warnings.catch_warnings()
+    catcher.__enter__()
+    try:
+        warnings.filterwarnings('ignore',
+                                'string or file could not be read to its end',
+                                DeprecationWarning)
+        values = numpy.fromstring(data, dtype=float, sep=' ')
+    finally:
+        catcher.__exit__()
+    if len(values) != num_rows * num_columns:
+        raise ValueError("Expected %d rows x %d numbers in %s" %
+                         (num_rows, num_columns, filename))
 
-    for row_index, line in enumerate(lines):
-        for col_index, val_string in enumerate(line.split()):
-            a[row_index,col_index] = float(val_string)
+    return numpy.reshape(values, (num_rows, num_columns))
+
+def cachedAsciiTo2dArray(filename):
+    """
+    @description
+      Like asciiTo2dArray(), but keeps a binary copy of the array in a
+      sidecar file (filename + '.cache'), and reads that instead whenever
+      it is still valid, ie when filename's mtime and size have not
+      changed since the sidecar got written.
+      
+    @arguments
+      filename -- string 
 
+    @return
+      a -- 2d array of Float -- memory-mapped (read-only) if it came
+        from the sidecar
+
+    @notes
+      If the sidecar can't be written (e.g. a read-only directory), this
+      just returns the parsed array.
+    """
+    sidecar = filename + _SIDECAR_EXTENSION
+    st = os.stat(filename)
+    a = _readSidecar(sidecar, st.st_mtime, st.st_size)
+    if a is not None:
+        return a
+
+    a = asciiTo2dArray(filename)
+    try:
+        _writeSidecar(sidecar, st.st_mtime, st.st_size, a)
+    except (IOError, OSError), e:
+        log.warning("Could not write %s: %s" % (sidecar, e))
     return a
 
+#sidecar file layout: a header of _SIDECAR_HEADER (padded to
+# _SIDECAR_DATA_OFFSET bytes) with magic, the source file's mtime and size,
+# and the array's shape; then the array as little-endian float64, row-major
+_SIDECAR_EXTENSION = '.cache'
+_SIDECAR_MAGIC = 'MOJVAL01'
+_SIDECAR_HEADER = struct.Struct('<8sdqqq')
+_SIDECAR_DATA_OFFSET = 64
+
+def _readSidecar(sidecar, mtime, size):
+    """Returns the (memory-mapped) array in 'sidecar' if that was written
+    for a source file with 'mtime' and 'size'; otherwise returns None"""
+    if not os.path.exists(sidecar):
+        return None
+    f = open(sidecar, 'rb')
+    header = f.read(_SIDECAR_HEADER.size)
+    f.close()
+    if len(header) != _SIDECAR_HEADER.size:
+        return None
+    (magic, sidecar_mtime, sidecar_size, num_rows, num_columns) = \
+            _SIDECAR_HEADER.unpack(header)
+    if magic != _SIDECAR_MAGIC or sidecar_mtime != mtime or \
+           sidecar_size != size:
+        return None
+    if os.path.getsize(sidecar) != \
+           _SIDECAR_DATA_OFFSET + 8 * num_rows * num_columns:
+        return None
+    if num_rows * num_columns == 0:
+        return numpy.zeros((num_rows, num_columns))
+    return numpy.memmap(sidecar, dtype='<f8', mode='r',
+                        offset=_SIDECAR_DATA_OFFSET,
+                        shape=(num_rows, num_columns))
+
+def _writeSidecar(sidecar, mtime, size, a):
+    """Writes 'a' into 'sidecar', for a source file with 'mtime' and
+    'size'.  Writes to a temporary file then renames it, so that readers
+    never see a partial sidecar."""
+    header = _SIDECAR_HEADER.pack(_SIDECAR_MAGIC, mtime, size,
+                                  a.shape[0], a.shape[1])
+    header += '\0' * (_SIDECAR_DATA_OFFSET - len(header))
+    fd, tmp_file = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(sidecar)))
+    try:
+        f = os.fdopen(fd, 'wb')
+        f.write(header)
+        f.write(numpy.ascontiguousarray(a, dtype='<f8').tostring())
+        f.close()
+        os.rename(tmp_file, sidecar)
+    except:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
 def arrayToAscii(filename, X):
     """
     @description
@@ -69,12 +182,8 @@ def arrayToAscii(filename, X):
     """
     f = open(filename, 'w')
     num_rows, num_columns = X.shape
-    for row_index in range(num_rows):
-        s = ""
-        for col_index in range(num_columns):
-            s += "%g " % X[row_index, col_index]
-        s += "\n"
-        f.write(s)
+    row_format = "%g " * num_columns + "\n"
+    f.writelines([row_format % tuple(row) for row in X])
     f.close()
 
 def stringsToAscii(filename, strings):
@@ -134,7 +243,7 @@ def hdrValFilesToTrainingData(input_filebase, target_varname):
            (target_varname, all_varnames)
 
     #split apart input and output data
-    Xy_tr = asciiTo2dArray(input_filebase + '.val')
+    Xy_tr = cachedAsciiTo2dArray(input_filebase + '.val')
     Xy = numpy.transpose(Xy_tr)
     X = numpy.take(Xy, x_rows, 0)
     y = numpy.take(Xy, y_rows, 0)[0]
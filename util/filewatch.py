@@ -0,0 +1,208 @@
+"""
+Waiting on changes to files, e.g. so that a process can react to new
+results within seconds rather than waking up on a fixed schedule.
+
+Uses Linux inotify (via ctypes, so no extra packages are needed) where
+it is available, and falls back to polling file mtimes and sizes otherwise.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+import logging
+log = logging.getLogger('filewatch')
+
+#inotify event masks of interest (see 'man inotify')
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+#each inotify event is: wd, mask, cookie, len; then 'len' bytes of name
+_EVENT_HEADER = struct.Struct('iIII')
+
+def _loadLibc():
+    """Returns libc (as a ctypes.CDLL) if it has inotify, or None"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.inotify_init, libc.inotify_add_watch, libc.inotify_rm_watch
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+class FileWatcher:
+    """
+    @description
+      Watches a set of directories, and waits until a relevant file in
+      them changes.  A burst of changes (e.g. many writes to one file)
+      counts as just one change: see 'debounce_time'.
+
+    @attributes
+      is_relevant -- function(filename) -> bool -- only changes to files
+        whose (base) name makes this True count
+      poll_interval -- float -- seconds between polls, when polling
+      debounce_time -- float -- after a change, keep waiting until
+        there has been no further change for this many seconds (but not
+        longer than 10 * debounce_time in total)
+      dirs -- list of string -- the watched directories
+      _libc -- ctypes.CDLL or None -- None means 'polling mode'
+      _inotify_fd -- int or None
+      _wd_per_dir -- dict of dir : inotify watch descriptor
+      _signatures -- dict of filename : (mtime, size) -- as of the last
+        poll (polling mode only)
+    """
+
+    def __init__(self, is_relevant, poll_interval, debounce_time,
+                 use_inotify=True):
+        """
+        @arguments
+          is_relevant, poll_interval, debounce_time -- see class description
+          use_inotify -- bool -- if False, always poll
+
+        @return
+          FileWatcher object
+        """
+        self.is_relevant = is_relevant
+        self.poll_interval = poll_interval
+        self.debounce_time = debounce_time
+        self.dirs = []
+
+        self._libc = None
+        self._inotify_fd = None
+        self._wd_per_dir = {}
+        self._signatures = {}
+        if use_inotify:
+            self._libc = _loadLibc()
+        if self._libc is not None:
+            fd = self._libc.inotify_init()
+            if fd < 0:
+                self._libc = None
+            else:
+                self._inotify_fd = fd
+        log.info('FileWatcher will use %s' %
+                 {True:'inotify', False:'polling'}[self.usesInotify()])
+
+    def usesInotify(self):
+        return self._inotify_fd is not None
+
+    def setDirs(self, dirs):
+        """Sets which directories to watch.  Ones that do not exist (yet)
+        get ignored.  Changes in dirs that were already watched, since
+        the last wait, still count for the next wait."""
+        dirs = [os.path.abspath(d) for d in dirs if os.path.isdir(d)]
+        new_dirs = [d for d in set(dirs) if d not in self.dirs]
+        self.dirs = sorted(set(dirs))
+        if self.usesInotify():
+            for d in self._wd_per_dir.keys():
+                if d not in self.dirs:
+                    self._libc.inotify_rm_watch(self._inotify_fd,
+                                                self._wd_per_dir[d])
+                    del self._wd_per_dir[d]
+            for d in self.dirs:
+                if not self._wd_per_dir.has_key(d):
+                    wd = self._libc.inotify_add_watch(self._inotify_fd, d,
+                                                      _WATCH_MASK)
+                    if wd >= 0:
+                        self._wd_per_dir[d] = wd
+        else:
+            #only the new dirs get a fresh baseline
+            self._signatures = dict([
+                (filename, signature)
+                for filename, signature in self._signatures.items()
+                if os.path.dirname(filename) in self.dirs])
+            self._signatures.update(self._currentSignatures(new_dirs))
+
+    def waitForChange(self, timeout):
+        """
+        @description
+          Waits until a relevant file changes (and the burst of changes
+          has settled down), or until 'timeout' seconds have passed.
+
+        @arguments
+          timeout -- float -- max seconds to wait
+
+        @return
+          changed -- bool -- True if there was a change
+        """
+        if self.usesInotify():
+            wait, drain = self._waitInotify, self._waitInotify
+        else:
+            wait, drain = self._waitPoll, self._waitPoll
+        if not wait(timeout):
+            return False
+
+        #debounce
+        max_end_time = time.time() + 10.0 * self.debounce_time
+        while time.time() < max_end_time:
+            if not drain(self.debounce_time):
+                break
+        return True
+
+    def close(self):
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+            self._wd_per_dir = {}
+
+    def _waitInotify(self, timeout):
+        """Returns True as soon as a relevant inotify event comes in, or
+        False after 'timeout' seconds"""
+        end_time = time.time() + timeout
+        while True:
+            remaining = max(0.0, end_time - time.time())
+            ready, _, _ = select.select([self._inotify_fd], [], [], remaining)
+            if not ready:
+                return False
+            data = os.read(self._inotify_fd, 65536)
+            offset = 0
+            found = False
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, cookie, name_len = _EVENT_HEADER.unpack_from(data,
+                                                                      offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + name_len].rstrip('\0')
+                offset += name_len
+                if name and self.is_relevant(name):
+                    found = True
+            if found:
+                return True
+
+    def _waitPoll(self, timeout):
+        """Returns True as soon as a poll sees a relevant file change,
+        or False after 'timeout' seconds"""
+        end_time = time.time() + timeout
+        while True:
+            signatures = self._currentSignatures(self.dirs)
+            if signatures != self._signatures:
+                self._signatures = signatures
+                return True
+            remaining = end_time - time.time()
+            if remaining <= 0.0:
+                return False
+            time.sleep(min(self.poll_interval, remaining))
+
+    def _currentSignatures(self, dirs):
+        """Returns dict of filename : (mtime, size) of the relevant files
+        in 'dirs'"""
+        signatures = {}
+        for d in dirs:
+            try:
+                names = os.listdir(d)
+            except OSError:
+                continue
+            for name in names:
+                if not self.is_relevant(name): continue
+                filename = os.path.join(d, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                signatures[filename] = (stat.st_mtime, stat.st_size)
+        return signatures
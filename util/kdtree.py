@@ -0,0 +1,136 @@
+"""
+A k-d tree over a fixed set of points, for radius searches.
+
+Pure python + numpy: the tree gets built once, and each search only
+visits the leaves whose bounding box is within the radius, so its cost
+grows with log(# points) plus the number of points found.
+"""
+
+import numpy
+
+class KDTree:
+    """
+    @description
+      Holds points, and finds the ones within a given distance of a
+      query point.
+
+    @attributes
+      X -- 2d array [var #][point #] -- the points
+      leaf_size -- int -- max # points per leaf
+      _perm -- 1d array of int -- point indices, ordered so that each
+        node's points are a contiguous slice
+      _lo, _hi -- list of 1d array [var #] -- per node, the bounding box
+        of its points
+      _start, _end -- list of int -- per node, its slice of _perm
+      _left, _right -- list of int -- per node, its children (-1 for a leaf)
+    """
+
+    def __init__(self, X, leaf_size=16):
+        """
+        @arguments
+          X, leaf_size -- see class description
+
+        @return
+          KDTree object
+        """
+        assert len(X.shape) == 2, "X should be a 2d array"
+        assert leaf_size >= 1
+        self.X = numpy.asarray(X, dtype=float)
+        self.leaf_size = leaf_size
+        self._perm = numpy.arange(self.X.shape[1])
+        self._lo, self._hi = [], []
+        self._start, self._end = [], []
+        self._left, self._right = [], []
+        if self.X.shape[1] > 0:
+            self._build(0, self.X.shape[1])
+
+    def __len__(self):
+        return self.X.shape[1]
+
+    def _build(self, start, end):
+        """Builds the node for _perm[start:end]; returns its index"""
+        node = len(self._start)
+        points = self.X[:, self._perm[start:end]]
+        self._lo.append(numpy.min(points, 1))
+        self._hi.append(numpy.max(points, 1))
+        self._start.append(start)
+        self._end.append(end)
+        self._left.append(-1)
+        self._right.append(-1)
+
+        widths = self._hi[node] - self._lo[node]
+        if end - start <= self.leaf_size or widths.max() <= 0.0:
+            return node
+
+        #split at the median of the widest var
+        var_i = int(numpy.argmax(widths))
+        mid = (end - start) / 2
+        order = numpy.argsort(points[var_i, :], kind='mergesort')
+        self._perm[start:end] = self._perm[start:end][order]
+        self._left[node] = self._build(start, start + mid)
+        self._right[node] = self._build(start + mid, end)
+        return node
+
+    def candidates(self, x, r):
+        """
+        @description
+          Returns the indices of the points in every leaf whose bounding
+          box is within distance 'r' of 'x'.  That is a superset of the
+          points within 'r' of 'x' (see query()).
+
+        @arguments
+          x -- 1d array [var #] -- query point
+          r -- float -- radius
+
+        @return
+          I -- 1d array of int -- sorted point indices
+        """
+        if len(self) == 0:
+            return numpy.zeros(0, dtype=int)
+        x = numpy.asarray(x, dtype=float)
+        #a little slack, so that rounding never prunes a box at distance r
+        r2 = (r * (1.0 + 1e-9)) ** 2
+        slices = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            below = self._lo[node] - x
+            above = x - self._hi[node]
+            gaps = numpy.maximum(numpy.maximum(below, above), 0.0)
+            if numpy.dot(gaps, gaps) > r2:
+                continue
+            if self._left[node] == -1:
+                slices.append(self._perm[self._start[node]:self._end[node]])
+            else:
+                stack.append(self._right[node])
+                stack.append(self._left[node])
+        if not slices:
+            return numpy.zeros(0, dtype=int)
+        return numpy.sort(numpy.concatenate(slices))
+
+    def query(self, x, r):
+        """
+        @description
+          Returns the points within distance 'r' of 'x'.
+
+        @arguments
+          x -- 1d array [var #] -- query point
+          r -- float -- radius
+
+        @return
+          I -- 1d array of int -- sorted indices of the points
+          distances -- 1d array of float -- their distances to 'x'
+        """
+        I = self.candidates(x, r)
+        distances = self.distances(x, I)
+        keep = distances <= r
+        return I[keep], distances[keep]
+
+    def distances(self, x, I):
+        """Returns 1d array -- the euclidian distance from 'x' to each of
+        the points with indices 'I'.  Each value is identical to what
+        mathutil.distance() gives."""
+        sq_dists = numpy.zeros(len(I))
+        for var_i in range(self.X.shape[0]):
+            sq_dists += numpy.power(x[var_i] - self.X[var_i, I], 2.0)
+        return numpy.sqrt(sq_dists)
@@ -0,0 +1,84 @@
+"""
+A bounded least-recently-used cache, which counts its hits and misses.
+"""
+
+from collections import OrderedDict
+
+class LruCache:
+    """
+    @description
+      Maps keys to values, holding at most 'max_size' entries.  When
+      full, adding an entry evicts the one that was used longest ago.
+
+    @attributes
+      max_size -- int -- max # entries
+      num_hits -- int -- # calls to get() that found their key
+      num_misses -- int -- # calls to get() that did not
+      _entries -- OrderedDict of key : value -- least recently used first
+    """
+
+    def __init__(self, max_size):
+        """
+        @arguments
+          max_size -- int -- see class description.  0 means cache nothing.
+
+        @return
+          LruCache object
+        """
+        assert max_size >= 0
+        self.max_size = max_size
+        self.num_hits = 0
+        self.num_misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """Does not count as a use of 'key', nor as a hit / miss"""
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Returns the value for 'key' (and marks it as most recently
+        used), or 'default' if there is none"""
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self.num_misses += 1
+            return default
+        self._entries[key] = value
+        self.num_hits += 1
+        return value
+
+    def put(self, key, value):
+        """Sets the value for 'key', evicting the least recently used
+        entry if needed"""
+        if self.max_size == 0:
+            return
+        if key in self._entries:
+            del self._entries[key]
+        elif len(self._entries) >= self.max_size:
+            self._entries.popitem(last=False)
+        self._entries[key] = value
+
+    def clear(self):
+        """Removes all entries, and resets the counters"""
+        self._entries.clear()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def hitRate(self):
+        """Returns float in [0,1] -- fraction of get() calls that hit
+        (0.0 if there have been none)"""
+        num_gets = self.num_hits + self.num_misses
+        if num_gets == 0:
+            return 0.0
+        return self.num_hits / float(num_gets)
+
+    def __str__(self):
+        s = "LruCache={"
+        s += ' size=%d/%d' % (len(self), self.max_size)
+        s += ' hits=%d' % self.num_hits
+        s += ' misses=%d' % self.num_misses
+        s += " /LruCache}"
+        return s
@@ -143,7 +143,34 @@ def niceValuesStr( d ):
             s += ','
     s += '}'
     return s
-    
+
+def niceValuesKey( d ):
+    """
+    @description
+      Like niceValuesStr(), but returns a hashable tuple rather than a string,
+      so that it can be used as a key in a set or dict.  Each value is
+      quantized with the same '%g' rounding as niceValuesStr(), and
+      entries are ordered by key (so two dicts with the same contents
+      always give the same tuple, regardless of their internal ordering).
+
+    @arguments
+      d -- dict of key : number_value
+
+    @return
+      values_key -- tuple of (key, quantized_value_str)
+
+    @exceptions
+      If number_value is a BAD_METRIC_VALUE, it will use str(BAD_METRIC_VALUE)
+      rather than applying %g.
+    """
+    values_key = []
+    for key in sorted(d.keys()):
+        value = d[key]
+        if value == BAD_METRIC_VALUE:
+            values_key.append((key, str(BAD_METRIC_VALUE)))
+        else:
+            values_key.append((key, '%g' % value))
+    return tuple(values_key)
 
 
 def uniqueStringIndices(strings_list):
@@ -284,6 +311,27 @@ def epanechnikovQuadraticKernel(distance01, lambd):
     else:
         return 0.0
 
+def epanechnikovQuadraticKernels(distances01, lambd):
+    """
+    @description
+      Like epanechnikovQuadraticKernel(), but for a whole array of
+      distances at once.  Each output value is identical to what
+      epanechnikovQuadraticKernel() returns for that distance.
+
+    @arguments
+      distances01 -- array of float (any shape) -- expect each value
+        to be scaled in [0,1]
+      lambd -- float -- 'bandwidth'
+
+    @return
+      K -- array of float (same shape as distances01) -- kernel outputs
+    """
+    t = numpy.asarray(distances01, dtype=float) / lambd
+    #numpy.power() computes like t**2 on a float (whereas t*t may differ
+    # in the last bit)
+    return numpy.where(numpy.abs(t) <= 1.0,
+                       3.0/4.0 + (1.0 - numpy.power(t, 2.0)), 0.0)
+
 def permutations(var_bases):
     """
     @description
@@ -0,0 +1,119 @@
+import unittest
+
+import os
+import shutil
+import warnings
+
+import numpy
+
+from util.ascii import asciiTo2dArray, cachedAsciiTo2dArray, \
+     hdrValFilesToTrainingData, trainingDataToHdrValFiles
+
+class AsciiTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+        self.dir = 'test_asciidir'
+        if os.path.exists(self.dir):
+            shutil.rmtree(self.dir)
+        os.mkdir(self.dir)
+        self.filename = os.path.join(self.dir, 'data.val')
+
+    def _write(self, s):
+        f = open(self.filename, 'w')
+        f.write(s)
+        f.close()
+
+    def testAsciiTo2dArray(self):
+        if self.just1: return
+        self._write("1 2.5 -3e-2 \n4\t5.0E+3   6\n\n0.1 1e-300 -0 \n")
+        a = asciiTo2dArray(self.filename)
+        self.assertEqual(a.shape, (3, 3))
+        self.assertEqual(list(a[0]), [1.0, 2.5, float('-3e-2')])
+        self.assertEqual(list(a[1]), [4.0, 5000.0, 6.0])
+        self.assertEqual(list(a[2]), [float('0.1'), float('1e-300'), 0.0])
+
+        #no trailing newline
+        self._write("1 2\n3 4")
+        self.assertEqual(asciiTo2dArray(self.filename).tolist(),
+                         [[1.0, 2.0], [3.0, 4.0]])
+
+        #empty
+        self._write("")
+        self.assertEqual(asciiTo2dArray(self.filename).shape, (0, 0))
+
+    def testAsciiTo2dArrayBadData(self):
+        if self.just1: return
+        self._write("1 2 3\n4 5\n")
+        self.assertRaises(ValueError, asciiTo2dArray, self.filename)
+        self._write("1 2\n3 abc\n")
+        self.assertRaises(ValueError, asciiTo2dArray, self.filename)
+
+        #ragged rows, even if the total number of values fits
+        self._write("1 2 3\n4 5\n6 7 8 9\n")
+        self.assertRaises(ValueError, asciiTo2dArray, self.filename)
+
+        #only asciiTo2dArray() ignores numpy's warning about bad data
+        self.assertFalse([f for f in warnings.filters
+                          if f[1] is not None and
+                          f[1].pattern.startswith('string or file')])
+
+    def testSidecar(self):
+        if self.just1: return
+        numpy.random.seed(1)
+        X = numpy.random.rand(40, 3) * 1e3
+        self._write("".join(["%.17g %.17g %.17g\n" % tuple(row) for row in X]))
+        sidecar = self.filename + '.cache'
+
+        #first load parses, and writes the sidecar
+        a = cachedAsciiTo2dArray(self.filename)
+        self.assertFalse(isinstance(a, numpy.memmap))
+        self.assertTrue(os.path.exists(sidecar))
+        self.assertEqual(a.tolist(), X.tolist())
+
+        #next load comes from the sidecar
+        b = cachedAsciiTo2dArray(self.filename)
+        self.assertTrue(isinstance(b, numpy.memmap))
+        self.assertEqual(b.tolist(), X.tolist())
+
+        #a changed file makes the sidecar stale
+        self._write("1 2\n3 4\n")
+        c = cachedAsciiTo2dArray(self.filename)
+        self.assertFalse(isinstance(c, numpy.memmap))
+        self.assertEqual(c.tolist(), [[1.0, 2.0], [3.0, 4.0]])
+        self.assertEqual(cachedAsciiTo2dArray(self.filename).tolist(),
+                         [[1.0, 2.0], [3.0, 4.0]])
+
+        #same size, other mtime: stale too
+        st = os.stat(self.filename)
+        os.utime(self.filename, (st.st_atime, st.st_mtime + 10.0))
+        self.assertFalse(isinstance(cachedAsciiTo2dArray(self.filename),
+                                    numpy.memmap))
+
+        #a truncated sidecar gets ignored
+        f = open(sidecar, 'r+b')
+        f.truncate(70)
+        f.close()
+        self.assertEqual(cachedAsciiTo2dArray(self.filename).tolist(),
+                         [[1.0, 2.0], [3.0, 4.0]])
+
+    def testHdrValFiles(self):
+        if self.just1: return
+        Xy = numpy.array([[1.0, 2.0, 3.0], [0.5, 0.25, 0.125],
+                          [10.0, 20.0, 30.0]])
+        filebase = os.path.join(self.dir, 'mos')
+        trainingDataToHdrValFiles(filebase, ['a', 'W', 'b'], Xy)
+        for i in range(2): #2nd time reads the sidecar
+            (Xy2, X, y, all_varnames, input_varnames) = \
+                  hdrValFilesToTrainingData(filebase, 'W')
+            self.assertEqual(Xy2.tolist(), Xy.tolist())
+            self.assertEqual(X.tolist(), [Xy[0].tolist(), Xy[2].tolist()])
+            self.assertEqual(y.tolist(), Xy[1].tolist())
+            self.assertEqual(all_varnames, ['a', 'W', 'b'])
+            self.assertEqual(input_varnames, ['a', 'b'])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+
+import os
+import shutil
+import threading
+import time
+
+from util.filewatch import FileWatcher
+
+class FilewatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+        self.dir = 'test_watchdir'
+        if os.path.exists(self.dir):
+            shutil.rmtree(self.dir)
+        os.mkdir(self.dir)
+
+    def _touch(self, filename, s='x'):
+        f = open(os.path.join(self.dir, filename), 'a')
+        f.write(s)
+        f.close()
+
+    def _testWatcher(self, use_inotify):
+        watcher = FileWatcher(lambda name: name.endswith('.db'), 0.05, 0.1,
+                              use_inotify)
+        watcher.setDirs([self.dir, 'test_nonexistent_dir'])
+        self.assertEqual(watcher.dirs, [os.path.abspath(self.dir)])
+
+        #nothing changed, so it times out
+        start = time.time()
+        self.assertFalse(watcher.waitForChange(0.2))
+        self.assertTrue(time.time() - start >= 0.2)
+
+        #irrelevant files do not count
+        self._touch('waveforms.txt')
+        self.assertFalse(watcher.waitForChange(0.2))
+
+        #a change (made while waiting) gets noticed well before the timeout
+        timer = threading.Timer(0.1, self._touch, ['run.db'])
+        timer.start()
+        start = time.time()
+        self.assertTrue(watcher.waitForChange(10.0))
+        self.assertTrue(time.time() - start < 5.0)
+        timer.join()
+
+        #a burst of changes counts as one change
+        for i in range(5):
+            self._touch('run.db')
+        self.assertTrue(watcher.waitForChange(1.0))
+        self.assertFalse(watcher.waitForChange(0.2))
+        watcher.close()
+
+    def _testSetDirsKeepsChanges(self, use_inotify):
+        watcher = FileWatcher(lambda name: name.endswith('.db'), 0.05, 0.1,
+                              use_inotify)
+        watcher.setDirs([self.dir])
+
+        #a change between waits still counts after setting the same dirs
+        self._touch('run.db')
+        watcher.setDirs([self.dir])
+        self.assertTrue(watcher.waitForChange(1.0))
+        self.assertFalse(watcher.waitForChange(0.2))
+
+        #but the files that a newly added dir already had do not count
+        other_dir = os.path.join(self.dir, 'other')
+        os.mkdir(other_dir)
+        self._touch(os.path.join('other', 'run.db'))
+        watcher.setDirs([self.dir, other_dir])
+        self.assertFalse(watcher.waitForChange(0.2))
+        watcher.close()
+
+    def testPolling(self):
+        if self.just1: return
+        self._testWatcher(False)
+        self._testSetDirsKeepsChanges(False)
+
+    def testInotify(self):
+        if self.just1: return
+        watcher = FileWatcher(lambda name: True, 0.05, 0.1)
+        has_inotify = watcher.usesInotify()
+        watcher.close()
+        if has_inotify:
+            self._testWatcher(True)
+            self._testSetDirsKeepsChanges(True)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+if __name__ == '__main__':
+
+    import logging
+    logging.basicConfig()
+    logging.getLogger('filewatch').setLevel(logging.DEBUG)
+
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+import numpy
+
+from util.kdtree import KDTree
+from util import mathutil
+
+class KdtreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+
+    def testQuery(self):
+        if self.just1: return
+        numpy.random.seed(0)
+        X = numpy.random.rand(3, 500)
+        X[:, 100:110] = 0.5 #some duplicates
+        tree = KDTree(X, leaf_size=8)
+        self.assertEqual(len(tree), 500)
+
+        #same points as a brute force search, with the same distances
+        for x in [numpy.array([0.5, 0.5, 0.5]), numpy.random.rand(3),
+                  numpy.array([2.0, -1.0, 0.5])]:
+            for r in [0.0, 0.05, 0.2, 5.0]:
+                distances = [mathutil.distance(x, X[:, j])
+                             for j in range(X.shape[1])]
+                expected_I = [j for j, d in enumerate(distances) if d <= r]
+                I, found_distances = tree.query(x, r)
+                self.assertEqual(list(I), expected_I)
+                self.assertEqual(list(found_distances),
+                                 [distances[j] for j in expected_I])
+                self.assertTrue(set(expected_I).issubset(
+                    set(tree.candidates(x, r))))
+
+        #a small radius only looks at a few leaves
+        self.assertTrue(len(tree.candidates(numpy.random.rand(3), 0.01)) < 50)
+
+    def testEmptyAndTiny(self):
+        if self.just1: return
+        tree = KDTree(numpy.zeros((2, 0)))
+        self.assertEqual(list(tree.query(numpy.zeros(2), 1.0)[0]), [])
+
+        tree = KDTree(numpy.array([[1.0, 1.0, 1.0]]))
+        self.assertEqual(list(tree.query(numpy.array([1.5]), 0.5)[0]),
+                         [0, 1, 2])
+        self.assertEqual(list(tree.query(numpy.array([1.5]), 0.4)[0]), [])
+
+    def tearDown(self):
+        pass
+
+if __name__ == '__main__':
+    unittest.main()
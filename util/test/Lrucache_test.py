@@ -0,0 +1,55 @@
+import unittest
+
+from util.lrucache import LruCache
+
+class LrucacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.just1 = False #to make True is a HACK
+
+    def testEviction(self):
+        if self.just1: return
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1) #now 'b' is least recently used
+        cache.put('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.get('a'), 1)
+
+        #updating an entry does not evict anything
+        cache.put('c', 30)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('c'), 30)
+
+    def testCounters(self):
+        if self.just1: return
+        cache = LruCache(10)
+        self.assertEqual(cache.hitRate(), 0.0)
+        self.assertEqual(cache.get('a', 'default'), 'default')
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('a')
+        self.assertEqual((cache.num_hits, cache.num_misses), (2, 1))
+        self.assertAlmostEqual(cache.hitRate(), 2.0 / 3.0)
+        self.assertTrue(len(str(cache)) > 0)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.num_hits, cache.num_misses), (0, 0))
+
+    def testZeroSize(self):
+        if self.just1: return
+        cache = LruCache(0)
+        cache.put('a', 1)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('a'), None)
+
+    def tearDown(self):
+        pass
+
+if __name__ == '__main__':
+    unittest.main()
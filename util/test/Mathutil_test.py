@@ -2,6 +2,8 @@ import types
 import random
 import math
 
+import numpy
+
 import unittest
         
 from util.mathutil import *
@@ -50,6 +52,26 @@ class MathutilTest(unittest.TestCase):
         #all values in dict must be a number
         self.assertRaises(TypeError, niceValuesStr, {'gain':3.19, 'power':'2.0'})
 
+    def testNiceValuesKey(self):
+        if self.just1: return
+
+        d = {'gain':3.19999999999999999999, 'power':2.0}
+        self.assertEqual(niceValuesKey(d), (('gain','3.2'),('power','2')))
+
+        #same rounding as niceValuesStr
+        d2 = {'gain':3.2000000001, 'power':2.0}
+        self.assertEqual(niceValuesKey(d), niceValuesKey(d2))
+        self.assertEqual(niceValuesStr(d), niceValuesStr(d2))
+
+        #hashable
+        self.assertTrue(niceValuesKey(d2) in set([niceValuesKey(d)]))
+        
+        self.assertEqual(niceValuesKey({'gain':BAD_METRIC_VALUE}),
+                         (('gain','BAD_METRIC_VALUE'),))
+        
+        #all values in dict must be a number
+        self.assertRaises(TypeError, niceValuesKey, {'gain':3.19, 'power':'2.0'})
+
     def testAllEntriesAreUnique(self):
         if self.just1: return
         self.assertEqual( allEntriesAreUnique( [] ), True )
@@ -109,6 +131,17 @@ class MathutilTest(unittest.TestCase):
 
         self.assertFalse( allEntriesAreNumbers( [1, 2, 'blah']  ) )
 
+    def testEpanechnikovQuadraticKernels(self):
+        if self.just1: return
+        distances = [0.0, 0.01, 0.049, 0.05, 0.0500001, 0.3, -0.02]
+        K = epanechnikovQuadraticKernels(numpy.array([distances]), 0.05)
+        self.assertEqual(K.shape, (1, len(distances)))
+        self.assertEqual(list(K[0]),
+                         [epanechnikovQuadraticKernel(d, 0.05)
+                          for d in distances])
+        self.assertEqual(K[0,0], 1.75)
+        self.assertEqual(K[0,4], 0.0)
+
     def testPermutations(self):
         if self.just1: return
 
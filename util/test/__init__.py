@@ -1,11 +1,19 @@
 import unittest, os
 from tests import doctest, importSuite
 
+from Ascii_test import AsciiTest
 from Constants_test import ConstantsTest
+from Filewatch_test import FilewatchTest
+from Kdtree_test import KdtreeTest
+from Lrucache_test import LrucacheTest
 from Mathutil_test import MathutilTest
 
 TestClasses = [
+    AsciiTest,
     ConstantsTest,
+    FilewatchTest,
+    KdtreeTest,
+    LrucacheTest,
     MathutilTest,
     ]
 